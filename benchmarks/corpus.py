@@ -0,0 +1,104 @@
+"""Synthetic GURPS-like corpus for benchmarks.
+
+Generates markdown rulebooks with the shape of the real sources: chapters
+(##), rule sections (###), point costs, modifiers, tables and page
+cross-references. Output is fully determined by the seed.
+"""
+
+from __future__ import annotations
+
+import random
+from pathlib import Path
+
+ADJECTIVES = [
+    "Rapid", "Deceptive", "Extra", "Combat", "Mystic", "Enhanced", "Iron", "Silent",
+    "Greater", "Lesser", "Fast", "Heroic", "Arcane", "Shadow", "Perfect", "Weapon",
+]
+NOUNS = [
+    "Strike", "Attack", "Parry", "Reflexes", "Magery", "Defense", "Will", "Step",
+    "Master", "Balance", "Focus", "Talent", "Vision", "Recovery", "Luck", "Grip",
+]
+KINDS = ["Advantage", "Disadvantage", "Skill", "Technique", "Maneuver", "Spell"]
+ATTRIBUTES = ["ST", "DX", "IQ", "HT", "Will", "Per"]
+BOOKS = ["Basic Set", "Martial Arts", "Magic", "Powers", "Low-Tech", "Thaumatology"]
+
+SENTENCES = [
+    "{name} lets the character {verb} once per turn, at a penalty of -{pen} to the roll.",
+    "Roll against {attr} to use {name}; a critical failure costs {fp} FP.",
+    "When combined with {other}, apply the worse of the two modifiers.",
+    "The GM may allow {name} in place of {other} for cinematic campaigns.",
+    "Each level of {name} adds +{bonus} to {attr}-based rolls, to a maximum of +{max}.",
+    "{name} does not work against foes who are unaware of the attack.",
+    "For the full rules on {other}, see {book}, p. {page}.",
+    "Costs {cost} points per level; prerequisites: {attr} {req}+ and {other}.",
+    "Targets wearing heavy armor resist {name} at +{bonus}.",
+    "If the roll fails by {pen} or more, the character is stunned until the next turn.",
+]
+VERBS = ["attack twice", "parry again", "retreat", "feint", "dodge", "cast without ritual"]
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+
+
+def _paragraph(rng: random.Random, name: str, names: list[str]) -> str:
+    sentences = []
+    for _ in range(rng.randint(3, 6)):
+        sentences.append(rng.choice(SENTENCES).format(
+            name=name,
+            other=rng.choice(names),
+            verb=rng.choice(VERBS),
+            attr=rng.choice(ATTRIBUTES),
+            pen=rng.randint(1, 6),
+            fp=rng.randint(1, 3),
+            bonus=rng.randint(1, 4),
+            max=rng.randint(4, 8),
+            book=rng.choice(BOOKS),
+            page=rng.randint(10, 300),
+            cost=rng.choice([2, 5, 10, 15, 25]),
+            req=rng.randint(11, 14),
+        ))
+    return " ".join(sentences)
+
+
+def _table(rng: random.Random, name: str) -> str:
+    rows = ["| Level | Modifier | Cost |", "|---|---|---|"]
+    for level in range(1, rng.randint(3, 6)):
+        rows.append(f"| {level} | +{level * rng.randint(1, 2)} | {level * 5} |")
+    return f"**{name} Table**\n\n" + "\n".join(rows)
+
+
+def generate_book(title: str, rng: random.Random, chapters: int, sections: int) -> tuple[str, list[str]]:
+    """Return (markdown, rule names defined in the book)."""
+    names = list(dict.fromkeys(_name(rng) for _ in range(chapters * sections * 2)))
+    lines = [f"# {title}", ""]
+    defined: list[str] = []
+    for c in range(chapters):
+        lines += [f"## Chapter {c + 1}: {rng.choice(KINDS)}s", ""]
+        for _ in range(sections):
+            name = rng.choice(names)
+            defined.append(name)
+            lines += [f"### {name}", "", f"*{rng.choice(KINDS)}; {rng.choice([5, 10, 15, 20])} points*", ""]
+            for _ in range(rng.randint(2, 5)):
+                lines += [_paragraph(rng, name, names), ""]
+            if rng.random() < 0.3:
+                lines += [_table(rng, name), ""]
+    return "\n".join(lines), list(dict.fromkeys(defined))
+
+
+def write_corpus(
+    directory: Path, books: int = 3, chapters: int = 8, sections: int = 12, seed: int = 42
+) -> tuple[list[Path], list[str]]:
+    """Write books to directory. Returns (paths, rule names usable as questions)."""
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths: list[Path] = []
+    names: list[str] = []
+    for i in range(books):
+        title = BOOKS[i % len(BOOKS)] + (f" {i // len(BOOKS) + 1}" if i >= len(BOOKS) else "")
+        markdown, defined = generate_book(title, rng, chapters, sections)
+        path = directory / f"{title.replace(' ', '_')}.md"
+        path.write_text(markdown, encoding="utf-8")
+        paths.append(path)
+        names.extend(defined)
+    return paths, list(dict.fromkeys(names))
@@ -0,0 +1,231 @@
+"""Offline benchmark: ingest throughput, per-stage time, /api/ask latency and peak RSS.
+
+Runs against a synthetic GURPS-like corpus with the fake model provider, so no
+API calls are made and results are comparable between commits. Every data
+path points into a temporary directory; the real data/ is never touched.
+
+Usage:
+    uv run python benchmarks/run.py [--books N] [--questions N] [--latency-ms MS]
+                                    [--output FILE] [--compare BASELINE.json]
+
+Results go to benchmarks/results/<commit>.json by default.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from corpus import write_corpus  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("benchmark")
+
+STRATEGIES = ["multi-hop", "multi-question"]
+
+
+def _configure_environment(workdir: Path, latency_ms: float) -> None:
+    """Point settings at workdir and the fake provider. Must run before importing rpg_rules_ai."""
+    os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["FAKE_LATENCY_MS"] = str(latency_ms)
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["LANGSMITH_API_KEY"] = ""
+    os.environ["CHROMA_PERSIST_DIR"] = str(workdir / "chroma")
+    os.environ["DOCSTORE_DIR"] = str(workdir / "docstore")
+    os.environ["SOURCES_DIR"] = str(workdir / "sources")
+    os.environ["ENTITY_INDEX_PATH"] = str(workdir / "entity_index.db")
+    os.environ["JOB_QUEUE_PATH"] = str(workdir / "jobs.db")
+    os.environ["INGEST_CHECKPOINT_DIR"] = str(workdir / "checkpoints")
+    os.environ["GENERATIONS_PATH"] = str(workdir / "generations.db")
+    os.environ["CONVERSATION_DB_PATH"] = str(workdir / "conversations.db")
+    os.environ["NEAR_DUPLICATE_INDEX_PATH"] = str(workdir / "near_duplicates.db")
+    os.environ["PDF_PAGE_CACHE_DIR"] = str(workdir / "pdf_pages")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def bench_ingest(paths: list[Path]) -> dict:
+    from rpg_rules_ai.pipeline import run_layered_pipeline
+
+    start = time.perf_counter()
+    result = run_layered_pipeline(paths)
+    seconds = time.perf_counter() - start
+    totals = result["stage_totals"]
+    chunks = totals.get("split", {}).get("items", 0)
+
+    failed = [r for r in result["file_results"] if r["status"] == "error"]
+    for r in failed:
+        logger.error("Ingest failed for %s: %s", r["filename"], r["error_message"])
+    return {
+        "files": len(paths),
+        "files_failed": len(failed),
+        "bytes": sum(p.stat().st_size for p in paths),
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 1) if seconds else 0.0,
+        "stage_seconds": {name: stage["seconds"] for name, stage in totals.items()},
+        "stages": totals,
+    }
+
+
+async def bench_ask(questions: list[str]) -> dict:
+    import httpx
+
+    from rpg_rules_ai import services
+    from rpg_rules_ai.api import app
+    from rpg_rules_ai.config import settings
+
+    results: dict[str, dict] = {}
+    # ASGITransport does not run the app lifespan, so close the graph's
+    # checkpointer connection here or its worker thread keeps the process alive
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for strategy in STRATEGIES:
+                settings.retrieval_strategy = strategy
+                # Warm-up request (graph compile, tokenizer load) is not measured
+                (await client.post("/api/ask", json={"question": questions[0]}, timeout=None)).raise_for_status()
+                latencies: list[float] = []
+                citations = 0
+                for question in questions:
+                    start = time.perf_counter()
+                    response = await client.post("/api/ask", json={"question": question}, timeout=None)
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                    citations += len(response.json().get("citations", []))
+                results[strategy] = {
+                    "requests": len(latencies),
+                    "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+                    "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+                    "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+                    "answers_with_citations": round(citations / len(latencies), 2),
+                }
+                logger.info("%s: p50 %.1f ms, p95 %.1f ms", strategy,
+                            results[strategy]["p50_ms"], results[strategy]["p95_ms"])
+    finally:
+        await services.close_graph()
+    return results
+
+
+def compare(current: dict, baseline: dict) -> list[str]:
+    """Human-readable relative changes for the headline numbers."""
+    lines = []
+
+    def delta(label: str, new: float, old: float, higher_is_better: bool = False) -> None:
+        if not old:
+            return
+        change = (new - old) / old * 100
+        worse = change < 0 if higher_is_better else change > 0
+        flag = " (regression)" if worse and abs(change) >= 10 else ""
+        lines.append(f"{label}: {old} -> {new} ({change:+.1f}%){flag}")
+
+    delta("ingest chunks/s", current["ingest"]["chunks_per_second"],
+          baseline["ingest"]["chunks_per_second"], higher_is_better=True)
+    for strategy, stats in current["ask"].items():
+        old = baseline.get("ask", {}).get(strategy)
+        if old:
+            delta(f"{strategy} p50 ms", stats["p50_ms"], old["p50_ms"])
+            delta(f"{strategy} p95 ms", stats["p95_ms"], old["p95_ms"])
+    delta("peak RSS MB", current["peak_rss_mb"], baseline["peak_rss_mb"])
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline ingest/query benchmark with fake models")
+    parser.add_argument("--books", type=int, default=3)
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--sections", type=int, default=12)
+    parser.add_argument("--questions", type=int, default=20, help="Questions per strategy")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Injected delay per fake model call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Default: benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", type=Path, help="Baseline results JSON to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="rpg-bench-") as tmp:
+        workdir = Path(tmp)
+        _configure_environment(workdir, args.latency_ms)
+        paths, names = write_corpus(
+            workdir / "corpus", books=args.books, chapters=args.chapters,
+            sections=args.sections, seed=args.seed,
+        )
+
+        logger.info("Ingesting %d synthetic books", len(paths))
+        ingest = bench_ingest(paths)
+        rss_after_ingest = _peak_rss_mb()
+        if ingest["files_failed"]:
+            raise SystemExit("Ingest failed; query latencies would be meaningless")
+        logger.info("Ingest: %d chunks in %.2fs (%.1f chunks/s)",
+                    ingest["chunks"], ingest["seconds"], ingest["chunks_per_second"])
+
+        questions = [f"How does {name} work?" for name in names[: args.questions]]
+        ask = asyncio.run(bench_ask(questions))
+
+    commit = _commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "books": args.books,
+            "chapters": args.chapters,
+            "sections": args.sections,
+            "questions": len(questions),
+            "latency_ms": args.latency_ms,
+            "seed": args.seed,
+        },
+        "ingest": ingest,
+        "ask": ask,
+        "peak_rss_after_ingest_mb": rss_after_ingest,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+    output = args.output or Path(__file__).parent / "results" / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    logger.info("Wrote %s", output)
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        for line in compare(report, baseline):
+            logger.info("%s", line)
+
+
+if __name__ == "__main__":
+    main()
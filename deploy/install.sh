@@ -68,6 +68,8 @@ mkdir -p "$ENV_DIR"
 if [[ ! -f "$ENV_FILE" ]]; then
     echo "Creating env file from .env.example..."
     cp "${INSTALL_DIR}/.env.example" "$ENV_FILE"
+    # One uvicorn worker per core; edit WORKERS in the env file to change it
+    sed -i "s/^WORKERS=.*/WORKERS=$(nproc)/" "$ENV_FILE"
     echo ""
     echo ">>> IMPORTANT: edit ${ENV_FILE} and set OPENAI_API_KEY <<<"
     echo ""
@@ -95,7 +97,7 @@ User=${SERVICE_USER}
 Group=${SERVICE_USER}
 WorkingDirectory=${INSTALL_DIR}
 Environment=PORT=8100
-Environment=WORKERS=1
+Environment=METRICS_DIR=./data/metrics
 EnvironmentFile=${ENV_FILE}
 ExecStart=${INSTALL_DIR}/.venv/bin/uvicorn rpg_rules_ai.api:app --host 0.0.0.0 --port \${PORT} --workers \${WORKERS}
 Restart=on-failure
@@ -1,15 +1,29 @@
 import re
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import APIRouter, FastAPI, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
 from rpg_rules_ai import services
-from rpg_rules_ai.config import settings
 
-app = FastAPI(title="RPG Rules AI")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start ingestion workers up front so jobs interrupted by a restart resume
+    services.start_job_workers()
+    services.start_metrics_snapshots()
+    yield
+    services.stop_metrics_snapshots()
+    services.stop_job_workers()
+    services.stop_io_executor()
+    await services.close_graph()
+
+
+app = FastAPI(title="RPG Rules AI", lifespan=lifespan)
 
 _pkg_dir = Path(__file__).parent
 templates = Jinja2Templates(directory=str(_pkg_dir / "templates"))
@@ -33,17 +47,23 @@ def health_root():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(services.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 # --- Ask ---
 
 
 class AskRequest(BaseModel):
     question: str
     thread_id: str | None = None
+    debug: bool = False
 
 
 @api_router.post("/ask")
 async def ask(req: AskRequest):
-    return await services.ask_question(req.question, thread_id=req.thread_id)
+    return await services.ask_question(req.question, thread_id=req.thread_id, debug=req.debug)
 
 
 # --- Documents ---
@@ -54,40 +74,30 @@ class IngestRequest(BaseModel):
     replace: bool = False
 
 
-MAX_UPLOAD_SIZE = 20 * 1024 * 1024  # 20MB
+MAX_UPLOAD_SIZE = services.MAX_UPLOAD_SIZE
 
 
 @api_router.get("/documents")
-def list_documents():
-    return services.list_books()
+async def list_documents():
+    return await services.alist_books()
 
 
 @api_router.post("/documents/upload", status_code=202)
 async def upload_documents(files: list[UploadFile], replace: bool = False):
-    saved_paths: list[Path] = []
-    sources_dir = Path(settings.sources_dir)
-
-    for f in files:
-        if not f.filename or not f.filename.endswith(".md"):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Only .md files are accepted, got: {f.filename}",
-            )
-        content = await f.read()
-        if len(content) > MAX_UPLOAD_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"File too large: {f.filename} ({len(content)} bytes, max {MAX_UPLOAD_SIZE})",
-            )
-        dest = sources_dir / f.filename
-        dest.write_bytes(content)
-        saved_paths.append(dest)
+    try:
+        saved_paths, skipped = await services.save_uploads(files, replace=replace)
+    except services.UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
+    if not saved_paths:
+        return {"job_id": None, "skipped": skipped}
     try:
         job_id = services.create_ingestion_job(saved_paths, replace=replace)
     except (ValueError, FileNotFoundError) as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    return {"job_id": job_id}
+    return {"job_id": job_id, "skipped": skipped}
 
 
 @api_router.post("/documents/ingest", status_code=202)
@@ -108,9 +118,19 @@ def get_job_progress(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
 
 
+@api_router.delete("/documents/jobs/{job_id}")
+def cancel_job(job_id: str):
+    try:
+        return services.cancel_ingestion_job(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
 @api_router.delete("/documents/{book}")
-def delete_document(book: str):
-    services.delete_book(book)
+async def delete_document(book: str):
+    await services.adelete_book(book)
     return {"deleted": book}
 
 
@@ -118,22 +138,10 @@ def delete_document(book: str):
 
 
 @api_router.get("/entity-graph")
-def entity_graph(chunks: str = ""):
+async def entity_graph(chunks: str = ""):
     """Return entity graph for given chunk doc_ids (comma-separated)."""
-    if not chunks:
-        return {"nodes": [], "edges": []}
     chunk_ids = [c.strip() for c in chunks.split(",") if c.strip()]
-    if not chunk_ids:
-        return {"nodes": [], "edges": []}
-    try:
-        from rpg_rules_ai.entity_index import EntityIndex
-        idx = EntityIndex()
-        try:
-            return idx.build_graph_for_chunks(chunk_ids)
-        finally:
-            idx.close()
-    except Exception:
-        return {"nodes": [], "edges": []}
+    return await services.aget_entity_graph(chunk_ids)
 
 
 # --- Prompts ---
@@ -0,0 +1,239 @@
+"""Per-book ingestion checkpoints for resuming after a crash.
+
+A checkpoint is written once a book is split and updated after
+contextualization, entity extraction and every stored embedding batch, so a
+restarted ingest skips the LLM and embedding work already paid for. The
+checkpoint keeps the staging generation the chunks are written under (see
+generations.py), so retrieval does not see them until the book is activated;
+it is removed once that happens.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from collections.abc import Sequence
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from rpg_rules_ai.chunking import ChildChunks
+from rpg_rules_ai.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STATE_FILE = "state.json"
+_CHUNKS_FILE = "chunks.json"
+
+_incomplete_cache: tuple[int, list[str]] | None = None
+
+# Bumped when parsing a source changes the sections it produces. Version 2
+# reads markdown natively, so its headers now cut sections (the unstructured
+# loader dropped them): every .md book is re-chunked and re-embedded once.
+PARSE_VERSION = 2
+
+
+def _checkpoint_root() -> Path:
+    return Path(settings.ingest_checkpoint_dir)
+
+
+def _book_dir(book: str) -> Path:
+    digest = hashlib.sha256(book.encode("utf-8")).hexdigest()[:16]
+    return _checkpoint_root() / digest
+
+
+def _write_json(path: Path, data) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path: Path, content_hash: str | None = None) -> str:
+    """Hash of the file plus the parser version and chunking settings that shape its chunks.
+
+    Pass `content_hash` (from file_sha256) to avoid reading the file again.
+    """
+    digest = hashlib.sha256((content_hash or file_sha256(path)).encode("utf-8"))
+    digest.update(json.dumps([
+        PARSE_VERSION,
+        settings.child_chunk_size,
+        settings.child_chunk_overlap,
+        settings.parent_chunk_max,
+        settings.parent_chunk_overlap,
+        settings.chunk_length_unit,
+        settings.pdf_repeated_line_threshold,
+    ]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _to_dicts(docs: list[Document]) -> list[dict]:
+    return [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]
+
+
+def _from_dicts(items: list[dict]) -> list[Document]:
+    return [Document(page_content=i["page_content"], metadata=i["metadata"]) for i in items]
+
+
+class IngestCheckpoint:
+    """Resume state for one book: its generation, chunks, child ids and completed stages."""
+
+    def __init__(
+        self,
+        book: str,
+        fingerprint: str,
+        generation: str,
+        parents: list[Document],
+        children: Sequence[Document],
+        child_ids: list[str],
+        stages: list[str] | None = None,
+        children_stored: int = 0,
+    ):
+        self.book = book
+        self.fingerprint = fingerprint
+        self.generation = generation
+        self.parents = parents
+        self.children = children
+        self.child_ids = child_ids
+        self.stages = stages or []
+        self.children_stored = children_stored
+        self.resumed = False
+
+    @property
+    def parent_map(self) -> dict[str, Document]:
+        return {p.metadata["doc_id"]: p for p in self.parents}
+
+    @classmethod
+    def create(
+        cls,
+        book: str,
+        fingerprint: str,
+        generation: str,
+        parents: list[Document],
+        children: Sequence[Document],
+        child_ids: list[str],
+    ) -> IngestCheckpoint:
+        checkpoint = cls(book, fingerprint, generation, parents, children, child_ids,
+                         stages=["split"])
+        # Build in a scratch directory and rename it into place, so the book
+        # appears in incomplete_books() only with its state already written
+        final = _book_dir(book)
+        scratch = final.with_name(f".{final.name}.new")
+        shutil.rmtree(scratch, ignore_errors=True)
+        scratch.mkdir(parents=True)
+        checkpoint._save_chunks(scratch)
+        checkpoint._save_state(scratch)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(scratch, final)
+        return checkpoint
+
+    @classmethod
+    def load(cls, book: str) -> IngestCheckpoint | None:
+        directory = _book_dir(book)
+        try:
+            state = json.loads((directory / _STATE_FILE).read_text(encoding="utf-8"))
+            chunks = json.loads((directory / _CHUNKS_FILE).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            logger.warning("Discarding unreadable checkpoint for '%s': %s", book, exc)
+            return None
+        parents = _from_dicts(chunks["parents"])
+        if "child_spans" in chunks:
+            children = ChildChunks(parents, [tuple(span) for span in chunks["child_spans"]])
+        else:
+            children = _from_dicts(chunks["children"])
+        checkpoint = cls(
+            book=state["book"],
+            fingerprint=state["fingerprint"],
+            generation=state["generation"],
+            parents=parents,
+            children=children,
+            child_ids=chunks["child_ids"],
+            stages=state["stages"],
+            children_stored=state["children_stored"],
+        )
+        checkpoint.resumed = True
+        return checkpoint
+
+    def done(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def mark(self, stage: str) -> None:
+        if stage not in self.stages:
+            self.stages.append(stage)
+        self._save_state()
+
+    def update_children(self, children: Sequence[Document], stage: str) -> None:
+        """Persist rewritten children (e.g. contextualized) and mark the stage."""
+        self.children = children
+        self._save_chunks()
+        self.mark(stage)
+
+    def mark_stored(self, children_stored: int) -> None:
+        """Record that the first `children_stored` children are in the vector store."""
+        self.children_stored = children_stored
+        self._save_state()
+
+    def clear(self) -> None:
+        shutil.rmtree(_book_dir(self.book), ignore_errors=True)
+
+    def _save_state(self, directory: Path | None = None) -> None:
+        _write_json((directory or _book_dir(self.book)) / _STATE_FILE, {
+            "book": self.book,
+            "fingerprint": self.fingerprint,
+            "generation": self.generation,
+            "stages": self.stages,
+            "children_stored": self.children_stored,
+        })
+
+    def _save_chunks(self, directory: Path | None = None) -> None:
+        chunks = {"parents": _to_dicts(self.parents), "child_ids": self.child_ids}
+        if isinstance(self.children, ChildChunks):
+            # Children not rewritten yet are stored as offsets into the parents
+            chunks["child_spans"] = self.children.spans
+        else:
+            chunks["children"] = _to_dicts(self.children)
+        _write_json((directory or _book_dir(self.book)) / _CHUNKS_FILE, chunks)
+
+
+def discard_checkpoint(book: str) -> None:
+    shutil.rmtree(_book_dir(book), ignore_errors=True)
+
+
+def discard_all_checkpoints() -> None:
+    """Drop every book's checkpoint, e.g. after the collection was reset."""
+    shutil.rmtree(_checkpoint_root(), ignore_errors=True)
+
+
+def incomplete_books() -> list[str]:
+    """Books with an ingest in progress. Cached on the checkpoint directory mtime."""
+    global _incomplete_cache
+    root = _checkpoint_root()
+    try:
+        mtime = root.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+    if _incomplete_cache is not None and _incomplete_cache[0] == mtime:
+        return list(_incomplete_cache[1])
+    books = []
+    for state_path in root.glob(f"*/{_STATE_FILE}"):
+        if state_path.parent.name.startswith("."):
+            continue
+        try:
+            books.append(json.loads(state_path.read_text(encoding="utf-8"))["book"])
+        except (OSError, ValueError, KeyError):
+            continue
+    books.sort()
+    _incomplete_cache = (mtime, books)
+    return list(books)
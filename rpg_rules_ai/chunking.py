@@ -2,7 +2,12 @@
 
 from __future__ import annotations
 
-import uuid
+import hashlib
+import json
+import re
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from typing import overload
 
 from langchain_core.documents import Document
 from langchain_text_splitters import (
@@ -13,10 +18,20 @@ from langchain_text_splitters import (
 from rpg_rules_ai.config import settings
 
 
+def chunk_length() -> Callable[[str], int]:
+    """How chunk sizes are measured: characters, or tokens with CHUNK_LENGTH_UNIT=tokens."""
+    if settings.chunk_length_unit == "tokens":
+        from rpg_rules_ai.tokens import token_length
+
+        return token_length
+    return len
+
+
 def get_child_splitter() -> RecursiveCharacterTextSplitter:
     return RecursiveCharacterTextSplitter(
         chunk_size=settings.child_chunk_size,
         chunk_overlap=settings.child_chunk_overlap,
+        length_function=chunk_length(),
         add_start_index=True,
     )
 
@@ -25,6 +40,7 @@ def get_parent_splitter() -> RecursiveCharacterTextSplitter:
     return RecursiveCharacterTextSplitter(
         chunk_size=settings.parent_chunk_max,
         chunk_overlap=settings.parent_chunk_overlap,
+        length_function=chunk_length(),
         add_start_index=True,
     )
 
@@ -44,6 +60,282 @@ def split_into_sections(md: str) -> list[Document]:
     return splitter.split_text(md)
 
 
+_SECTION_HEADERS = (("###", "h3", 3), ("##", "h2", 2))
+_SECTION_PATH = tuple(key for _, key, _ in reversed(_SECTION_HEADERS))
+
+
+def iter_sections(lines: Iterable[str]) -> Iterator[Document]:
+    """Streaming split_into_sections over an iterable of lines.
+
+    Mirrors MarkdownHeaderTextSplitter (## and ###, headers kept) line for
+    line, yielding each section once the next one starts, so only the open
+    section is held in memory.
+    """
+    open_parts: list[str] = []
+    open_metadata: dict[str, str] | None = None
+
+    def close(content: str, metadata: dict[str, str]) -> Document | None:
+        # Same merge rules as MarkdownHeaderTextSplitter.aggregate_lines_to_chunks
+        nonlocal open_parts, open_metadata
+        if open_metadata is not None:
+            if open_metadata == metadata:
+                open_parts.append(content)
+                return None
+            last_line = open_parts[-1].rsplit("\n", 1)[-1]
+            if len(open_metadata) < len(metadata) and last_line.startswith("#"):
+                open_parts.append(content)
+                open_metadata = metadata
+                return None
+        done = None
+        if open_metadata is not None:
+            done = Document(page_content="  \n".join(open_parts), metadata=open_metadata)
+        open_parts, open_metadata = [content], metadata
+        return done
+
+    current_content: list[str] = []
+    current_metadata: dict[str, str] = {}
+    header_stack: list[tuple[int, str]] = []
+    initial_metadata: dict[str, str] = {}
+    in_code_block = False
+    opening_fence = ""
+
+    for line in lines:
+        stripped = "".join(filter(str.isprintable, line.strip()))
+        if not in_code_block:
+            if stripped.startswith("```") and stripped.count("```") == 1:
+                in_code_block, opening_fence = True, "```"
+            elif stripped.startswith("~~~"):
+                in_code_block, opening_fence = True, "~~~"
+        elif stripped.startswith(opening_fence):
+            in_code_block, opening_fence = False, ""
+
+        if in_code_block:
+            current_content.append(stripped)
+            continue
+
+        for sep, name, level in _SECTION_HEADERS:
+            if stripped.startswith(sep) and (len(stripped) == len(sep) or stripped[len(sep)] == " "):
+                while header_stack and header_stack[-1][0] >= level:
+                    initial_metadata.pop(header_stack.pop()[1], None)
+                header_stack.append((level, name))
+                initial_metadata[name] = stripped[len(sep):].strip()
+                if current_content:
+                    if (done := close("\n".join(current_content), current_metadata.copy())) is not None:
+                        yield done
+                    current_content.clear()
+                current_content.append(stripped)
+                break
+        else:
+            if stripped:
+                current_content.append(stripped)
+            elif current_content:
+                if (done := close("\n".join(current_content), current_metadata.copy())) is not None:
+                    yield done
+                current_content.clear()
+
+        current_metadata = initial_metadata.copy()
+
+    if current_content:
+        if (done := close("\n".join(current_content), current_metadata)) is not None:
+            yield done
+    if open_metadata is not None:
+        yield Document(page_content="  \n".join(open_parts), metadata=open_metadata)
+
+
+# RecursiveCharacterTextSplitter's default separators, most to least preferred
+_SEPARATORS = ("\n\n", "\n", " ", "")
+_SEPARATOR_PATTERNS = tuple(re.compile(re.escape(sep)) for sep in _SEPARATORS[:-1])
+
+
+class _SpanSplitter:
+    """RecursiveCharacterTextSplitter on (start, end) offsets into one string.
+
+    Same algorithm and defaults (separators kept at the start of each piece,
+    whitespace stripped), so text[start:end] of each span is exactly the
+    chunk that splitter returns with the same `length` function. Measuring
+    in characters builds no piece or chunk string along the way.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, length: Callable[[str], int] = len):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length = length
+
+    def _measure(self, text: str, start: int, end: int) -> int:
+        return end - start if self.length is len else self.length(text[start:end])
+
+    def split(self, text: str, start: int = 0, end: int | None = None) -> list[tuple[int, int]]:
+        spans: list[tuple[int, int]] = []
+        self._split(text, start, len(text) if end is None else end, 0, spans)
+        return spans
+
+    def _split(self, text: str, start: int, end: int, level: int, out: list[tuple[int, int]]) -> None:
+        # First separator present in the span; "" (characters) always applies
+        last = len(_SEPARATORS) - 1
+        while level < last and not _SEPARATOR_PATTERNS[level].search(text, start, end):
+            level += 1
+        if level == last:
+            pieces = [(i, i + 1) for i in range(start, end)]
+        else:
+            cuts = [m.start() for m in _SEPARATOR_PATTERNS[level].finditer(text, start, end)]
+            bounds = [start, *cuts, end]
+            pieces = [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+        good: list[tuple[int, int]] = []
+        for a, b in pieces:
+            if self._measure(text, a, b) < self.chunk_size:
+                good.append((a, b))
+                continue
+            if good:
+                self._merge(text, good, out)
+                good = []
+            if level == last:
+                out.append((a, b))
+            else:
+                self._split(text, a, b, level + 1, out)
+        if good:
+            self._merge(text, good, out)
+
+    def _merge(self, text: str, pieces: list[tuple[int, int]], out: list[tuple[int, int]]) -> None:
+        """Pack consecutive pieces into chunks, carrying up to chunk_overlap into the next."""
+        current: deque[tuple[int, int, int]] = deque()
+        total = 0
+        for a, b in pieces:
+            length = self._measure(text, a, b)
+            if total + length > self.chunk_size and current:
+                self._emit(text, current[0][0], current[-1][1], out)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= current.popleft()[2]
+            current.append((a, b, length))
+            total += length
+        if current:
+            self._emit(text, current[0][0], current[-1][1], out)
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, out: list[tuple[int, int]]) -> None:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            out.append((start, end))
+
+
+class ChildChunks(Sequence[Document]):
+    """Child chunks held as offsets into their parents' text.
+
+    Each child is (parent index, start, end). Its Document, the parent's
+    metadata plus start_index, is only built when accessed, normally one
+    embedding batch at a time, so no child text is held after splitting.
+    """
+
+    def __init__(self, parents: list[Document], spans: list[tuple[int, int, int]]):
+        self.parents = parents
+        self.spans = spans
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    @overload
+    def __getitem__(self, index: int) -> Document: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Document]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._document(span) for span in self.spans[index]]
+        return self._document(self.spans[index])
+
+    def _document(self, span: tuple[int, int, int]) -> Document:
+        parent_index, start, end = span
+        parent = self.parents[parent_index]
+        return Document(
+            page_content=parent.page_content[start:end],
+            metadata={**parent.metadata, "start_index": start},
+        )
+
+
+def chunk_id(*parts: object) -> str:
+    """Stable id from the JSON-serializable parts that locate a chunk."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+def _parent_id(parent: Document, taken: dict[str, Document]) -> str:
+    """Content-derived doc_id: book, section path, offset in the section and text hash.
+
+    Reingesting the same text gives the same ids, so the docstore, entity
+    mentions and anything else keyed by doc_id carry over. Identical chunks
+    under identical headers get a numbered suffix in reading order.
+    """
+    meta = parent.metadata
+    base = chunk_id(
+        meta.get("book", ""),
+        [meta.get(key) for key in _SECTION_PATH],
+        meta.get("start_index", 0),
+        hashlib.sha256(parent.page_content.encode("utf-8")).hexdigest(),
+    )
+    parent_id, n = base, 1
+    while parent_id in taken:
+        parent_id = f"{base}-{n}"
+        n += 1
+    return parent_id
+
+
+def child_ids(children: Iterable[Document]) -> list[str]:
+    """Vector store ids for children: generation, parent doc_id and offset.
+
+    Deterministic, so rewriting a generation's children (e.g. on resume) is an
+    idempotent upsert; the generation keeps a reingest from overwriting the
+    chunks retrieval is still serving.
+    """
+    return [
+        chunk_id(c.metadata.get("generation", ""), c.metadata["doc_id"], c.metadata.get("start_index", 0))
+        for c in children
+    ]
+
+
+def split_sections(
+    sections: Iterable[Document],
+) -> tuple[list[Document], ChildChunks, dict[str, Document]]:
+    """Sections to parents to children in one pass over each section's text.
+
+    Same chunks as split_sections_into_parents followed by
+    split_parents_into_children. Boundaries are found as offsets into the
+    section; parents are sliced out once and children stay offsets into their
+    parent (see ChildChunks). `sections` is consumed once, so it can be a
+    stream such as iter_sections.
+    """
+    max_size = settings.parent_chunk_max
+    length = chunk_length()
+    parent_splitter = _SpanSplitter(max_size, settings.parent_chunk_overlap, length)
+    child_splitter = _SpanSplitter(settings.child_chunk_size, settings.child_chunk_overlap, length)
+
+    parents: list[Document] = []
+    child_spans: list[tuple[int, int, int]] = []
+    parent_map: dict[str, Document] = {}
+    for section in sections:
+        text = section.page_content
+        whole = length(text) <= max_size
+        for start, end in [(0, len(text))] if whole else parent_splitter.split(text):
+            if whole:
+                parent = section
+            else:
+                parent = Document(
+                    page_content=text[start:end], metadata={**section.metadata, "start_index": start}
+                )
+            parent_id = _parent_id(parent, parent_map)
+            parent.metadata["doc_id"] = parent_id
+            parent_map[parent_id] = parent
+            parent_index = len(parents)
+            parents.append(parent)
+            child_spans.extend(
+                (parent_index, child_start - start, child_end - start)
+                for child_start, child_end in child_splitter.split(text, start, end)
+            )
+    return parents, ChildChunks(parents, child_spans), parent_map
+
+
 def split_sections_into_parents(
     sections: list[Document],
     max_size: int | None = None,
@@ -55,20 +347,19 @@ def split_sections_into_parents(
     """
     if max_size is None:
         max_size = settings.parent_chunk_max
-
-    char_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=max_size,
-        chunk_overlap=settings.parent_chunk_overlap,
-        add_start_index=True,
-    )
+    length = chunk_length()
+    splitter = _SpanSplitter(max_size, settings.parent_chunk_overlap, length)
 
     parents: list[Document] = []
     for section in sections:
-        if len(section.page_content) <= max_size:
+        text = section.page_content
+        if length(text) <= max_size:
             parents.append(section)
-        else:
-            sub_chunks = char_splitter.split_documents([section])
-            parents.extend(sub_chunks)
+            continue
+        for start, end in splitter.split(text):
+            parents.append(Document(
+                page_content=text[start:end], metadata={**section.metadata, "start_index": start}
+            ))
 
     return parents
 
@@ -81,19 +372,21 @@ def split_parents_into_children(
     Returns (child_chunks, parent_map) where parent_map maps parent_id -> parent Document.
     Each child gets metadata["doc_id"] pointing to its parent.
     """
-    child_splitter = get_child_splitter()
+    splitter = _SpanSplitter(settings.child_chunk_size, settings.child_chunk_overlap, chunk_length())
 
     child_chunks: list[Document] = []
     parent_map: dict[str, Document] = {}
 
     for parent in parents:
-        parent_id = str(uuid.uuid4())
+        parent_id = _parent_id(parent, parent_map)
         parent.metadata["doc_id"] = parent_id
         parent_map[parent_id] = parent
 
-        children = child_splitter.split_documents([parent])
-        for child in children:
-            child.metadata["doc_id"] = parent_id
-        child_chunks.extend(children)
+        text = parent.page_content
+        for start, end in splitter.split(text):
+            child_chunks.append(Document(
+                page_content=text[start:end],
+                metadata={**parent.metadata, "start_index": start},
+            ))
 
     return child_chunks, parent_map
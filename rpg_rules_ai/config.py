@@ -14,6 +14,8 @@ class Settings(BaseSettings):
     chroma_persist_dir: str = "./data/chroma"
     sources_dir: str = "./data/sources"
     docstore_dir: str = "./data/docstore"
+    model_provider: Literal["openai", "fake"] = "openai"
+    fake_latency_ms: float = 0.0
     llm_model: str = "gpt-4o-mini"
     embedding_model: str = "text-embedding-3-large"
     retrieval_strategy: Literal["multi-hop", "multi-question"] = "multi-hop"
@@ -24,12 +26,39 @@ class Settings(BaseSettings):
     child_chunk_overlap: int = 100
     parent_chunk_max: int = 4000
     parent_chunk_overlap: int = 100
+    chunk_length_unit: Literal["chars", "tokens"] = "chars"
+    near_duplicate_threshold: float = 0.9
+    near_duplicate_index_path: str = "./data/near_duplicates.db"
     enable_contextual_embeddings: bool = False
     enable_entity_extraction: bool = False
     enable_entity_retrieval: bool = True
     context_model: str = "gpt-4o-mini"
     entity_extraction_model: str = "gpt-4o-mini"
     entity_index_path: str = "./data/entity_index.db"
+    enable_speculative_retrieval: bool = False
+    speculative_similarity_threshold: float = 0.9
+    multi_hop_max_seconds: float = 0.0
+    multi_hop_max_tokens: int = 0
+    enable_multi_hop_precheck: bool = False
+    analyzer_context_mode: Literal["full", "incremental"] = "full"
+    analyzer_context_max_tokens: int = 6000
+    enable_rerank: bool = False
+    rerank_max_tokens: int = 12000
+    context_max_tokens: int = 16000
+    context_passage_max_tokens: int = 1000
+    job_queue_path: str = "./data/jobs.db"
+    ingest_workers: int = 1
+    job_history_limit: int = 100
+    ingest_checkpoint_dir: str = "./data/checkpoints"
+    generations_path: str = "./data/generations.db"
+    corpus_check_seconds: float = 1.0
+    blocking_io_workers: int = 4
+    conversation_db_path: str = "./data/conversations.db"
+    pdf_extract_workers: int = 0
+    pdf_page_cache_dir: str = "./data/pdf_pages"
+    pdf_repeated_line_threshold: float = 0.5
+    metrics_dir: str = ""
+    metrics_snapshot_seconds: float = 5.0
 
 
 settings = Settings()
@@ -0,0 +1,151 @@
+"""Token-budgeted packing of retrieved passages into the generation prompt.
+
+Passages are taken in ranking order. Each one is capped at a per-passage
+budget by trimming around the child chunks that matched the query
+(metadata["child_hits"], set by the retriever) and the whole context is capped
+at a total budget. Passages that no longer fit are trimmed to the remaining
+budget or skipped.
+"""
+
+from __future__ import annotations
+
+from langchain_core.documents import Document
+
+from rpg_rules_ai.rerank import unique_documents
+from rpg_rules_ai.tokens import count_tokens, truncate_to_tokens
+
+ELLIPSIS = "\n[...]\n"
+# Below this many tokens a trimmed passage is not worth sending
+MIN_PASSAGE_TOKENS = 64
+
+
+def passage_text(doc: Document) -> str:
+    return doc.metadata.get("original_text", doc.page_content)
+
+
+def _merge_spans(spans: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _snap(text: str, start: int, end: int) -> tuple[int, int]:
+    """Move window edges onto whitespace so words are not cut in half."""
+    if start > 0 and not text[start - 1].isspace():
+        space = text.find(" ", start, end)
+        newline = text.find("\n", start, end)
+        cut = min((i for i in (space, newline) if i != -1), default=-1)
+        if cut != -1:
+            start = cut + 1
+    if end < len(text) and not text[end].isspace():
+        cut = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+        if cut > start:
+            end = cut
+    return start, end
+
+
+def _windows_text(text: str, spans: list[tuple[int, int]], char_budget: int) -> str:
+    windows: list[tuple[int, int]] = []
+    if text.startswith("#"):
+        heading_end = text.find("\n")
+        if 0 < heading_end < char_budget // 4:
+            windows.append((0, heading_end))
+            char_budget -= heading_end
+
+    selected: list[tuple[int, int]] = []
+    used = 0
+    for start, end in spans:
+        if selected and used + end - start > char_budget:
+            continue
+        end = min(end, start + max(char_budget - used, 1))
+        selected.append((start, end))
+        used += end - start
+
+    # Spread whatever budget the hits leave over both sides of each window
+    pad = max(0, char_budget - used) // (2 * len(selected))
+    windows.extend(
+        _snap(text, max(0, start - pad), min(len(text), end + pad))
+        for start, end in selected
+    )
+    merged = _merge_spans(windows)
+
+    trimmed = ELLIPSIS.join(p for p in (text[s:e].strip() for s, e in merged) if p)
+    if merged[0][0] > 0:
+        trimmed = "[...]\n" + trimmed
+    if merged[-1][1] < len(text):
+        trimmed += "\n[...]"
+    return trimmed
+
+
+def trim_around_hits(text: str, hits: list[list[int]], max_tokens: int) -> str:
+    """Cut text down to max_tokens, keeping the regions around the hit spans.
+
+    Hits are [start, end] character offsets in retrieval order; the earliest
+    hits win when they do not all fit. A leading markdown heading is kept so
+    the passage still says which section it comes from. Without hits the
+    beginning of the text is kept.
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    spans = [
+        (start, min(len(text), end))
+        for start, end in hits
+        if 0 <= start < len(text) and end > start
+    ]
+    if not spans:
+        return truncate_to_tokens(text, max_tokens)
+
+    chars_per_token = len(text) / total
+    char_budget = int(max_tokens * chars_per_token)
+    # Token density varies across the text, so shrink the window budget by the
+    # overshoot a few times before falling back to a plain cut
+    for _ in range(4):
+        trimmed = _windows_text(text, spans, char_budget)
+        overshoot = count_tokens(trimmed) - max_tokens
+        if overshoot <= 0:
+            return trimmed
+        char_budget -= int((overshoot + 1) * chars_per_token)
+        if char_budget <= 0:
+            break
+    return truncate_to_tokens(trimmed, max_tokens)
+
+
+def _block_overhead(index: int, doc: Document) -> int:
+    """Tokens added around each passage by the prompt's block header and separator."""
+    return count_tokens(f"[{index}] Source: {doc.metadata.get('book', '')}\n\n---\n")
+
+
+def pack_context(
+    docs: list[Document], max_tokens: int, passage_max_tokens: int
+) -> list[tuple[Document, str]]:
+    """Select and trim passages so the generation context fits max_tokens.
+
+    Returns (document, text to send) pairs in ranking order. A budget of 0
+    disables the corresponding limit. Something from the first passage is always
+    kept.
+    """
+    packed: list[tuple[Document, str]] = []
+    used = 0
+    for doc in unique_documents(docs):
+        text = passage_text(doc)
+        hits = doc.metadata.get("child_hits") or []
+        if passage_max_tokens > 0:
+            text = trim_around_hits(text, hits, passage_max_tokens)
+        overhead = _block_overhead(len(packed) + 1, doc)
+        cost = count_tokens(text) + overhead
+        if max_tokens > 0 and used + cost > max_tokens:
+            remaining = max_tokens - used - overhead
+            if remaining < MIN_PASSAGE_TOKENS:
+                if packed:
+                    continue
+                remaining = MIN_PASSAGE_TOKENS
+            text = trim_around_hits(text, hits, remaining)
+            cost = count_tokens(text) + overhead
+        packed.append((doc, text))
+        used += cost
+    return packed
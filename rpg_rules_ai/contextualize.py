@@ -7,9 +7,9 @@ import logging
 
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
 from rpg_rules_ai.prompts import DEFAULT_CONTEXT_TEMPLATE
+from rpg_rules_ai.providers import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +24,7 @@ async def generate_context(
 
     Returns a short (2-3 sentence) description situating the child within the parent.
     """
-    llm = ChatOpenAI(model=model, temperature=0)
+    llm = get_chat_model(model=model, temperature=0)
     prompt = ChatPromptTemplate.from_template(DEFAULT_CONTEXT_TEMPLATE)
 
     section_headers = child.metadata.get("section_headers", "")
@@ -8,10 +8,10 @@ from typing import List
 
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
 from rpg_rules_ai.prompts import DEFAULT_ENTITY_EXTRACTION_TEMPLATE
+from rpg_rules_ai.providers import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +35,7 @@ async def extract_entities(
 
     Returns a list of dicts with keys: name, type, mention_type.
     """
-    llm = ChatOpenAI(model=model, temperature=0)
+    llm = get_chat_model(model=model, temperature=0)
     prompt = ChatPromptTemplate.from_template(DEFAULT_ENTITY_EXTRACTION_TEMPLATE)
     chain = prompt | llm.with_structured_output(ExtractedEntities)
 
@@ -189,6 +189,16 @@ class EntityIndex:
         )
         self._conn.commit()
 
+    def delete_chunk_mentions(self, chunk_ids: list[str]) -> None:
+        """Remove mentions from the given parent chunks and garbage-collect orphan entities."""
+        self._conn.executemany(
+            "DELETE FROM entity_mentions WHERE chunk_id = ?", [(c,) for c in chunk_ids]
+        )
+        self._conn.execute(
+            "DELETE FROM entities WHERE id NOT IN (SELECT DISTINCT entity_id FROM entity_mentions)"
+        )
+        self._conn.commit()
+
     def get_book_entity_count(self, book: str) -> int:
         """Count distinct entities mentioned in a book."""
         row = self._conn.execute(
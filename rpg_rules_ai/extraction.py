@@ -2,18 +2,353 @@
 
 from __future__ import annotations
 
+import logging
+import multiprocessing
+import os
 import re
+import shutil
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
 
+from rpg_rules_ai.config import settings
 
-def extract_pdf(path: Path) -> str:
+logger = logging.getLogger(__name__)
+
+# Pages per extraction task: large enough to amortize opening the PDF in a
+# worker, small enough to keep every core busy on a 500-page book
+PDF_PAGES_PER_RANGE = 16
+
+# Running header/footer detection: how many non-blank lines at the top and
+# bottom of a page are candidates, how many distinct lines the frequency
+# counter keeps, and the smallest PDF worth checking
+PAGE_EDGE_LINES = 3
+REPEATED_LINE_COUNTER_SIZE = 256
+REPEATED_LINE_MIN_PAGES = 4
+
+# A PDF's cleaned markdown is cached next to it as <name>.pdf.extracted.md
+EXTRACTED_SUFFIX = ".extracted.md"
+
+
+def extract_pdf(
+    path: Path,
+    on_pages: Callable[[int, int], None] | None = None,
+    workers: int | None = None,
+) -> str:
     """Extract a PDF to markdown using pymupdf4llm.
 
-    Returns markdown text with formatting preserved (bold, italic).
+    Returns markdown text with formatting preserved (bold, italic). See
+    iter_pdf_pages for the parallel, cached extraction.
+    """
+    return "".join(iter_pdf_pages(path, on_pages=on_pages, workers=workers))
+
+
+def iter_pdf_pages(
+    path: Path,
+    on_pages: Callable[[int, int], None] | None = None,
+    workers: int | None = None,
+) -> Iterator[str]:
+    """Yield each page's markdown in page order.
+
+    Pages are extracted in ranges across a process pool; each page's markdown
+    is cached under (file hash, page number), so a re-extraction only pays for
+    pages not seen before. Only a window of ranges is in flight at a time, so
+    pages finished ahead of the one being yielded stay bounded.
+    `on_pages(done, total)` is called as each range finishes. `workers=1`
+    extracts in this process.
+    """
+    import pymupdf4llm
+
+    page_count = _page_count(path)
+    if page_count is None:
+        # Not readable page by page; let pymupdf4llm handle (or reject) it whole
+        yield pymupdf4llm.to_markdown(str(path))
+        return
+
+    cache = _PageCache(path)
+    missing = [n for n in range(page_count) if not cache.has(n)]
+    done = page_count - len(missing)
+    if on_pages is not None:
+        on_pages(done, page_count)
+
+    ranges = _page_ranges(missing, PDF_PAGES_PER_RANGE)
+    # Extraction is CPU-bound and holds the GIL, so unless the caller asks for
+    # workers=1 it runs in worker processes, even for a single range, and the
+    # server sharing this process keeps answering requests
+    in_process = workers == 1
+    if workers is None:
+        workers = settings.pdf_extract_workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(ranges)))
+
+    ready: dict[int, str] = {}
+    next_page = 0
+
+    def collect(page_numbers: list[int], texts: list[str]) -> None:
+        nonlocal done
+        for number, text in zip(page_numbers, texts):
+            ready[number] = text
+            cache.put(number, text)
+        done += len(page_numbers)
+        if on_pages is not None:
+            on_pages(done, page_count)
+
+    def flush(upto: int) -> Iterator[str]:
+        # Pages before `upto` are either extracted (in `ready`) or cached
+        nonlocal next_page
+        while next_page < upto:
+            text = ready.pop(next_page, None)
+            yield text if text is not None else cache.get(next_page)
+            next_page += 1
+
+    if in_process or not ranges:
+        for page_numbers in ranges:
+            collect(page_numbers, _extract_pages(str(path), page_numbers))
+            yield from flush(page_numbers[-1] + 1)
+    else:
+        # spawn: forking a process that runs server and ingest threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        pending = iter(ranges)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            in_flight = {pool.submit(_extract_pages, str(path), r): r for r in islice(pending, 2 * workers)}
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(in_flight.pop(future), future.result())
+                    if (r := next(pending, None)) is not None:
+                        in_flight[pool.submit(_extract_pages, str(path), r)] = r
+                # Everything before the oldest range still running is complete
+                oldest = min((r[0] for r in in_flight.values()), default=page_count)
+                yield from flush(oldest)
+    yield from flush(page_count)
+
+
+def iter_pdf_lines(
+    path: Path,
+    on_pages: Callable[[int, int], None] | None = None,
+    workers: int | None = None,
+) -> Iterator[str]:
+    """Cleaned, header-normalized markdown lines of a PDF, page by page.
+
+    Equivalent to postprocess_headers(clean_page_artifacts(extract_pdf(path)))
+    split on newlines, without holding more than a page in memory. Running
+    headers and footers (see repeated_edge_lines) are dropped first; finding
+    them takes one sweep over the pages, after which the pages are streamed
+    again from the page cache.
+    """
+    pages: Iterable[str] = iter_pdf_pages(path, on_pages=on_pages, workers=workers)
+    threshold = settings.pdf_repeated_line_threshold
+    if threshold > 0:
+        head: list[str] = []
+
+        def sweep(pages: Iterable[str]) -> Iterator[str]:
+            for page in pages:
+                if len(head) < REPEATED_LINE_MIN_PAGES:
+                    head.append(page)
+                yield page
+
+        repeated = repeated_edge_lines(sweep(pages), threshold)
+        if len(head) < REPEATED_LINE_MIN_PAGES:
+            # Too short to have running headers (or read whole): reuse the pages
+            pages = head
+        else:
+            head.clear()
+            pages = iter_pdf_pages(path, workers=workers)
+            if repeated:
+                pages = (drop_edge_lines(page, repeated) for page in pages)
+    return iter_clean_lines(iter_lines(pages))
+
+
+def extracted_markdown_path(path: Path) -> Path:
+    return path.with_name(path.name + EXTRACTED_SUFFIX)
+
+
+def iter_cached_pdf_lines(
+    path: Path, on_pages: Callable[[int, int], None] | None = None
+) -> Iterator[str]:
+    """iter_pdf_lines, cached as markdown next to the PDF.
+
+    The cache's first line stamps the PDF's sha256 and the header/footer
+    threshold; when it matches, the lines are read back without extracting.
+    Otherwise the PDF is extracted and the cache rewritten as lines stream by.
+    """
+    from rpg_rules_ai.checkpoints import file_sha256
+
+    stamp = (
+        f"<!-- extracted sha256={file_sha256(path)}"
+        f" repeated_line_threshold={settings.pdf_repeated_line_threshold} -->"
+    )
+    cached = extracted_markdown_path(path)
+    try:
+        # newline="\n": lines are split on "\n" only, like the extraction's
+        with open(cached, encoding="utf-8", newline="\n") as f:
+            if f.readline() == stamp + "\n":
+                for line in f:
+                    yield line[:-1]
+                return
+    except FileNotFoundError:
+        pass
+
+    tmp = cached.with_name(f".{cached.name}.part")
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="\n") as out:
+            out.write(stamp + "\n")
+            for line in iter_pdf_lines(path, on_pages=on_pages):
+                out.write(line + "\n")
+                yield line
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, cached)
+
+
+def _line_key(line: str) -> str:
+    """Normalized form used to match a running header across pages.
+
+    Markdown emphasis is ignored and digits collapse, so "COMBAT 99" and
+    "**COMBAT 100**" count as the same line.
+    """
+    return _DIGITS.sub("#", " ".join(line.strip(" \t*_#").split())).casefold()
+
+
+def _edge_positions(lines: list[str]) -> list[int]:
+    """Indexes of the first and last PAGE_EDGE_LINES candidate lines of a page."""
+    candidates = [
+        i for i, line in enumerate(lines)
+        if line.strip() and not _is_page_artifact_line(line) and len(line) <= 120
+    ]
+    if len(candidates) <= 2 * PAGE_EDGE_LINES:
+        return candidates
+    return candidates[:PAGE_EDGE_LINES] + candidates[-PAGE_EDGE_LINES:]
+
+
+class _FrequentLines:
+    """Misra-Gries counter: the lines seen on the most pages, in bounded memory.
+
+    Keeps at most `size` counters; any line on more than n / (size + 1) of n
+    counted lines survives, with a count short by at most that much.
     """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.counts: dict[str, int] = {}
+
+    def add(self, key: str) -> None:
+        if key in self.counts:
+            self.counts[key] += 1
+        elif len(self.counts) < self.size:
+            self.counts[key] = 1
+        else:
+            for k in list(self.counts):
+                self.counts[k] -= 1
+                if not self.counts[k]:
+                    del self.counts[k]
+
+
+def repeated_edge_lines(pages: Iterable[str], threshold: float) -> set[str]:
+    """Keys (see _line_key) of page-edge lines found on more than `threshold` of the pages."""
+    counter = _FrequentLines(REPEATED_LINE_COUNTER_SIZE)
+    page_count = 0
+    for page in pages:
+        page_count += 1
+        lines = page.split("\n")
+        keys = {_line_key(lines[i]) for i in _edge_positions(lines)}
+        for key in keys:
+            if key:
+                counter.add(key)
+    if page_count < REPEATED_LINE_MIN_PAGES:
+        return set()
+    return {key for key, count in counter.counts.items() if count > threshold * page_count}
+
+
+def drop_edge_lines(page: str, repeated: set[str]) -> str:
+    """Remove the page-edge lines whose key is in `repeated`."""
+    lines = page.split("\n")
+    drop = {i for i in _edge_positions(lines) if _line_key(lines[i]) in repeated}
+    if not drop:
+        return page
+    return "\n".join(line for i, line in enumerate(lines) if i not in drop)
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Split a stream of text chunks into lines, as "".join(chunks).split("\\n") would."""
+    partial = ""
+    for chunk in chunks:
+        lines = chunk.split("\n")
+        if len(lines) == 1:
+            partial += lines[0]
+            continue
+        yield partial + lines[0]
+        yield from lines[1:-1]
+        partial = lines[-1]
+    yield partial
+
+
+def _page_count(path: Path) -> int | None:
+    try:
+        import pymupdf
+
+        with pymupdf.open(str(path)) as doc:
+            return doc.page_count
+    except Exception as exc:
+        logger.debug("Could not count pages of %s: %s", path, exc)
+        return None
+
+
+def _page_ranges(pages: list[int], size: int) -> list[list[int]]:
+    return [pages[i : i + size] for i in range(0, len(pages), size)]
+
+
+def _extract_pages(path: str, page_numbers: list[int]) -> list[str]:
+    """Markdown of each page, in order. Runs in a worker process."""
     import pymupdf4llm
 
-    return pymupdf4llm.to_markdown(str(path))
+    chunks = pymupdf4llm.to_markdown(path, pages=page_numbers, page_chunks=True)
+    return [chunk["text"] for chunk in chunks]
+
+
+class _PageCache:
+    """Per-page markdown on disk, keyed by the PDF's sha256 and page number."""
+
+    def __init__(self, path: Path):
+        from rpg_rules_ai.checkpoints import file_sha256
+
+        self._dir = Path(settings.pdf_page_cache_dir) / file_sha256(path)
+
+    def has(self, page: int) -> bool:
+        return (self._dir / f"{page}.md").is_file()
+
+    def get(self, page: int) -> str | None:
+        try:
+            return (self._dir / f"{page}.md").read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def put(self, page: int, text: str) -> None:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        target = self._dir / f"{page}.md"
+        tmp = target.with_suffix(".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, target)
+
+
+def discard_page_cache(source_hashes: Iterable[str]) -> None:
+    """Remove the cached pages of the PDFs with these sha256s."""
+    root = Path(settings.pdf_page_cache_dir)
+    for source_hash in source_hashes:
+        shutil.rmtree(root / source_hash, ignore_errors=True)
+
+
+_BOLD_ITALIC_HEADER = re.compile(r"^\*{3}(.+?)\*{3}$")
+_BOLD_UNDERSCORE_HEADER = re.compile(r"^\*{2}_(.+?)_\*{2}$")
+_BOLD_CAPS_HEADER = re.compile(r"^\*{2}([A-Z][A-Z0-9\s,;:'\-&/()]+)\*{2}$")
+_NUMBER = re.compile(r"^\d+$")
+_CAPS_THEN_NUMBER = re.compile(r"^[A-Z\s]+\d+$")
+_NUMBER_THEN_CAPS = re.compile(r"^\d+\s+[A-Z\s]+$")
+_PAGE_NUMBER = re.compile(r"^\d{1,4}$")
+_PAGE_RULE = re.compile(r"^[-_]{3,}$")
+_PAGE_LABEL = re.compile(r"^page\s+\d+$", re.IGNORECASE)
+_DIGITS = re.compile(r"\d+")
 
 
 def postprocess_headers(md: str) -> str:
@@ -23,46 +358,35 @@ def postprocess_headers(md: str) -> str:
     - Section headers appear as **ALL CAPS TEXT** on a standalone line
     - Sub-section headers appear as ***Mixed Case Text*** (bold+italic)
     """
-    lines = md.split("\n")
-    result = []
+    return "\n".join(map(_normalize_header, md.split("\n")))
 
-    for line in lines:
-        stripped = line.strip()
 
-        # Bold+italic standalone line → ### (sub-section)
-        # Matches ***Text*** or **_Text_** patterns
-        m_bolditalic = re.match(r"^\*{3}(.+?)\*{3}$", stripped)
-        if not m_bolditalic:
-            m_bolditalic = re.match(r"^\*{2}_(.+?)_\*{2}$", stripped)
-        if m_bolditalic:
-            header_text = m_bolditalic.group(1).strip()
-            if len(header_text) > 2:
-                result.append(f"### {header_text}")
-                continue
+def _normalize_header(line: str) -> str:
+    stripped = line.strip()
 
-        # Bold ALL-CAPS standalone line → ## (section)
-        m_bold = re.match(r"^\*{2}([A-Z][A-Z0-9\s,;:'\-&/()]+)\*{2}$", stripped)
-        if m_bold:
-            header_text = m_bold.group(1).strip()
-            if len(header_text) > 2 and not _looks_like_page_artifact(header_text):
-                result.append(f"## {header_text}")
-                continue
+    # Bold+italic standalone line → ### (sub-section)
+    # Matches ***Text*** or **_Text_** patterns
+    m_bolditalic = _BOLD_ITALIC_HEADER.match(stripped) or _BOLD_UNDERSCORE_HEADER.match(stripped)
+    if m_bolditalic:
+        header_text = m_bolditalic.group(1).strip()
+        if len(header_text) > 2:
+            return f"### {header_text}"
 
-        result.append(line)
+    # Bold ALL-CAPS standalone line → ## (section)
+    m_bold = _BOLD_CAPS_HEADER.match(stripped)
+    if m_bold:
+        header_text = m_bold.group(1).strip()
+        if len(header_text) > 2 and not _looks_like_page_artifact(header_text):
+            return f"## {header_text}"
 
-    return "\n".join(result)
+    return line
 
 
 def _looks_like_page_artifact(text: str) -> bool:
     """Check if a bold ALL-CAPS line is likely a page header/footer rather than a real section."""
     # Page number patterns: "COMBAT 99", "99 COMBAT", standalone numbers
-    if re.match(r"^\d+$", text.strip()):
-        return True
-    if re.match(r"^[A-Z\s]+\d+$", text.strip()):
-        return True
-    if re.match(r"^\d+\s+[A-Z\s]+$", text.strip()):
-        return True
-    return False
+    text = text.strip()
+    return bool(_NUMBER.match(text) or _CAPS_THEN_NUMBER.match(text) or _NUMBER_THEN_CAPS.match(text))
 
 
 def clean_page_artifacts(md: str) -> str:
@@ -73,24 +397,19 @@ def clean_page_artifacts(md: str) -> str:
     - Page header lines (e.g., "GURPS Basic Set" repeated on every page)
     - Horizontal rules that pymupdf4llm inserts at page breaks
     """
-    lines = md.split("\n")
-    result = []
+    return "\n".join(line for line in md.split("\n") if not _is_page_artifact_line(line))
 
-    for line in lines:
-        stripped = line.strip()
 
-        # Skip standalone page numbers
-        if re.match(r"^\d{1,4}$", stripped):
-            continue
+def _is_page_artifact_line(line: str) -> bool:
+    stripped = line.strip()
+    # Standalone page numbers, page-break rules (--- or ___), "page N"
+    return bool(
+        _PAGE_NUMBER.match(stripped) or _PAGE_RULE.match(stripped) or _PAGE_LABEL.match(stripped)
+    )
 
-        # Skip page-break horizontal rules (sequences of --- or ___)
-        if re.match(r"^[-_]{3,}$", stripped):
-            continue
 
-        # Skip lines that are just "page N" or "N"
-        if re.match(r"^page\s+\d+$", stripped, re.IGNORECASE):
-            continue
-
-        result.append(line)
-
-    return "\n".join(result)
+def iter_clean_lines(lines: Iterable[str]) -> Iterator[str]:
+    """clean_page_artifacts followed by postprocess_headers, one line at a time."""
+    for line in lines:
+        if not _is_page_artifact_line(line):
+            yield _normalize_header(line)
@@ -4,7 +4,6 @@ from fastapi import APIRouter, Form, Request, UploadFile
 from fastapi.responses import HTMLResponse
 
 from rpg_rules_ai import services
-from rpg_rules_ai.config import settings
 
 router = APIRouter()
 
@@ -48,7 +47,7 @@ async def chat_ask(
 
 @router.get("/documents", response_class=HTMLResponse)
 async def documents_page(request: Request):
-    books = services.list_books()
+    books = await services.alist_books()
     return _templates().TemplateResponse(
         "documents.html",
         {"request": request, "active_page": "documents", "books": books},
@@ -57,7 +56,7 @@ async def documents_page(request: Request):
 
 @router.get("/documents/list", response_class=HTMLResponse)
 async def documents_list_fragment(request: Request):
-    books = services.list_books()
+    books = await services.alist_books()
     return _templates().TemplateResponse(
         "fragments/doc_list.html", {"request": request, "books": books}
     )
@@ -67,19 +66,17 @@ async def documents_list_fragment(request: Request):
 async def documents_htmx_upload(
     request: Request, files: list[UploadFile], replace: bool = Form(False)
 ):
-    saved_paths: list[Path] = []
-    sources_dir = Path(settings.sources_dir)
-
-    for f in files:
-        if not f.filename or not f.filename.endswith(".md"):
-            return HTMLResponse(
-                f'<div class="file-result error">Only .md files accepted: {f.filename}</div>',
-                status_code=400,
-            )
-        content = await f.read()
-        dest = sources_dir / f.filename
-        dest.write_bytes(content)
-        saved_paths.append(dest)
+    try:
+        saved_paths, skipped = await services.save_uploads(files, replace=replace)
+    except services.UploadTooLarge as exc:
+        return HTMLResponse(f'<div class="file-result error">{exc}</div>', status_code=413)
+    except ValueError as exc:
+        return HTMLResponse(f'<div class="file-result error">{exc}</div>', status_code=400)
+
+    if not saved_paths:
+        return _templates().TemplateResponse(
+            "fragments/skipped.html", {"request": request, "skipped": skipped}
+        )
 
     try:
         job_id = services.create_ingestion_job(saved_paths, replace=replace)
@@ -89,13 +86,14 @@ async def documents_htmx_upload(
             status_code=400,
         )
 
-    progress = services.get_job_progress(job_id)
+    progress = await services.aget_job_progress(job_id)
     return _templates().TemplateResponse(
         "fragments/progress.html",
         {
             "request": request,
             "job_id": job_id,
             "progress": progress,
+            "skipped": skipped,
         },
     )
 
@@ -110,21 +108,21 @@ async def documents_htmx_ingest(
             f'<div class="file-result error">Directory not found: {directory}</div>',
             status_code=400,
         )
-    md_files = sorted(d.glob("*.md"))
-    if not md_files:
+    files = services.list_source_files(d)
+    if not files:
         return HTMLResponse(
-            '<div class="file-result skipped">No .md files found in directory.</div>'
+            '<div class="file-result skipped">No .md or .pdf files found in directory.</div>'
         )
 
     try:
-        job_id = services.create_ingestion_job(list(md_files), replace=replace)
+        job_id = services.create_ingestion_job(files, replace=replace)
     except (ValueError, FileNotFoundError) as exc:
         return HTMLResponse(
             f'<div class="file-result error">{exc}</div>',
             status_code=400,
         )
 
-    progress = services.get_job_progress(job_id)
+    progress = await services.aget_job_progress(job_id)
     return _templates().TemplateResponse(
         "fragments/progress.html",
         {
@@ -138,7 +136,7 @@ async def documents_htmx_ingest(
 @router.get("/documents/htmx/progress/{job_id}", response_class=HTMLResponse)
 async def documents_htmx_progress(request: Request, job_id: str):
     try:
-        progress = services.get_job_progress(job_id)
+        progress = await services.aget_job_progress(job_id)
     except KeyError:
         return HTMLResponse('<div class="file-result error">Job not found</div>')
     return _templates().TemplateResponse(
@@ -153,7 +151,7 @@ async def documents_htmx_progress(request: Request, job_id: str):
 
 @router.delete("/documents/htmx/{book}", response_class=HTMLResponse)
 async def documents_htmx_delete(request: Request, book: str):
-    services.delete_book(book)
+    await services.adelete_book(book)
     return HTMLResponse(
         "",
         headers={"HX-Trigger": "refreshDocList"},
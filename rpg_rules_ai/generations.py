@@ -0,0 +1,277 @@
+"""Blue/green book generations.
+
+Every ingest writes a book's children and parents under a new generation id
+(metadata["generation"]). The generation stays hidden from retrieval while it
+is staging; activating it is one SQLite transaction that also retires the
+book's previous generation, so queries switch from the old chunks to the new
+ones at once and never see the book missing. Retired chunks are then garbage
+collected.
+
+Chunks written before generations existed have no "generation" field; Chroma's
+$nin matches them, so they stay visible until a reingest replaces them.
+
+Every change to the served corpus bumps a shared corpus version, which other
+server processes use to reopen their vector store (see retriever.py).
+
+Writes to a book's chunks (ingest, garbage collection, delete) hold the
+book's lock, a file lock next to the registry, so two server processes never
+write or remove the same book's chunks at once; resetting the whole
+collection holds the corpus lock, which excludes every book lock.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from rpg_rules_ai.config import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_SQL = """\
+CREATE TABLE IF NOT EXISTS generations (
+    id TEXT PRIMARY KEY,
+    book TEXT NOT NULL,
+    state TEXT NOT NULL,
+    source_hash TEXT,
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_generations_book ON generations(book, state);
+CREATE INDEX IF NOT EXISTS idx_generations_hash ON generations(source_hash);
+
+CREATE TABLE IF NOT EXISTS corpus (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    writer_pid INTEGER
+);
+
+INSERT OR IGNORE INTO corpus (id, version) VALUES (1, 0);
+"""
+
+
+class GenerationRegistry:
+    """SQLite record of which generation of each book is staging, active or retired."""
+
+    def __init__(self, db_path: str | Path | None = None):
+        if db_path is None:
+            db_path = settings.generations_path
+        self._db_path = str(db_path)
+        Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._held = threading.local()
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(generations)")}
+        if columns and "source_hash" not in columns:
+            self._conn.execute("ALTER TABLE generations ADD COLUMN source_hash TEXT")
+        self._conn.executescript(SCHEMA_SQL)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def lock(self, book: str | None = None) -> Iterator[None]:
+        """Hold `book`'s write lock, or without a book the whole corpus's.
+
+        Blocks other threads and server processes taking the same book's lock,
+        or the corpus lock. Reentrant within a thread.
+        """
+        with ExitStack() as stack:
+            if book is None:
+                stack.enter_context(self._file_lock("corpus", fcntl.LOCK_EX))
+            else:
+                stack.enter_context(self._file_lock("corpus", fcntl.LOCK_SH))
+                name = hashlib.sha256(book.encode("utf-8")).hexdigest()[:16]
+                stack.enter_context(self._file_lock(f"book-{name}", fcntl.LOCK_EX))
+            yield
+
+    @contextmanager
+    def _file_lock(self, name: str, mode: int) -> Iterator[None]:
+        held = self._held.__dict__.setdefault("depth", {})
+        if held.get(name):
+            held[name] += 1
+            try:
+                yield
+            finally:
+                held[name] -= 1
+            return
+        path = Path(f"{self._db_path}.locks") / f"{name}.lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as f:
+            # flock locks belong to the open file, so threads of this process exclude each other too
+            fcntl.flock(f, mode)
+            held[name] = 1
+            try:
+                yield
+            finally:
+                held[name] = 0
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stage(self, book: str, source_hash: str | None = None) -> str:
+        """Register a new staging generation; `source_hash` is the sha256 of the source file."""
+        generation = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO generations (id, book, state, source_hash, created_at)"
+                " VALUES (?, ?, 'staging', ?, ?)",
+                (generation, book, source_hash, time.time()),
+            )
+        return generation
+
+    def activate(self, book: str, generation: str) -> None:
+        """Make `generation` the visible one for `book`, retiring any other."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE generations SET state = 'retired' WHERE book = ? AND id != ? AND state = 'active'",
+                (book, generation),
+            )
+            self._conn.execute(
+                "UPDATE generations SET state = 'active' WHERE id = ?", (generation,)
+            )
+            self._bump_version()
+
+    def active(self, book: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM generations WHERE book = ? AND state = 'active'", (book,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def book_with_source(self, source_hash: str) -> str | None:
+        """The indexed book whose active generation came from this exact file content."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT book FROM generations WHERE source_hash = ? AND state = 'active'"
+                " ORDER BY created_at LIMIT 1",
+                (source_hash,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def hidden(self) -> list[str]:
+        """Generations retrieval must not see: staging and retired."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM generations WHERE state != 'active' ORDER BY id"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def books_with_retired(self) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT book FROM generations WHERE state = 'retired' ORDER BY book"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def orphaned_sources(self, generations: list[str]) -> list[str]:
+        """Source hashes of `generations` that no other generation shares."""
+        if not generations:
+            return []
+        placeholders = ",".join("?" for _ in generations)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT source_hash FROM generations"
+                f" WHERE id IN ({placeholders}) AND source_hash IS NOT NULL"
+                " AND source_hash NOT IN (SELECT source_hash FROM generations"
+                f" WHERE id NOT IN ({placeholders}) AND source_hash IS NOT NULL)"
+                " ORDER BY source_hash",
+                [*generations, *generations],
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def forget(self, generations: list[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM generations WHERE id = ?", [(g,) for g in generations]
+            )
+            self._bump_version()
+
+    def forget_book(self, book: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM generations WHERE book = ?", (book,))
+            self._bump_version()
+
+    def corpus_version(self) -> tuple[int, int | None]:
+        """Current corpus version and the pid of the process that last changed it."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT version, writer_pid FROM corpus WHERE id = 1"
+            ).fetchone()
+
+    def reset(self) -> None:
+        """Forget every generation after the collection was reset."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM generations")
+            self._bump_version()
+
+    def _bump_version(self) -> None:
+        self._conn.execute(
+            "UPDATE corpus SET version = version + 1, writer_pid = ? WHERE id = 1", (os.getpid(),)
+        )
+
+    def retired(self, book: str) -> list[str]:
+        return self._ids(book, "state = 'retired'")
+
+    def live(self, book: str) -> list[str]:
+        """The active generation and any still staging."""
+        return self._ids(book, "state != 'retired'")
+
+    def _ids(self, book: str, condition: str) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM generations WHERE book = ? AND {condition} ORDER BY created_at",
+                (book,),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+
+_registry: GenerationRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> GenerationRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = GenerationRegistry()
+        return _registry
+
+
+def hidden_generations() -> list[str]:
+    return get_registry().hidden()
+
+
+def collect_garbage(book: str | None = None) -> int:
+    """Delete chunks of retired generations. Returns how many books were cleaned.
+
+    Everything of the book outside its active (or a staging) generation is
+    removed, which also covers chunks written before generations existed. The
+    PDF page cache of source files only retired generations came from goes too.
+    """
+    from rpg_rules_ai.extraction import discard_page_cache
+    from rpg_rules_ai.ingest import delete_book_chunks
+
+    registry = get_registry()
+    books = [book] if book is not None else registry.books_with_retired()
+    cleaned = 0
+    for name in books:
+        with registry.lock(name):
+            active = registry.active(name)
+            if active is None:
+                continue
+            retired = registry.retired(name)
+            delete_book_chunks(name, where={"generation": {"$nin": registry.live(name)}})
+            discard_page_cache(registry.orphaned_sources(retired))
+            registry.forget(retired)
+        cleaned += 1
+    return cleaned
@@ -1,19 +1,28 @@
+import asyncio
 import json
+import logging
 import os
 import re
 from difflib import SequenceMatcher
+from functools import wraps
 from html import escape as html_escape
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
 
 from rpg_rules_ai.config import settings
+from rpg_rules_ai.context_packing import pack_context
+from rpg_rules_ai import tracing
+from rpg_rules_ai.metrics import CITATION_RETRIES, record_cache_hit, timed_stage
 from rpg_rules_ai.prompts import get_rag_prompt
-from rpg_rules_ai.schemas import AnswerWithSources, State
+from rpg_rules_ai.providers import get_chat_model
+from rpg_rules_ai.rerank import rerank_documents
+from rpg_rules_ai.schemas import AnswerWithSources, Question, Questions, State
 from rpg_rules_ai.strategies import get_strategy
 
+logger = logging.getLogger(__name__)
+
 MAX_HISTORY_PAIRS = 20
 
 _REWRITE_PROMPT = (
@@ -189,7 +198,7 @@ def _setup_langsmith():
 
 
 def _get_llm():
-    return ChatOpenAI(model=settings.llm_model, temperature=0)
+    return get_chat_model(model=settings.llm_model, temperature=0)
 
 
 def _get_recent_history(
@@ -232,53 +241,127 @@ def _format_history_for_prompt(pairs: list[tuple[str, str]]) -> str:
     return "\n".join(lines)
 
 
+def _is_near_identical(a: str, b: str) -> bool:
+    """Check whether two questions are equal up to case, whitespace and small edits."""
+    a_norm = " ".join(a.lower().split())
+    b_norm = " ".join(b.lower().split())
+    if a_norm == b_norm:
+        return True
+    ratio = SequenceMatcher(None, a_norm, b_norm, autojunk=False).ratio()
+    return ratio >= settings.speculative_similarity_threshold
+
+
+async def _cancel_speculative(task: asyncio.Task) -> None:
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as exc:
+        logger.debug("Speculative retrieval failed before cancellation: %s", exc)
+
+
 async def rewrite(state: State):
-    """Rewrite the user question using chat history for standalone context."""
+    """Rewrite the user question using chat history for standalone context.
+
+    With speculative retrieval enabled, retrieval for the raw question runs
+    concurrently with the rewrite LLM call. Its results are reused when the
+    rewritten question is near-identical to the raw one, and cancelled otherwise.
+
+    Hop records from the previous turn are cleared, since only the multi-hop
+    strategy writes them.
+    """
     current_question = state["messages"][-1].content
     pairs = _get_recent_history(state["messages"])
 
     if not pairs:
-        return {"main_question": current_question}
+        return {"main_question": current_question, "speculative_hit": False, "retrieval_hops": []}
+
+    speculative: asyncio.Task | None = None
+    if settings.enable_speculative_retrieval:
+        speculative = asyncio.create_task(
+            retrieve_with_strategy({**state, "main_question": current_question})
+        )
 
     history_text = _format_history_for_prompt(pairs)
-    llm = ChatOpenAI(model=settings.context_model, temperature=0)
-    result = await llm.ainvoke([
-        SystemMessage(content=_REWRITE_PROMPT),
-        HumanMessage(content=f"Conversation history:\n{history_text}\n\nFollow-up question: {current_question}"),
-    ])
-    rewritten = result.content.strip()
-    return {"main_question": rewritten or current_question}
+    llm = get_chat_model(model=settings.context_model, temperature=0)
+    try:
+        with timed_stage("rewrite"):
+            result = await llm.ainvoke([
+                SystemMessage(content=_REWRITE_PROMPT),
+                HumanMessage(content=f"Conversation history:\n{history_text}\n\nFollow-up question: {current_question}"),
+            ])
+    except BaseException:
+        if speculative is not None:
+            await _cancel_speculative(speculative)
+        raise
+    rewritten = result.content.strip() or current_question
+
+    if speculative is not None:
+        if _is_near_identical(rewritten, current_question):
+            try:
+                retrieved = await speculative
+            except Exception as exc:
+                logger.warning("Speculative retrieval failed, retrieving again: %s", exc)
+            else:
+                record_cache_hit("speculative_retrieval")
+                return {
+                    "retrieval_hops": [],
+                    **retrieved,
+                    "main_question": rewritten,
+                    "speculative_hit": True,
+                }
+        else:
+            await _cancel_speculative(speculative)
+
+    return {"main_question": rewritten, "speculative_hit": False, "retrieval_hops": []}
+
+
+def _route_after_rewrite(state: State) -> str:
+    return "rerank" if state.get("speculative_hit") else "retrieve"
 
 
 async def retrieve_with_strategy(state: State):
     strategy = get_strategy()
-    return await strategy.execute(state)
+    with tracing.span(f"strategy:{settings.retrieval_strategy}"):
+        return await strategy.execute(state)
+
+
+async def rerank(state: State):
+    """Keep the parents that best match the main question within a token budget.
+
+    The kept parents go, in rank order, into the first question's context; the
+    other sub-questions keep their text but lose their context.
+    """
+    if not settings.enable_rerank:
+        return {}
+
+    all_docs = [doc for q in state["questions"].questions for doc in q.context]
+    kept = rerank_documents(state["main_question"], all_docs, settings.rerank_max_tokens)
+    questions = [
+        Question(question=q.question, context=kept if i == 0 else [])
+        for i, q in enumerate(state["questions"].questions)
+    ]
+    return {"questions": Questions(questions=questions)}
 
 
 async def generate(state: State):
     llm = _get_llm()
     prompt = get_rag_prompt()
 
-    seen = set()
+    docs = [doc for question in state["questions"].questions for doc in question.context]
+    packed = pack_context(
+        docs, settings.context_max_tokens, settings.context_passage_max_tokens
+    )
     blocks = []
     context_map: dict[int, str] = {}
     doc_ids: list[str] = []
-    idx = 1
-    for question in state["questions"].questions:
-        for doc in question.context:
-            text = doc.metadata.get("original_text", doc.page_content)
-            key = (doc.metadata.get("book", ""), text)
-            if key in seen:
-                continue
-            seen.add(key)
-            blocks.append(
-                f"[{idx}] Source: {doc.metadata['book']}\n{text}"
-            )
-            context_map[idx] = text
-            doc_id = doc.metadata.get("doc_id", "")
-            if doc_id and doc_id not in doc_ids:
-                doc_ids.append(doc_id)
-            idx += 1
+    for idx, (doc, text) in enumerate(packed, start=1):
+        blocks.append(f"[{idx}] Source: {doc.metadata['book']}\n{text}")
+        context_map[idx] = text
+        doc_id = doc.metadata.get("doc_id", "")
+        if doc_id and doc_id not in doc_ids:
+            doc_ids.append(doc_id)
     docs_content = "\n---\n".join(blocks)
 
     prompt_messages = await prompt.ainvoke(
@@ -301,12 +384,16 @@ async def generate(state: State):
         all_messages = prompt_messages
 
     structured_llm = llm.with_structured_output(AnswerWithSources)
-    response = await structured_llm.ainvoke(all_messages)
-    response = _ground_citations(response, context_map)
-    response = _validate_citations(response)
+    with timed_stage("generation", passages=len(packed)):
+        response = await structured_llm.ainvoke(all_messages)
+    with timed_stage("grounding"):
+        response = _ground_citations(response, context_map)
+        response = _validate_citations(response)
 
     # Retry once if context was available but no citations survived
+    retried = False
     if context_map and not _has_valid_citations(response):
+        retried = True
         base_messages = (
             all_messages if isinstance(all_messages, list)
             else all_messages.to_messages() if hasattr(all_messages, "to_messages")
@@ -315,30 +402,52 @@ async def generate(state: State):
         retry_messages = base_messages + [
             HumanMessage(content=_CITATION_RETRY_MESSAGE)
         ]
-        response = await structured_llm.ainvoke(retry_messages)
-        response = _ground_citations(response, context_map)
-        response = _validate_citations(response)
+        with timed_stage("generation", passages=len(packed), citation_retry=True):
+            response = await structured_llm.ainvoke(retry_messages)
+        with timed_stage("grounding", citation_retry=True):
+            response = _ground_citations(response, context_map)
+            response = _validate_citations(response)
 
     # Fallback if retry also failed
     if context_map and not _has_valid_citations(response):
         response = {**_NO_CITED_ANSWER_FALLBACK}
+        CITATION_RETRIES.inc(outcome="fallback")
+    elif retried:
+        CITATION_RETRIES.inc(outcome="recovered")
 
     response = _enrich_citations_with_context(response, context_map)
     response["doc_ids"] = doc_ids
+    response["hops"] = state.get("retrieval_hops") or []
 
     return {"answer": response, "messages": [AIMessage(content=json.dumps(response))]}
 
 
-def build_graph():
+def _traced_node(name: str, node):
+    """Wrap a graph node in a trace span; a no-op unless a trace is collected."""
+
+    @wraps(node)
+    async def wrapper(state: State):
+        with tracing.span(f"node:{name}"):
+            return await node(state)
+
+    return wrapper
+
+
+def build_graph(checkpointer=None):
+    """Compile the answer graph. Without a checkpointer, conversations live in memory."""
     _setup_langsmith()
 
     graph_builder = StateGraph(State)
-    graph_builder.add_node("rewrite", rewrite)
-    graph_builder.add_node("retrieve", retrieve_with_strategy)
-    graph_builder.add_node("generate", generate)
+    graph_builder.add_node("rewrite", _traced_node("rewrite", rewrite))
+    graph_builder.add_node("retrieve", _traced_node("retrieve", retrieve_with_strategy))
+    graph_builder.add_node("rerank", _traced_node("rerank", rerank))
+    graph_builder.add_node("generate", _traced_node("generate", generate))
     graph_builder.add_edge(START, "rewrite")
-    graph_builder.add_edge("rewrite", "retrieve")
-    graph_builder.add_edge("retrieve", "generate")
+    graph_builder.add_conditional_edges(
+        "rewrite", _route_after_rewrite, ["retrieve", "rerank"]
+    )
+    graph_builder.add_edge("retrieve", "rerank")
+    graph_builder.add_edge("rerank", "generate")
     graph_builder.add_edge("generate", END)
 
-    return graph_builder.compile(checkpointer=MemorySaver())
+    return graph_builder.compile(checkpointer=checkpointer or MemorySaver())
@@ -4,47 +4,104 @@ import logging
 from pathlib import Path
 
 from rpg_rules_ai.config import settings
+from rpg_rules_ai.extraction import EXTRACTED_SUFFIX
 from rpg_rules_ai.retriever import get_docstore, get_vectorstore
 
 logger = logging.getLogger(__name__)
 
+SOURCE_SUFFIXES = (".md", ".pdf")
+
+
+def is_source_file(path: Path) -> bool:
+    """Whether `path` names an ingestible book: .md or .pdf, not an extraction cache."""
+    return path.suffix.lower() in SOURCE_SUFFIXES and not path.name.endswith(EXTRACTED_SUFFIX)
+
+
+def source_files(directory: Path) -> list[Path]:
+    return sorted(p for p in directory.iterdir() if p.is_file() and is_source_file(p))
+
 
 def delete_book(book_name: str) -> None:
-    """Remove all chunks for a book from vectorstore and docstore.
+    """Remove all chunks for a book from vectorstore and docstore, and its cached PDF pages.
 
-    Idempotent: no error if the book doesn't exist.
+    Idempotent: no error if the book doesn't exist. Waits for an ingest or
+    garbage collection of the book in any server process to finish first.
     Does NOT delete the source file from SOURCES_DIR.
     """
+    from rpg_rules_ai.extraction import discard_page_cache
+    from rpg_rules_ai.generations import get_registry
+
+    registry = get_registry()
+    with registry.lock(book_name):
+        parent_count = delete_book_chunks(book_name)
+
+        # Clean entity index
+        try:
+            from rpg_rules_ai.entity_index import EntityIndex
+            entity_idx = EntityIndex()
+            try:
+                entity_idx.delete_book_entities(book_name)
+            finally:
+                entity_idx.close()
+        except Exception as exc:
+            logger.warning("Failed to clean entity index for '%s': %s", book_name, exc)
+
+        discard_page_cache(registry.orphaned_sources(registry.live(book_name) + registry.retired(book_name)))
+        registry.forget_book(book_name)
+
+    logger.info("Deleted book '%s' from index (%d parent chunks).", book_name, parent_count)
+
+
+def delete_book_chunks(book_name: str, where: dict | None = None) -> int:
+    """Remove a book's children matching `where`, their parents and their entity mentions.
+
+    Returns the number of parent chunks removed.
+    """
     vs = get_vectorstore()
     collection = vs._collection
+    condition = {"book": book_name} if where is None else {"$and": [{"book": book_name}, where]}
 
     # Collect parent doc_ids from children before deleting
-    result = collection.get(where={"book": book_name}, include=["metadatas"])
+    result = collection.get(where=condition, include=["metadatas"])
     parent_ids = {
         m.get("doc_id")
         for m in result["metadatas"]
         if m.get("doc_id")
     }
 
-    collection.delete(where={"book": book_name})
+    collection.delete(where=condition)
+
+    record_ids = result.get("ids") or []
+    if record_ids:
+        try:
+            from rpg_rules_ai.near_duplicates import get_near_duplicate_index
+            get_near_duplicate_index().forget(record_ids)
+        except Exception as exc:
+            logger.warning("Failed to clean near-duplicate index for '%s': %s", book_name, exc)
+
+    if parent_ids and where is not None:
+        # doc_ids are content-derived, so the book's other generations may
+        # share parents (and their entity mentions) with the deleted children
+        remaining = collection.get(where={"book": book_name}, include=["metadatas"])
+        parent_ids -= {m.get("doc_id") for m in remaining["metadatas"]}
 
     if parent_ids:
         docstore = get_docstore()
         for pid in parent_ids:
             docstore.mdelete([pid])
 
-    # Clean entity index
-    try:
-        from rpg_rules_ai.entity_index import EntityIndex
-        entity_idx = EntityIndex()
-        try:
-            entity_idx.delete_book_entities(book_name)
-        finally:
-            entity_idx.close()
-    except Exception as exc:
-        logger.warning("Failed to clean entity index for '%s': %s", book_name, exc)
+        if where is not None:
+            try:
+                from rpg_rules_ai.entity_index import EntityIndex
+                entity_idx = EntityIndex()
+                try:
+                    entity_idx.delete_chunk_mentions(sorted(parent_ids))
+                finally:
+                    entity_idx.close()
+            except Exception as exc:
+                logger.warning("Failed to clean entity mentions for '%s': %s", book_name, exc)
 
-    logger.info("Deleted book '%s' from index (%d parent chunks).", book_name, len(parent_ids))
+    return len(parent_ids)
 
 
 def _get_all_metadatas() -> list[dict]:
@@ -117,7 +174,10 @@ def get_indexed_books() -> list[str]:
 
 
 def reindex_directory(directory: str | Path) -> int:
-    """Clear the collection and re-ingest all .md files from directory.
+    """Clear the collection and re-ingest all .md and .pdf files from directory.
+
+    The state describing the old chunks goes with them: ingest checkpoints,
+    the generation registry and the near-duplicate index.
 
     Returns total number of documents ingested via the layered pipeline.
     """
@@ -126,11 +186,20 @@ def reindex_directory(directory: str | Path) -> int:
     directory = Path(directory)
     if not directory.is_dir():
         raise FileNotFoundError(f"Directory not found: {directory}")
-    md_files = sorted(directory.glob("*.md"))
+    files = source_files(directory)
 
-    vs = get_vectorstore()
-    vs.reset_collection()
+    from rpg_rules_ai.checkpoints import discard_all_checkpoints
+    from rpg_rules_ai.generations import get_registry
+    from rpg_rules_ai.near_duplicates import get_near_duplicate_index
+
+    registry = get_registry()
+    with registry.lock():
+        vs = get_vectorstore()
+        vs.reset_collection()
+        discard_all_checkpoints()
+        get_near_duplicate_index().clear()
+        registry.reset()
 
-    result = run_layered_pipeline(md_files, replace=False)
+    result = run_layered_pipeline(files, replace=False)
     success_count = sum(1 for r in result.get("file_results", []) if r["status"] == "success")
     return success_count
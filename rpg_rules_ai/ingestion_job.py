@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import threading
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Literal
@@ -8,31 +9,38 @@ from typing import Literal
 
 @dataclass
 class IngestionJob:
-    """Wraps layered ingestion pipeline in a background thread with thread-safe progress."""
+    """Runs the layered ingestion pipeline for one job with thread-safe progress.
+
+    The job queue calls `run` on its own worker threads, passing `on_update` to
+    persist each progress snapshot and `should_cancel` to stop between files.
+    """
 
     paths: list[Path]
     replace: bool = False
+    should_cancel: Callable[[], bool] | None = None
+    on_update: Callable[[dict], None] | None = None
     _progress: dict = field(default_factory=lambda: {
         "status": "pending",
         "phase": "",
         "phase_completed": 0,
         "phase_total": 0,
         "file_results": [],
+        "file_stats": [],
+        "stage_totals": {},
+        "current_file": None,
+        "pages_completed": 0,
+        "pages_total": 0,
         "error": None,
     })
     _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
-    _thread: threading.Thread | None = field(default=None, repr=False)
-
-    def start(self) -> None:
-        self._progress["status"] = "running"
-        self._thread = threading.Thread(target=self._run, daemon=True)
-        self._thread.start()
 
     def _on_progress(self, update: dict) -> None:
         with self._lock:
             self._progress.update(update)
+        if self.on_update is not None:
+            self.on_update(update)
 
-    def _run(self) -> None:
+    def run(self) -> None:
         from rpg_rules_ai.pipeline import run_layered_pipeline
 
         try:
@@ -40,6 +48,7 @@ class IngestionJob:
                 self.paths,
                 replace=self.replace,
                 on_progress=self._on_progress,
+                should_cancel=self.should_cancel,
             )
             with self._lock:
                 self._progress.update(result)
@@ -0,0 +1,338 @@
+"""SQLite-backed ingestion job queue with a bounded worker pool.
+
+Jobs survive restarts: progress and a per-file checkpoint are written to
+SQLite as the pipeline runs. On startup, jobs left running by a crash go back
+to pending; when picked up again, finished files are skipped and the book that
+was mid-ingest resumes from its pipeline checkpoint (see checkpoints.py).
+
+Several server processes can share one queue file: claims run in a
+BEGIN IMMEDIATE transaction, so each job goes to exactly one process, and a
+running job is only requeued once the process that claimed it is gone.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from rpg_rules_ai.config import settings
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("done", "error", "cancelled")
+
+SCHEMA_SQL = """\
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    paths TEXT NOT NULL,
+    replace INTEGER NOT NULL,
+    progress TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error_message TEXT,
+    PRIMARY KEY (job_id, filename)
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, seq);
+"""
+
+
+def _initial_progress(status: str = "pending") -> dict:
+    return {
+        "status": status,
+        "phase": "",
+        "phase_completed": 0,
+        "phase_total": 0,
+        "file_results": [],
+        "file_stats": [],
+        "stage_totals": {},
+        "current_file": None,
+        "pages_completed": 0,
+        "pages_total": 0,
+        "error": None,
+    }
+
+
+@dataclass
+class QueuedJob:
+    """A claimed job plus the file results of a previous, interrupted run."""
+
+    id: str
+    paths: list[Path]
+    replace: bool
+    file_results: list[dict] = field(default_factory=list)
+
+    @property
+    def completed_files(self) -> set[str]:
+        return {r["filename"] for r in self.file_results}
+
+
+class JobQueue:
+    """Persistent FIFO of ingestion jobs. Safe to share between threads."""
+
+    def __init__(self, db_path: str | Path | None = None):
+        if db_path is None:
+            db_path = settings.job_queue_path
+        self._db_path = str(db_path)
+        Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+        if columns and "owner_pid" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+        self._conn.executescript(SCHEMA_SQL)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, paths: list[Path], replace: bool = False) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, paths, replace, progress, created_at) "
+                "VALUES (?, 'pending', ?, ?, ?, ?)",
+                (
+                    job_id,
+                    json.dumps([str(p) for p in paths]),
+                    int(replace),
+                    json.dumps(_initial_progress()),
+                    time.time(),
+                ),
+            )
+        return job_id
+
+    def claim(self, max_running: int | None = None) -> QueuedJob | None:
+        """Mark the oldest pending job as running and return it.
+
+        `max_running` caps running jobs across every process sharing the queue.
+        """
+        with self._lock, self._conn:
+            # Take the write lock before reading, so two processes can't claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            if max_running is not None:
+                running = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'running'"
+                ).fetchone()[0]
+                if running >= max_running:
+                    return None
+            row = self._conn.execute(
+                "SELECT id, paths, replace FROM jobs WHERE status = 'pending' ORDER BY seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, paths, replace = row
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', owner_pid = ? WHERE id = ?",
+                (os.getpid(), job_id),
+            )
+            files = self._conn.execute(
+                "SELECT filename, status, error_message FROM job_files WHERE job_id = ? ORDER BY rowid",
+                (job_id,),
+            ).fetchall()
+        return QueuedJob(
+            id=job_id,
+            paths=[Path(p) for p in json.loads(paths)],
+            replace=bool(replace),
+            file_results=[
+                {"filename": f, "status": s, "error_message": e} for f, s, e in files if s != "running"
+            ],
+        )
+
+    def update_progress(self, job_id: str, progress: dict) -> None:
+        """Persist a progress snapshot and checkpoint its per-file results."""
+        files = [(r["filename"], r["status"], r.get("error_message")) for r in progress["file_results"]]
+        if progress.get("current_file"):
+            files.append((progress["current_file"], "running", None))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_files (job_id, filename, status, error_message) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (job_id, filename) DO UPDATE SET "
+                "status = excluded.status, error_message = excluded.error_message",
+                [(job_id, *f) for f in files],
+            )
+
+    def finish(self, job_id: str, status: str, progress: dict) -> None:
+        self.update_progress(job_id, {
+            **progress, "status": status, "current_file": None, "pages_completed": 0, "pages_total": 0,
+        })
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                (status, time.time(), job_id),
+            )
+
+    def get_progress(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, progress FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(f"Job not found: {job_id}")
+        status, progress = row
+        return {**json.loads(progress), "status": status}
+
+    def request_cancel(self, job_id: str) -> str:
+        """Cancel a pending job now, or ask a running one to stop after its current file.
+
+        Returns the job status after the request.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Job not found: {job_id}")
+            status = row[0]
+            if status in FINISHED_STATUSES:
+                raise ValueError(f"Job already finished: {job_id} ({status})")
+            if status == "pending":
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                    (time.time(), job_id),
+                )
+                return "cancelled"
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return status
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def count_active(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+            ).fetchone()[0]
+
+    def recover(self) -> int:
+        """Requeue jobs left running by a process that no longer exists. Returns how many."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, owner_pid FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            orphaned = [(job_id,) for job_id, pid in rows if not _process_alive(pid)]
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'pending', owner_pid = NULL WHERE id = ?", orphaned
+            )
+        return len(orphaned)
+
+    def evict(self, keep: int) -> int:
+        """Delete finished jobs beyond the `keep` most recent. Returns how many."""
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        with self._lock, self._conn:
+            return self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND seq NOT IN ("
+                f"SELECT seq FROM jobs WHERE status IN ({placeholders}) ORDER BY seq DESC LIMIT ?)",
+                (*FINISHED_STATUSES, *FINISHED_STATUSES, keep),
+            ).rowcount
+
+
+def _process_alive(pid: int | None) -> bool:
+    if pid is None or pid == os.getpid():
+        # A job this process claims is never left over from a previous run of it
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobWorkerPool:
+    """Fixed number of threads draining a JobQueue in FIFO order.
+
+    `workers` is also the cap on running jobs across all processes sharing
+    the queue, so N server processes don't run N times as many ingests.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int = 1, poll_interval: float = 1.0):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info("Resuming %d interrupted ingestion job(s)", recovered)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self) -> None:
+        """Wake idle workers after a job is enqueued."""
+        self._wake.set()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads.clear()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            job = self.queue.claim(max_running=self.workers)
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: QueuedJob) -> None:
+        from rpg_rules_ai.ingestion_job import IngestionJob
+
+        previous = job.file_results
+        done = job.completed_files
+
+        def merged(progress: dict) -> dict:
+            result = {**progress, "file_results": previous + progress["file_results"]}
+            if progress["phase"] == "ingesting":
+                result["phase_completed"] = progress["phase_completed"] + len(done)
+                result["phase_total"] = len(job.paths)
+            return result
+
+        try:
+            runner = IngestionJob(
+                paths=[p for p in job.paths if p.name not in done],
+                replace=job.replace,
+                should_cancel=lambda: self.queue.cancel_requested(job.id),
+                on_update=lambda progress: self.queue.update_progress(job.id, merged(progress)),
+            )
+            runner.run()
+            final = merged(runner.get_progress())
+            self.queue.finish(job.id, final["status"], final)
+        except Exception as exc:
+            logger.exception("Ingestion job %s failed", job.id)
+            self.queue.finish(job.id, "error", {**_initial_progress("error"), "file_results": previous, "error": str(exc)})
+        self.queue.evict(settings.job_history_limit)
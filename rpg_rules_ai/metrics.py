@@ -0,0 +1,410 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+A small, dependency-free subset of the Prometheus client: counters, gauges
+(optionally computed at scrape time) and histograms with labels. /metrics
+renders REGISTRY; any Prometheus-compatible scraper can collect it, but
+nothing here requires one.
+
+Values live in the process that records them. With several server workers,
+each one periodically writes its counters and histograms to a snapshot file
+in a shared directory (METRICS_DIR), and /metrics sums the snapshots of the
+live processes, so a scrape gives the same totals whichever worker answers.
+Gauges are computed at scrape time from shared state and are not summed.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from rpg_rules_ai import tracing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Metric:
+    kind = ""
+    # Summed over every process's snapshot by Registry.render(directory)
+    aggregated = False
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> list:
+        """This process's values in a JSON-friendly form, for aggregated metrics."""
+        raise NotImplementedError
+
+    def _merged_samples(self, snapshots: list[list]) -> list[str]:
+        raise NotImplementedError
+
+    def render(self, snapshots: list[list] | None = None) -> str:
+        """Render this process's values, or the sum of `snapshots` when given."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples() if snapshots is None else self._merged_samples(snapshots))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+    aggregated = True
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._format(items)
+
+    def _format(self, items: list[tuple[LabelValues, float]]) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), v] for key, v in self._values.items()]
+
+    def _merged_samples(self, snapshots: list[list]) -> list[str]:
+        merged: dict[LabelValues, float] = {}
+        for snapshot in snapshots:
+            for key, v in snapshot:
+                merged[tuple(key)] = merged.get(tuple(key), 0.0) + v
+        return self._format(sorted(merged.items()))
+
+
+class Gauge(_Metric):
+    """Gauge with set/inc/dec, or computed by a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: Callable[[], float] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+        self._function = function
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: Any) -> float:
+        if self._function is not None:
+            return float(self._function())
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(float(self._function()))}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    aggregated = True
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (per-bucket counts, sum, count)
+        self._values: dict[LabelValues, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the wall time of a block, including when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+        return self._format(items)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), list(c), s, n] for key, (c, s, n) in self._values.items()]
+
+    def _merged_samples(self, snapshots: list[list]) -> list[str]:
+        merged: dict[LabelValues, tuple[list[int], float, int]] = {}
+        for snapshot in snapshots:
+            for key, counts, total, count in snapshot:
+                if len(counts) != len(self.buckets):
+                    continue  # written with other buckets by an older version
+                old_counts, old_total, old_count = merged.get(
+                    tuple(key), ([0] * len(self.buckets), 0.0, 0)
+                )
+                merged[tuple(key)] = (
+                    [a + b for a, b in zip(old_counts, counts)],
+                    old_total + total,
+                    old_count + count,
+                )
+        return self._format(sorted(merged.items()))
+
+    def _format(self, items: list[tuple[LabelValues, tuple[list[int], float, int]]]) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self, directory: str | Path | None = None) -> str:
+        """Render every metric, summed over the live processes' snapshots in `directory`.
+
+        This process's snapshot is written first, so its own values are current.
+        Snapshots of processes that have exited are removed, which Prometheus
+        sees as a counter reset.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        if directory is None:
+            return "\n".join(m.render() for m in metrics) + "\n"
+        self.write_snapshot(directory)
+        snapshots: dict[str, list[list]] = {}
+        for path in Path(directory).glob("*.json"):
+            if not path.stem.isdigit():
+                continue
+            if not _process_alive(int(path.stem)):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            for name, snapshot in data.items():
+                snapshots.setdefault(name, []).append(snapshot)
+        return "\n".join(
+            m.render(snapshots.get(m.name, [])) if m.aggregated else m.render() for m in metrics
+        ) + "\n"
+
+    def write_snapshot(self, directory: str | Path) -> None:
+        """Write this process's counters and histograms to <directory>/<pid>.json."""
+        with self._lock:
+            metrics = [m for m in self._metrics.values() if m.aggregated]
+        data = {m.name: m.snapshot() for m in metrics}
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f".{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, directory / f"{os.getpid()}.json")
+
+
+REGISTRY = Registry()
+
+ASK_SECONDS = REGISTRY.register(Histogram(
+    "rpg_ask_seconds", "Total /ask latency", buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rpg_query_stage_seconds",
+    "Latency of query path stages (rewrite, expansion, entity_lookup, analyzer, generation, grounding)",
+    ("stage",),
+))
+HOP_SECONDS = REGISTRY.register(Histogram(
+    "rpg_retrieval_hop_seconds", "Latency of each retrieval hop", ("strategy", "hop"),
+))
+LLM_CALLS = REGISTRY.register(Counter("rpg_llm_calls_total", "Chat model calls", ("model",)))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "rpg_llm_tokens_total", "Chat model tokens as reported by the provider", ("model", "kind"),
+))
+EMBEDDING_CALLS = REGISTRY.register(Counter(
+    "rpg_embedding_calls_total", "Embedding API calls", ("operation",),
+))
+EMBEDDING_TEXTS = REGISTRY.register(Counter(
+    "rpg_embedding_texts_total", "Texts sent for embedding", ("operation",),
+))
+CACHE_HITS = REGISTRY.register(Counter("rpg_cache_hits_total", "Cache hits", ("cache",)))
+HOPS_TAKEN = REGISTRY.register(Counter(
+    "rpg_retrieval_hops_total", "Retrieval hops taken", ("strategy",),
+))
+HOP_STOPS = REGISTRY.register(Counter(
+    "rpg_multi_hop_stops_total", "Why multi-hop retrieval stopped", ("reason",),
+))
+CITATION_RETRIES = REGISTRY.register(Counter(
+    "rpg_citation_retries_total",
+    "Generate retries for missing citations, by outcome (recovered or fallback)",
+    ("outcome",),
+))
+ACTIVE_JOBS = REGISTRY.register(Gauge("rpg_ingest_jobs_active", "Ingestion jobs pending or running"))
+CHECKPOINTER_THREADS = REGISTRY.register(Gauge(
+    "rpg_checkpointer_threads", "Conversation threads held by the graph checkpointer",
+))
+
+
+@contextmanager
+def timed_stage(stage: str, **attributes: Any) -> Iterator[tracing.Span | None]:
+    """Time a query-path stage into STAGE_SECONDS and, when tracing, a span."""
+    with STAGE_SECONDS.time(stage=stage), tracing.span(stage, **attributes) as span:
+        yield span
+
+
+def record_cache_hit(cache: str) -> None:
+    CACHE_HITS.inc(cache=cache)
+    tracing.record_cache_hit(cache)
+
+
+def record_llm_usage(model: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    LLM_CALLS.inc(model=model)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+    tracing.record_llm(model, prompt_tokens, completion_tokens)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Counts chat model calls and provider-reported token usage."""
+
+    # Inline so usage lands on the caller's trace span, not an executor thread's
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not (prompt_tokens or completion_tokens):
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+        record_llm_usage(self.model, prompt_tokens, completion_tokens)
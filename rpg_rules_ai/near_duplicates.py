@@ -0,0 +1,211 @@
+"""Near-duplicate child chunks across books.
+
+Supplements reprint Basic Set text, so the same rule arrives as children of
+several books. Each child gets a MinHash signature over its word 3-grams
+(one-permutation hashing: one hash per 3-gram, the minimum kept per bin, empty
+bins filled from the next non-empty one), and a local LSH index (SQLite,
+banded signatures) finds stored children whose estimated Jaccard similarity
+reaches NEAR_DUPLICATE_THRESHOLD. A near
+duplicate reuses the embedding of the child it matches instead of being sent
+to the embeddings API, and is stored with metadata["dup_group"], shared by
+every copy of the text, so retrieval can collapse them (see retriever.py).
+
+The index only points at vector store records: a batch is indexed after it is
+stored, and entries whose record is gone (e.g. garbage-collected generations)
+are dropped when a lookup misses them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import struct
+import threading
+from pathlib import Path
+
+from rpg_rules_ai.config import settings
+
+SIGNATURE_SIZE = 64
+BANDS = 8  # of SIGNATURE_SIZE // BANDS rows: candidates from about 0.77 similarity
+SHINGLE_WORDS = 3
+
+_BIN_BITS = SIGNATURE_SIZE.bit_length() - 1
+_ROWS = SIGNATURE_SIZE // BANDS
+_SIGNATURE_FORMAT = f"<{SIGNATURE_SIZE}Q"
+_WORD = re.compile(r"\w+")
+
+SCHEMA_SQL = """\
+CREATE TABLE IF NOT EXISTS signatures (
+    record_id TEXT PRIMARY KEY,
+    book TEXT NOT NULL,
+    dup_group TEXT NOT NULL,
+    signature BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS bands (
+    bucket INTEGER NOT NULL,
+    record_id TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands(bucket);
+CREATE INDEX IF NOT EXISTS idx_bands_record ON bands(record_id);
+"""
+
+
+def minhash(text: str) -> tuple[int, ...] | None:
+    """MinHash signature of the text's word 3-grams (case-folded), or None if it has no words."""
+    words = _WORD.findall(text.casefold())
+    if not words:
+        return None
+    bins: list[int | None] = [None] * SIGNATURE_SIZE
+    for i in range(max(len(words) - SHINGLE_WORDS + 1, 1)):
+        shingle = " ".join(words[i : i + SHINGLE_WORDS]).encode("utf-8")
+        h = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+        b, value = h % SIGNATURE_SIZE, h >> _BIN_BITS
+        if bins[b] is None or value < bins[b]:
+            bins[b] = value
+    signature = []
+    for j in range(SIGNATURE_SIZE):
+        # Rotation densification: borrow from the next non-empty bin, tagged
+        # with the distance so borrowed values only match equally borrowed ones
+        k = 0
+        while bins[(j + k) % SIGNATURE_SIZE] is None:
+            k += 1
+        signature.append(bins[(j + k) % SIGNATURE_SIZE] | (k << (64 - _BIN_BITS)))
+    return tuple(signature)
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def _buckets(signature: tuple[int, ...]) -> list[int]:
+    """One LSH bucket per band; the band number is hashed in so bands never collide."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * _ROWS : (band + 1) * _ROWS]
+        digest = hashlib.blake2b(struct.pack(f"<Q{_ROWS}Q", band, *rows), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+class NearDuplicateIndex:
+    """SQLite LSH index from child signatures to their vector store records."""
+
+    def __init__(self, db_path: str | Path | None = None):
+        if db_path is None:
+            db_path = settings.near_duplicate_index_path
+        self._db_path = str(db_path)
+        Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA_SQL)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def match(
+        self, entries: list[tuple[str, tuple[int, ...] | None]], threshold: float
+    ) -> list[tuple[str, str] | None]:
+        """Match a batch of (record_id, signature) without indexing it.
+
+        Returns, per entry, (record_id, dup_group) of the most similar child at
+        or above `threshold`, indexed before or earlier in the batch, or None.
+        Indexed records with an id from the batch are not candidates: a resumed
+        batch finds its own rows from before the crash. Entries without a
+        signature are never matched.
+        """
+        batch_ids = {record_id for record_id, _ in entries}
+        results: list[tuple[str, str] | None] = []
+        batch_buckets: dict[int, list[int]] = {}
+        seen: list[tuple[str, str, tuple[int, ...]]] = []
+        for record_id, signature in entries:
+            if signature is None:
+                results.append(None)
+                continue
+            buckets = _buckets(signature)
+            candidates = [
+                (r, g, struct.unpack(_SIGNATURE_FORMAT, blob))
+                for r, g, blob in self._candidates(buckets)
+                if r not in batch_ids
+            ]
+            for position in sorted({p for b in buckets for p in batch_buckets.get(b, ())}):
+                candidates.append(seen[position])
+            best: tuple[float, str, str] | None = None
+            for candidate_id, group, other in candidates:
+                score = similarity(signature, other)
+                if score >= threshold and (best is None or score > best[0]):
+                    best = (score, candidate_id, group)
+            match = None if best is None else (best[1], best[2])
+            results.append(match)
+            for b in buckets:
+                batch_buckets.setdefault(b, []).append(len(seen))
+            seen.append((record_id, match[1] if match else record_id, signature))
+        return results
+
+    def _candidates(self, buckets: list[int]) -> list[tuple[str, str, bytes]]:
+        placeholders = ",".join("?" for _ in buckets)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT record_id, dup_group, signature FROM signatures WHERE record_id IN"
+                f" (SELECT DISTINCT record_id FROM bands WHERE bucket IN ({placeholders}))",
+                buckets,
+            ).fetchall()
+
+    def add(self, entries: list[tuple[str, str, tuple[int, ...] | None, str]]) -> None:
+        """Index (record_id, book, signature, dup_group) rows, once they are stored.
+
+        Re-adding a record replaces its row. Entries without a signature are skipped.
+        """
+        rows = [
+            (r, book, group, signature, _buckets(signature))
+            for r, book, signature, group in entries
+            if signature is not None
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM bands WHERE record_id = ?", [(r[0],) for r in rows]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO signatures (record_id, book, dup_group, signature)"
+                " VALUES (?, ?, ?, ?)",
+                [(r, book, group, struct.pack(_SIGNATURE_FORMAT, *sig)) for r, book, group, sig, _ in rows],
+            )
+            self._conn.executemany(
+                "INSERT INTO bands (bucket, record_id) VALUES (?, ?)",
+                [(b, r) for r, _, _, _, buckets in rows for b in buckets],
+            )
+
+    def forget(self, record_ids: list[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM bands WHERE record_id = ?", [(r,) for r in record_ids]
+            )
+            self._conn.executemany(
+                "DELETE FROM signatures WHERE record_id = ?", [(r,) for r in record_ids]
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bands")
+            self._conn.execute("DELETE FROM signatures")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+
+_index: NearDuplicateIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NearDuplicateIndex()
+        return _index
@@ -8,23 +8,98 @@ batches, never accumulated in memory.
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
-import uuid
-from collections.abc import Callable
+import time
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from typing import Literal
 
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
 
-from rpg_rules_ai.chunking import split_into_sections, split_parents_into_children, split_sections_into_parents
+from rpg_rules_ai.checkpoints import (
+    IngestCheckpoint,
+    file_sha256,
+    incomplete_books,
+    source_fingerprint,
+)
+from rpg_rules_ai.chunking import child_ids, iter_sections, split_into_sections, split_sections
 from rpg_rules_ai.config import settings
-from rpg_rules_ai.retriever import CHROMA_BATCH_LIMIT, get_docstore, get_vectorstore
+from rpg_rules_ai.generations import collect_garbage, get_registry
+from rpg_rules_ai.providers import get_embeddings
+from rpg_rules_ai.retriever import (
+    CHROMA_BATCH_LIMIT,
+    get_docstore,
+    get_vectorstore,
+    holding_vectorstore,
+)
+from rpg_rules_ai.tokens import count_tokens
 
 logger = logging.getLogger(__name__)
 
 EMBED_BATCH_SIZE = 500
+# OpenAI accepts 300k input tokens per embeddings request; the local count is an estimate
+EMBED_BATCH_MAX_TOKENS = 250_000
+EMBED_MAX_RETRIES = 3
+EMBED_RETRY_BACKOFF = 2.0  # seconds, doubled on each retry
+
+STAGES = ["parse", "split", "contextualize", "entities", "embed", "store"]
+
+
+@dataclass
+class StageStats:
+    """Counters for one pipeline stage. Token counts are local estimates."""
+
+    seconds: float = 0.0
+    items: int = 0
+    llm_calls: int = 0
+    embedding_calls: int = 0
+    retries: int = 0
+    tokens: int = 0
+    bytes_written: int = 0
+    embeddings_reused: int = 0
+
+    def add(self, other: StageStats) -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["seconds"] = round(self.seconds, 3)
+        return data
+
+
+@dataclass
+class FileStats:
+    """Per-stage instrumentation for a single ingested file."""
+
+    filename: str
+    bytes_read: int = 0
+    stages: dict[str, StageStats] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        """Time a block, accumulating into the named stage."""
+        stats = self.stages.setdefault(name, StageStats())
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - start
+
+    @property
+    def seconds(self) -> float:
+        return sum(s.seconds for s in self.stages.values())
+
+    def to_dict(self) -> dict:
+        return {
+            "filename": self.filename,
+            "bytes_read": self.bytes_read,
+            "seconds": round(self.seconds, 3),
+            "stages": {name: s.to_dict() for name, s in self.stages.items()},
+        }
 
 
 class PhaseProgress:
@@ -36,7 +111,11 @@ class PhaseProgress:
         self.phase_completed: int = 0
         self.phase_total: int = 0
         self.file_results: list[dict] = []
-        self.status: Literal["running", "done", "error"] = "running"
+        self.file_stats: list[FileStats] = []
+        self.current_file: str | None = None
+        self.pages_completed: int = 0
+        self.pages_total: int = 0
+        self.status: Literal["running", "done", "error", "cancelled"] = "running"
         self.error: str | None = None
 
     def start_phase(self, phase: str, total: int) -> None:
@@ -49,6 +128,12 @@ class PhaseProgress:
         self.phase_completed += count
         self._notify()
 
+    def report_pages(self, completed: int, total: int) -> None:
+        """Page progress of the PDF currently being extracted."""
+        self.pages_completed = completed
+        self.pages_total = total
+        self._notify()
+
     def record_file(self, filename: str, status: str, error_message: str | None = None) -> None:
         self.file_results.append({
             "filename": filename,
@@ -56,6 +141,18 @@ class PhaseProgress:
             "error_message": error_message,
         })
 
+    def start_file(self, filename: str, bytes_read: int = 0) -> FileStats:
+        stats = FileStats(filename=filename, bytes_read=bytes_read)
+        self.file_stats.append(stats)
+        return stats
+
+    def stage_totals(self) -> dict[str, dict]:
+        totals: dict[str, StageStats] = {}
+        for file_stats in self.file_stats:
+            for name, stats in file_stats.stages.items():
+                totals.setdefault(name, StageStats()).add(stats)
+        return {name: totals[name].to_dict() for name in STAGES if name in totals}
+
     def _notify(self) -> None:
         if self._callback:
             self._callback(self.to_dict())
@@ -67,6 +164,11 @@ class PhaseProgress:
             "phase_completed": self.phase_completed,
             "phase_total": self.phase_total,
             "file_results": list(self.file_results),
+            "file_stats": [s.to_dict() for s in self.file_stats],
+            "stage_totals": self.stage_totals(),
+            "current_file": self.current_file,
+            "pages_completed": self.pages_completed,
+            "pages_total": self.pages_total,
             "error": self.error,
         }
 
@@ -75,103 +177,246 @@ def run_layered_pipeline(
     paths: list[Path],
     replace: bool = False,
     on_progress: Callable | None = None,
+    should_cancel: Callable[[], bool] | None = None,
 ) -> dict:
     """Execute the ingestion pipeline, processing one file at a time.
 
     Each file goes through the full pipeline (parse → split → embed → store)
     before the next file starts. This bounds peak memory to a single file's
-    worth of data.
+    worth of data. `should_cancel` is checked between files; when it returns
+    True the run stops with status "cancelled".
     """
     progress = PhaseProgress(callback=on_progress)
 
-    try:
-        from rpg_rules_ai.ingest import delete_book, get_indexed_books
-
-        indexed = get_indexed_books()
-        progress.start_phase("ingesting", len(paths))
-
-        for path in paths:
-            book_name = path.name
-            try:
-                if book_name in indexed:
-                    if replace:
-                        delete_book(book_name)
-                    else:
+    # Writes stay on this process's Chroma client until the run ends
+    with holding_vectorstore():
+        try:
+            from rpg_rules_ai.ingest import get_indexed_books
+
+            _collect_garbage()
+            indexed = get_indexed_books()
+            incomplete = set(incomplete_books())
+            progress.start_phase("ingesting", len(paths))
+
+            for path in paths:
+                if should_cancel is not None and should_cancel():
+                    progress.status = "cancelled"
+                    break
+                book_name = path.name
+                try:
+                    # A book with a checkpoint was interrupted mid-ingest and is
+                    # resumed. With replace, the current version stays served until
+                    # the new generation is activated.
+                    if book_name in indexed and book_name not in incomplete and not replace:
                         progress.record_file(book_name, "skipped")
                         progress.advance()
                         continue
 
-                _process_single_file(path, book_name, progress)
-                progress.record_file(book_name, "success")
-            except Exception as exc:
-                logger.error("Failed to ingest '%s': %s", book_name, exc)
-                progress.record_file(book_name, "error", str(exc))
-            progress.advance()
-
-        progress.status = "done"
-        progress._notify()
-    except Exception as exc:
-        progress.status = "error"
-        progress.error = str(exc)
-        progress._notify()
-        raise
+                    progress.current_file = book_name
+                    progress._notify()
+                    # Another server process may be deleting or collecting this book
+                    with get_registry().lock(book_name):
+                        _process_single_file(path, book_name, progress)
+                    progress.record_file(book_name, "success")
+                except Exception as exc:
+                    logger.error("Failed to ingest '%s': %s", book_name, exc)
+                    progress.record_file(book_name, "error", str(exc))
+                progress.current_file = None
+                progress.pages_completed = progress.pages_total = 0
+                progress.advance()
+
+            if progress.status == "running":
+                progress.status = "done"
+            progress._notify()
+        except Exception as exc:
+            progress.status = "error"
+            progress.error = str(exc)
+            progress._notify()
+            raise
+        finally:
+            _log_stats(progress)
 
     return progress.to_dict()
 
 
+def _log_stats(progress: PhaseProgress) -> None:
+    for file_stats in progress.file_stats:
+        logger.info(
+            "Ingest stats for '%s': %.2fs, %s",
+            file_stats.filename,
+            file_stats.seconds,
+            ", ".join(
+                f"{name} {s.seconds:.2f}s/{s.items} items" for name, s in file_stats.stages.items()
+            ),
+        )
+    totals = progress.stage_totals()
+    if totals:
+        logger.info("Ingest stage totals: %s", json.dumps(totals))
+
+
 def _process_single_file(path: Path, book_name: str, progress: PhaseProgress) -> None:
-    """Run the full pipeline for a single file: parse → split → embed+store."""
-    # Parse
-    docs = _parse_file(path, book_name)
+    """Run the full pipeline for a single file: parse → split → embed+store.
+
+    Chunks are written under a new staging generation, activated only once
+    the book is fully stored; the previous generation is then collected.
+    Progress is checkpointed after split, contextualize, entities and every
+    stored embedding batch; a checkpoint left by an interrupted run for the
+    same file and chunking settings is resumed instead of starting over.
+    """
+    stats = progress.start_file(book_name, bytes_read=path.stat().st_size)
+    content_hash = file_sha256(path)
+    fingerprint = source_fingerprint(path, content_hash)
+    registry = get_registry()
+
+    checkpoint = IngestCheckpoint.load(book_name)
+    if checkpoint is not None and checkpoint.fingerprint != fingerprint:
+        from rpg_rules_ai.ingest import delete_book_chunks
+
+        logger.info("Source or chunking changed for '%s', discarding its checkpoint", book_name)
+        delete_book_chunks(book_name, where={"generation": checkpoint.generation})
+        registry.forget([checkpoint.generation])
+        checkpoint.clear()
+        checkpoint = None
+
+    if checkpoint is None:
+        # Parse
+        with stats.stage("parse") as parse_stage:
+            docs = _parse_file(path, book_name, on_pages=progress.report_pages)
+        progress._notify()
 
-    # Split
-    parents, children, parent_map = _split_docs(docs, book_name)
+        # Split. PDF sections are extracted lazily as the split consumes them;
+        # that time is counted as parse, not split
+        parse_seconds = parse_stage.seconds
+        with stats.stage("split") as stage:
+            parents, children, parent_map = _split_docs(
+                _staged(stats, "parse", docs), book_name, sectioned=_is_pdf(path)
+            )
+        stage.seconds -= parse_stage.seconds - parse_seconds
+        stage.items = len(children)
+        generation = registry.stage(book_name, source_hash=content_hash)
+        # Children take their metadata from their parent when built
+        for parent in parents:
+            parent.metadata["generation"] = generation
+        checkpoint = IngestCheckpoint.create(
+            book_name,
+            fingerprint,
+            generation,
+            parents,
+            children,
+            child_ids=child_ids(children),
+        )
+        progress._notify()
+    else:
+        logger.info(
+            "Resuming '%s' after %s (%d chunks stored)",
+            book_name, checkpoint.stages[-1], checkpoint.children_stored,
+        )
+        parents, children, parent_map = checkpoint.parents, checkpoint.children, checkpoint.parent_map
 
     # Contextualize (optional)
-    if settings.enable_contextual_embeddings:
-        children = _contextualize_chunks(children, parent_map)
+    if settings.enable_contextual_embeddings and not checkpoint.done("contextualize"):
+        with stats.stage("contextualize") as stage:
+            children = _contextualize_chunks(children, parent_map)
+        stage.items = stage.llm_calls = len(children)
+        stage.tokens = sum(_contextualize_tokens(c, parent_map) for c in children)
+        checkpoint.update_children(children, "contextualize")
+        progress._notify()
 
     # Entity extraction + immediate store (optional)
-    if settings.enable_entity_extraction:
-        _extract_and_store_entities(parents)
+    if settings.enable_entity_extraction and not checkpoint.done("entities"):
+        with stats.stage("entities") as stage:
+            _extract_and_store_entities(parents)
+        stage.items = stage.llm_calls = len(parents)
+        stage.tokens = sum(count_tokens(p.page_content) for p in parents)
+        checkpoint.mark("entities")
+        progress._notify()
 
     # Embed and store (streaming: embed batch → store batch → discard)
-    _embed_and_store(children, parent_map)
+    _embed_and_store(children, parent_map, stats=stats, checkpoint=checkpoint)
+
+    # Flip visibility to the new generation, then drop the old one
+    registry.activate(book_name, checkpoint.generation)
+    checkpoint.clear()
+    _collect_garbage(book_name)
+    progress._notify()
+
+
+def _collect_garbage(book_name: str | None = None) -> None:
+    """Remove retired generations; a failure only delays it to the next run."""
+    try:
+        collect_garbage(book_name)
+    except Exception as exc:
+        logger.warning("Garbage collection of retired generations failed: %s", exc)
+
+
+def _contextualize_tokens(child: Document, parent_map: dict[str, Document]) -> int:
+    """Estimated prompt + completion tokens of one contextualize call."""
+    parent = parent_map.get(child.metadata.get("doc_id", ""))
+    text = child.metadata.get("original_text", child.page_content)
+    prompt = (parent.page_content if parent is not None else "") + text
+    return count_tokens(prompt) + count_tokens(child.metadata.get("context_prefix", ""))
+
+
+def _is_pdf(path: Path) -> bool:
+    return path.suffix.lower() == ".pdf"
+
+
+def _parse_file(
+    path: Path, book_name: str, on_pages: Callable[[int, int], None] | None = None
+) -> Iterable[Document]:
+    """Parse a single file into Documents. `on_pages` reports PDF extraction progress.
 
+    PDFs are streamed page by page through cleanup and header normalization
+    straight into section splitting: they come back as a lazy iterator of
+    sections, extracted as it is consumed, so the full markdown is never held
+    in memory. The cleaned markdown is cached next to the PDF, so a reingest
+    skips extraction.
+    """
+    if _is_pdf(path):
+        from rpg_rules_ai.extraction import iter_cached_pdf_lines
+
+        return iter_sections(iter_cached_pdf_lines(path, on_pages=on_pages))
 
-def _parse_file(path: Path, book_name: str) -> list[Document]:
-    """Parse a single file into Documents."""
-    if path.suffix.lower() == ".pdf":
-        from rpg_rules_ai.extraction import clean_page_artifacts, extract_pdf, postprocess_headers
+    # Markdown goes to split_into_sections as written: its headers are what
+    # the sections are cut on
+    md = path.read_text(encoding="utf-8-sig")
+    return [Document(page_content=md, metadata={"book": book_name, "source": str(path)})]
 
-        raw_md = extract_pdf(path)
-        md = postprocess_headers(clean_page_artifacts(raw_md))
-        return [Document(page_content=md, metadata={"book": book_name, "source": str(path)})]
 
-    loader = UnstructuredMarkdownLoader(str(path))
-    docs = loader.load()
-    for doc in docs:
-        doc.metadata["book"] = book_name
-    return docs
+def _staged(stats: FileStats, name: str, items: Iterable[Document]) -> Iterator[Document]:
+    """Iterate `items`, timing each step into the named stage and counting the items."""
+    iterator = iter(items)
+    while True:
+        with stats.stage(name) as stage:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            stage.items += 1
+        yield item
 
 
 def _split_docs(
-    docs: list[Document], book_name: str
-) -> tuple[list[Document], list[Document], dict[str, Document]]:
-    """Split documents into parent and child chunks."""
-    all_parents: list[Document] = []
-    for doc in docs:
-        sections = split_into_sections(doc.page_content)
+    docs: Iterable[Document], book_name: str, sectioned: bool = False
+) -> tuple[list[Document], Sequence[Document], dict[str, Document]]:
+    """Split documents into parent and child chunks.
+
+    With `sectioned`, `docs` are already header sections (the PDF path).
+    Sections are consumed one at a time; only the parents are kept, since the
+    checkpoint and the docstore need all of them. Children are offsets into
+    their parents until accessed (see ChildChunks).
+    """
+    if sectioned:
+        sections = docs
+    else:
+        sections = (section for doc in docs for section in split_into_sections(doc.page_content))
+
+    def with_book(sections: Iterable[Document]) -> Iterator[Document]:
         for section in sections:
             section.metadata["book"] = book_name
-        parents = split_sections_into_parents(sections)
-        for parent in parents:
-            if "book" not in parent.metadata:
-                parent.metadata["book"] = book_name
-        all_parents.extend(parents)
+            yield section
 
-    children, parent_map = split_parents_into_children(all_parents)
-    return all_parents, children, parent_map
+    return split_sections(with_book(sections))
 
 
 def _contextualize_chunks(
@@ -207,7 +452,12 @@ def _contextualize_chunks(
 
 
 def _extract_and_store_entities(parents: list[Document]) -> None:
-    """Extract entities from parent chunks and store immediately."""
+    """Extract entities from parent chunks and store immediately.
+
+    Mentions already stored for these parents are replaced: doc_ids are
+    content-derived, so they may come from the book's active generation or
+    from a resumed ingest interrupted mid-extraction.
+    """
     from rpg_rules_ai.entity_extractor import extract_entities_batch
     from rpg_rules_ai.entity_index import EntityIndex
 
@@ -225,6 +475,7 @@ def _extract_and_store_entities(parents: list[Document]) -> None:
 
     index = EntityIndex()
     try:
+        index.delete_chunk_mentions(parent_ids)
         for i, entities in enumerate(batch_results):
             if entities:
                 book = items[i][1]
@@ -233,41 +484,166 @@ def _extract_and_store_entities(parents: list[Document]) -> None:
         index.close()
 
 
+def _embed_with_retry(embedder, texts: list[str], stage: StageStats) -> list[list[float]]:
+    """Embed one batch, retrying transient failures with exponential backoff."""
+    attempt = 0
+    while True:
+        stage.embedding_calls += 1
+        try:
+            return embedder.embed_documents(texts)
+        except Exception as exc:
+            if attempt >= EMBED_MAX_RETRIES:
+                raise
+            delay = EMBED_RETRY_BACKOFF * 2**attempt
+            attempt += 1
+            stage.retries += 1
+            logger.warning("Embedding batch failed (%s), retrying in %.0fs", exc, delay)
+            time.sleep(delay)
+
+
+def _token_batches(docs: Sequence[Document], start: int = 0) -> Iterator[tuple[int, int, int]]:
+    """(start, end, tokens) of consecutive batches packed up to EMBED_BATCH_MAX_TOKENS.
+
+    Each batch also holds at most EMBED_BATCH_SIZE documents and at least
+    one, however long it is.
+    """
+    i = start
+    while i < len(docs):
+        end, tokens = i, 0
+        while end < len(docs) and end - i < EMBED_BATCH_SIZE:
+            n = count_tokens(docs[end].page_content)
+            if end > i and tokens + n > EMBED_BATCH_MAX_TOKENS:
+                break
+            tokens += n
+            end += 1
+        yield i, end, tokens
+        i = end
+
+
+def _embed_batch(
+    embedder, collection, batch: list[Document], ids: list[str], stage: StageStats
+) -> tuple[list[list[float]], list[tuple[str, str, tuple[int, ...] | None, str]]]:
+    """Embed one batch, reusing the stored embedding of near-duplicate children.
+
+    Children matching one already indexed (or earlier in the batch) get its
+    dup_group in their metadata and its embedding; only the rest go to the
+    API. Matching compares the text before any context prefix.
+
+    Returns the embeddings and the batch's near-duplicate index rows, which
+    the caller adds once the batch is stored.
+    """
+    texts = [c.page_content for c in batch]
+    threshold = settings.near_duplicate_threshold
+    if threshold <= 0:
+        return _embed_with_retry(embedder, texts, stage), []
+
+    from rpg_rules_ai.near_duplicates import get_near_duplicate_index, minhash
+
+    index = get_near_duplicate_index()
+    signatures = [minhash(c.metadata.get("original_text", c.page_content)) for c in batch]
+    matches = index.match(list(zip(ids, signatures)), threshold)
+    position = {record_id: k for k, record_id in enumerate(ids)}
+    stored_ids = sorted({m[0] for m in matches if m is not None and m[0] not in position})
+    stored: dict[str, list[float]] = {}
+    if stored_ids:
+        found = collection.get(ids=stored_ids, include=["embeddings"])
+        stored = {r: list(e) for r, e in zip(found["ids"], found["embeddings"])}
+        # Records removed since they were indexed (e.g. retired generations)
+        index.forget([r for r in stored_ids if r not in stored])
+
+    embeddings: list[list[float] | None] = [None] * len(batch)
+    for k, match in enumerate(matches):
+        if match is not None:
+            batch[k].metadata["dup_group"] = match[1]
+            embeddings[k] = stored.get(match[0])
+    pending = [
+        k for k, match in enumerate(matches)
+        if embeddings[k] is None and (match is None or match[0] not in position)
+    ]
+    if pending:
+        for k, e in zip(pending, _embed_with_retry(embedder, [texts[k] for k in pending], stage)):
+            embeddings[k] = e
+    for k, match in enumerate(matches):
+        if embeddings[k] is None:
+            embeddings[k] = embeddings[position[match[0]]]
+    stage.embeddings_reused += len(batch) - len(pending)
+    rows = [
+        (record_id, c.metadata.get("book", ""), signature, match[1] if match else record_id)
+        for record_id, c, signature, match in zip(ids, batch, signatures, matches)
+    ]
+    return embeddings, rows
+
+
 def _embed_and_store(
-    children: list[Document],
+    children: Sequence[Document],
     parent_map: dict[str, Document],
+    stats: FileStats | None = None,
+    checkpoint: IngestCheckpoint | None = None,
 ) -> None:
     """Embed child chunks in batches and store each batch immediately.
 
-    Never holds all embeddings in memory at once.
+    Batches are packed by token count (see _token_batches) and written to
+    Chroma in CHROMA_BATCH_LIMIT slices. Never holds all embeddings in memory
+    at once. With a checkpoint, the children it records as stored are skipped
+    and each new batch is recorded.
     """
-    embedder = OpenAIEmbeddings(model=settings.embedding_model)
+    if stats is None:
+        stats = FileStats(filename="")
+    embedder = get_embeddings(model=settings.embedding_model)
     vs = get_vectorstore()
     collection = vs._collection
 
-    batch_size = min(EMBED_BATCH_SIZE, CHROMA_BATCH_LIMIT)
+    start = checkpoint.children_stored if checkpoint is not None else 0
+    # The batch after a resume point may have been stored just before the
+    # crash, so it is upserted under its checkpointed ids
+    write = collection.upsert if checkpoint is not None and checkpoint.resumed else collection.add
 
-    for i in range(0, len(children), batch_size):
-        batch = children[i : i + batch_size]
-        texts = [c.page_content for c in batch]
-
-        batch_embeddings = embedder.embed_documents(texts)
-
-        ids = [str(uuid.uuid4()) for _ in batch]
+    for i, end, tokens in _token_batches(children, start):
+        batch = children[i:end]
         documents = [c.page_content for c in batch]
+
+        ids = checkpoint.child_ids[i:end] if checkpoint is not None else child_ids(batch)
         metadatas = [c.metadata for c in batch]
 
-        collection.add(
-            ids=ids,
-            documents=documents,
-            embeddings=batch_embeddings,
-            metadatas=metadatas,
-        )
+        with stats.stage("embed") as stage:
+            batch_embeddings, index_rows = _embed_batch(embedder, collection, batch, ids, stage)
+        stage.items += len(batch)
+        stage.tokens += tokens
+
+        with stats.stage("store") as stage:
+            for j in range(0, len(batch), CHROMA_BATCH_LIMIT):
+                write(
+                    ids=ids[j : j + CHROMA_BATCH_LIMIT],
+                    documents=documents[j : j + CHROMA_BATCH_LIMIT],
+                    embeddings=batch_embeddings[j : j + CHROMA_BATCH_LIMIT],
+                    metadatas=metadatas[j : j + CHROMA_BATCH_LIMIT],
+                )
+        stage.items += len(batch)
+        stage.bytes_written += _batch_bytes(documents, metadatas, batch_embeddings)
+        # Indexed only once stored, so no match can point at a record not written
+        if index_rows:
+            from rpg_rules_ai.near_duplicates import get_near_duplicate_index
+
+            get_near_duplicate_index().add(index_rows)
+        if checkpoint is not None:
+            checkpoint.mark_stored(end)
 
     # Store parents in docstore
     from langchain_core.load import dumps
     docstore = get_docstore()
-    docstore.mset([
-        (pid, dumps(parent).encode("utf-8"))
-        for pid, parent in parent_map.items()
-    ])
+    with stats.stage("store") as stage:
+        serialized = [
+            (pid, dumps(parent).encode("utf-8"))
+            for pid, parent in parent_map.items()
+        ]
+        docstore.mset(serialized)
+    stage.items += len(serialized)
+    stage.bytes_written += sum(len(value) for _, value in serialized)
+
+
+def _batch_bytes(documents: list[str], metadatas: list[dict], embeddings: list[list[float]]) -> int:
+    """Approximate bytes handed to the vector store: text, metadata and float32 vectors."""
+    text_bytes = sum(len(d.encode("utf-8")) for d in documents)
+    metadata_bytes = sum(len(json.dumps(m, default=str)) for m in metadatas)
+    vector_bytes = sum(4 * len(e) for e in embeddings)
+    return text_bytes + metadata_bytes + vector_bytes
@@ -0,0 +1,243 @@
+"""Chat model and embedding providers.
+
+MODEL_PROVIDER selects the backend: "openai" (default) or "fake". The fakes
+are deterministic and never touch the network, so ingestion and queries can be
+benchmarked offline. FAKE_LATENCY_MS adds a fixed delay to every fake call to
+approximate API round trips.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from rpg_rules_ai import tracing
+from rpg_rules_ai.config import settings
+from rpg_rules_ai.metrics import (
+    EMBEDDING_CALLS,
+    EMBEDDING_TEXTS,
+    LLMMetricsHandler,
+    record_llm_usage,
+)
+from rpg_rules_ai.tokens import count_tokens
+
+FAKE_EMBEDDING_DIM = 256
+
+_TERM_RE = re.compile(r"\w+")
+_EXPAND_RE = re.compile(r"Expand the following question:\s*(.+)", re.DOTALL)
+_FOLLOW_UP_RE = re.compile(r"Follow-up question:\s*(.+)", re.DOTALL)
+_BLOCK_RE = re.compile(r"^\[(\d+)\] Source: (.+)\n(.+)$", re.MULTILINE)
+_ENTITY_RE = re.compile(r"\b[A-Z][a-z]+(?: [A-Z][a-z]+)+\b")
+
+
+def get_chat_model(model: str, temperature: float = 0):
+    callbacks = [LLMMetricsHandler(model)]
+    if settings.model_provider == "fake":
+        return FakeChatModel(model=model, latency_ms=settings.fake_latency_ms, callbacks=callbacks)
+    return ChatOpenAI(model=model, temperature=temperature, callbacks=callbacks)
+
+
+def get_embeddings(model: str) -> Embeddings:
+    if settings.model_provider == "fake":
+        return MeteredEmbeddings(FakeEmbeddings(latency_ms=settings.fake_latency_ms))
+    return MeteredEmbeddings(OpenAIEmbeddings(model=model))
+
+
+# --- Embeddings ---
+
+
+class MeteredEmbeddings(Embeddings):
+    """Counts embedding calls and texts; OpenAIEmbeddings has no callback hooks."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        EMBEDDING_CALLS.inc(operation="documents")
+        EMBEDDING_TEXTS.inc(len(texts), operation="documents")
+        tracing.record_embedding_call()
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        EMBEDDING_CALLS.inc(operation="query")
+        EMBEDDING_TEXTS.inc(operation="query")
+        tracing.record_embedding_call()
+        return self.inner.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        EMBEDDING_CALLS.inc(operation="documents")
+        EMBEDDING_TEXTS.inc(len(texts), operation="documents")
+        tracing.record_embedding_call()
+        return await self.inner.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        EMBEDDING_CALLS.inc(operation="query")
+        EMBEDDING_TEXTS.inc(operation="query")
+        tracing.record_embedding_call()
+        return await self.inner.aembed_query(text)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words embeddings.
+
+    Texts sharing words get similar vectors, which is enough for retrieval to
+    behave plausibly on a synthetic corpus.
+    """
+
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIM, latency_ms: float = 0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dim
+        for term in _TERM_RE.findall(text.lower()):
+            digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+# --- Chat model ---
+
+
+def _as_messages(value: Any) -> list[BaseMessage]:
+    if hasattr(value, "to_messages"):
+        return value.to_messages()
+    if isinstance(value, str):
+        return [HumanMessage(content=value)]
+    if isinstance(value, BaseMessage):
+        return [value]
+    return list(value)
+
+
+def _last_text(messages: list[BaseMessage]) -> str:
+    return str(messages[-1].content) if messages else ""
+
+
+def _fake_reply(messages: list[BaseMessage]) -> str:
+    text = _last_text(messages)
+    follow_up = _FOLLOW_UP_RE.search(text)
+    if follow_up:
+        return follow_up.group(1).strip()
+    first_line = next((line for line in text.splitlines() if line.strip()), "")
+    return f"This passage covers {first_line.strip()[:120]}"
+
+
+def _first_sentence(text: str) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence[:200]
+
+
+def _fake_structured(schema: Any, messages: list[BaseMessage]) -> Any:
+    """Canned output for the schemas the app asks for."""
+    text = "\n".join(str(m.content) for m in messages)
+    name = getattr(schema, "__name__", "")
+
+    if name == "LLMQuestions":
+        match = _EXPAND_RE.search(text)
+        question = (match.group(1) if match else _last_text(messages)).strip()
+        return schema.model_validate(
+            {"questions": [{"question": question}, {"question": f"{question} rules"}]}
+        )
+    if name == "SufficiencyAnalysis":
+        return schema.model_validate(
+            {"sufficient": True, "new_queries": [], "reasoning": "Fake analyzer accepts the context."}
+        )
+    if name == "AnswerWithSources":
+        block = _BLOCK_RE.search(text)
+        if block is None:
+            return {"answer": "I don't know.", "sources": [], "citations": [], "see_also": []}
+        index, book, passage = int(block.group(1)), block.group(2).strip(), block.group(3)
+        return {
+            "answer": f"According to {book} [{index}].",
+            "sources": [book],
+            "citations": [{"index": index, "quote": _first_sentence(passage), "source": book}],
+            "see_also": [],
+        }
+    if name == "ExtractedEntities":
+        names = list(dict.fromkeys(_ENTITY_RE.findall(text)))[:5]
+        return schema.model_validate({
+            "entities": [
+                {"name": n, "type": "other", "mention_type": "defines" if i == 0 else "references"}
+                for i, n in enumerate(names)
+            ]
+        })
+    raise ValueError(f"FakeChatModel has no canned output for schema {name or schema!r}")
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model for offline runs.
+
+    Plain calls echo the follow-up question (so rewrite is a no-op) or describe
+    the first line of the prompt. Structured calls return canned outputs per
+    schema: one extra query on expansion, "sufficient" from the analyzer and
+    an answer citing passage [1].
+    """
+
+    model: str = "fake"
+    latency_ms: float = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=_fake_reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=_fake_reply(messages)))])
+
+    def _structured(self, schema, value):
+        messages = _as_messages(value)
+        result = _fake_structured(schema, messages)
+        record_llm_usage(
+            self.model,
+            sum(count_tokens(str(m.content)) for m in messages),
+            count_tokens(str(result)),
+        )
+        return result
+
+    def with_structured_output(self, schema, **kwargs):
+        def invoke(value):
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000)
+            return self._structured(schema, value)
+
+        async def ainvoke(value):
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000)
+            return self._structured(schema, value)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
@@ -0,0 +1,109 @@
+"""Local lexical reranking of retrieved parents before generation.
+
+Scores each unique parent against the question with BM25 computed over the
+candidate set, fuses that with the retrieval order (reciprocal rank fusion) so
+passages the vector search ranked highly are not dropped on lexical grounds
+alone, and keeps the best-ranked parents that fit in a token budget.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from rpg_rules_ai.tokens import count_tokens
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+_TERM_RE = re.compile(r"\w+")
+
+
+def _terms(text: str) -> list[str]:
+    return [t for t in _TERM_RE.findall(text.lower()) if len(t) > 1]
+
+
+def _doc_text(doc: Document) -> str:
+    return doc.metadata.get("original_text", doc.page_content)
+
+
+def bm25_scores(query: str, texts: list[str]) -> list[float]:
+    """BM25 score of each text for query, with IDF taken from the texts themselves."""
+    if not texts:
+        return []
+    query_terms = set(_terms(query))
+    tokenized = [_terms(t) for t in texts]
+    n_docs = len(tokenized)
+    avg_len = sum(len(t) for t in tokenized) / n_docs or 1.0
+
+    doc_freq: Counter[str] = Counter()
+    for terms in tokenized:
+        doc_freq.update(set(terms) & query_terms)
+
+    scores: list[float] = []
+    for terms in tokenized:
+        tf = Counter(terms)
+        score = 0.0
+        for term in query_terms:
+            freq = tf.get(term, 0)
+            if not freq:
+                continue
+            idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            norm = freq + BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / avg_len)
+            score += idf * freq * (BM25_K1 + 1) / norm
+        scores.append(score)
+    return scores
+
+
+def unique_documents(docs: list[Document]) -> list[Document]:
+    """Drop repeated (book, text) pairs, keeping first occurrence order.
+
+    Also drops documents retrieved only for near-duplicate copies of text an
+    earlier one was retrieved for (metadata["hit_groups"], set by the retriever).
+    """
+    seen = set()
+    seen_groups: set[str] = set()
+    result = []
+    for doc in docs:
+        key = (doc.metadata.get("book", ""), _doc_text(doc))
+        groups = doc.metadata.get("hit_groups") or []
+        if key in seen or (groups and seen_groups.issuperset(groups)):
+            continue
+        seen.add(key)
+        seen_groups.update(groups)
+        result.append(doc)
+    return result
+
+
+def rerank_documents(question: str, docs: list[Document], max_tokens: int) -> list[Document]:
+    """Return the best-ranked unique documents that fit in max_tokens.
+
+    The top-ranked document is always kept, even if it alone exceeds the budget.
+    Documents that do not fit are skipped so smaller, lower-ranked ones can still
+    use the remaining budget.
+    """
+    candidates = unique_documents(docs)
+    if not candidates:
+        return []
+
+    scores = bm25_scores(question, [_doc_text(d) for d in candidates])
+    matched = sorted((i for i in range(len(candidates)) if scores[i] > 0), key=lambda i: -scores[i])
+    # Documents with no lexical match only get the retrieval-order term
+    fusion = {i: 1 / (RRF_K + i) for i in range(len(candidates))}
+    for rank, i in enumerate(matched):
+        fusion[i] += 1 / (RRF_K + rank)
+    fused = sorted(range(len(candidates)), key=lambda i: -fusion[i])
+
+    kept: list[Document] = []
+    used = 0
+    for i in fused:
+        cost = count_tokens(_doc_text(candidates[i]))
+        if kept and used + cost > max_tokens:
+            continue
+        kept.append(candidates[i])
+        used += cost
+    return kept
@@ -1,17 +1,35 @@
+import os
+import threading
+import time
+import weakref
 from collections.abc import Iterable
+from contextlib import contextmanager
 from typing import Any
 
+import chromadb
 from langchain_classic.retrievers import ParentDocumentRetriever
+from langchain_classic.retrievers.multi_vector import SearchType
 from langchain_classic.storage import LocalFileStore
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
 
 from rpg_rules_ai.chunking import get_child_splitter, get_parent_splitter
 from rpg_rules_ai.config import settings
+from rpg_rules_ai.generations import get_registry, hidden_generations
+from rpg_rules_ai.providers import get_embeddings
 
 _retriever = None
 _vectorstore = None
+_client = None
 _docstore = None
+_corpus_version: int | None = None
+_corpus_checked_at = 0.0
+_writers = 0
+_reload_lock = threading.Lock()
 
 
 CHROMA_BATCH_LIMIT = 100
@@ -47,16 +65,204 @@ class BatchedChroma(Chroma):
         return all_ids
 
 
+class HitTrackingParentRetriever(ParentDocumentRetriever):
+    """ParentDocumentRetriever that records where the matched children sit.
+
+    Each returned parent gets metadata["child_hits"]: [start, end] character
+    spans of the children that matched the query, in retrieval order, so the
+    context packer can trim long parents around the relevant part, and
+    metadata["hit_groups"]: the near-duplicate groups of those children.
+
+    A child whose text was already matched through another copy (same
+    metadata["dup_group"], see near_duplicates.py), typically a reprint in
+    another book, is skipped, so its parent only comes back for other hits.
+
+    Chunks of staging or retired book generations are filtered out.
+    """
+
+    def _search_kwargs(self) -> dict:
+        hidden = hidden_generations()
+        if not hidden:
+            return self.search_kwargs
+        visibility = {"generation": {"$nin": hidden}}
+        existing = self.search_kwargs.get("filter")
+        return {
+            **self.search_kwargs,
+            "filter": {"$and": [existing, visibility]} if existing else visibility,
+        }
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        search_kwargs = self._search_kwargs()
+        if self.search_type == SearchType.mmr:
+            sub_docs = self.vectorstore.max_marginal_relevance_search(query, **search_kwargs)
+        elif self.search_type == SearchType.similarity_score_threshold:
+            sub_docs = [
+                d for d, _ in self.vectorstore.similarity_search_with_relevance_scores(
+                    query, **search_kwargs
+                )
+            ]
+        else:
+            sub_docs = self.vectorstore.similarity_search(query, **search_kwargs)
+        ids, hits, groups = self._collect_hits(sub_docs)
+        return self._attach_hits(ids, self.docstore.mget(ids), hits, groups)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        search_kwargs = self._search_kwargs()
+        if self.search_type == SearchType.mmr:
+            sub_docs = await self.vectorstore.amax_marginal_relevance_search(
+                query, **search_kwargs
+            )
+        elif self.search_type == SearchType.similarity_score_threshold:
+            sub_docs = [
+                d for d, _ in await self.vectorstore.asimilarity_search_with_relevance_scores(
+                    query, **search_kwargs
+                )
+            ]
+        else:
+            sub_docs = await self.vectorstore.asimilarity_search(query, **search_kwargs)
+        ids, hits, groups = self._collect_hits(sub_docs)
+        return self._attach_hits(ids, await self.docstore.amget(ids), hits, groups)
+
+    async def aembed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Embed several queries in one embeddings request, for ainvoke_with_embedding."""
+        if not queries:
+            return []
+        return await self.vectorstore.embeddings.aembed_documents(queries)
+
+    async def ainvoke_with_embedding(self, query: str, embedding: list[float]) -> list[Document]:
+        """Retrieve for a query whose embedding was already computed (see aembed_queries).
+
+        Same results as ainvoke(query) without embedding the query again.
+        Score-threshold search needs relevance scores by query, so it falls
+        back to ainvoke.
+        """
+        search_kwargs = self._search_kwargs()
+        if self.search_type == SearchType.mmr:
+            sub_docs = await self.vectorstore.amax_marginal_relevance_search_by_vector(
+                embedding, **search_kwargs
+            )
+        elif self.search_type == SearchType.similarity_score_threshold:
+            return await self.ainvoke(query)
+        else:
+            sub_docs = await self.vectorstore.asimilarity_search_by_vector(embedding, **search_kwargs)
+        ids, hits, groups = self._collect_hits(sub_docs)
+        return self._attach_hits(ids, await self.docstore.amget(ids), hits, groups)
+
+    def _collect_hits(
+        self, sub_docs: list[Document]
+    ) -> tuple[list[str], dict[str, list[list[int]]], dict[str, list[str]]]:
+        ids: list[str] = []
+        hits: dict[str, list[list[int]]] = {}
+        groups: dict[str, list[str]] = {}
+        seen_groups: set[str] = set()
+        for d in sub_docs:
+            parent_id = d.metadata.get(self.id_key)
+            if not parent_id:
+                continue
+            group = d.metadata.get("dup_group") or d.id
+            if group:
+                if group in seen_groups:
+                    continue
+                seen_groups.add(group)
+            if parent_id not in hits:
+                ids.append(parent_id)
+                hits[parent_id] = []
+                groups[parent_id] = []
+            if group:
+                groups[parent_id].append(group)
+            start = d.metadata.get("start_index")
+            if isinstance(start, int) and start >= 0:
+                text = d.metadata.get("original_text", d.page_content)
+                hits[parent_id].append([start, start + len(text)])
+        return ids, hits, groups
+
+    @staticmethod
+    def _attach_hits(
+        ids: list[str],
+        docs: list[Document | None],
+        hits: dict[str, list[list[int]]],
+        groups: dict[str, list[str]],
+    ) -> list[Document]:
+        result = []
+        for parent_id, doc in zip(ids, docs):
+            if doc is None:
+                continue
+            doc.metadata["child_hits"] = hits[parent_id]
+            doc.metadata["hit_groups"] = groups[parent_id]
+            result.append(doc)
+        return result
+
+
+@contextmanager
+def holding_vectorstore():
+    """Keep this process's vector store open while writing to it."""
+    global _writers
+    with _reload_lock:
+        _writers += 1
+    try:
+        yield
+    finally:
+        with _reload_lock:
+            _writers -= 1
+
+
+def _reload_if_corpus_changed() -> None:
+    """Reopen the vector store after another process changed the corpus.
+
+    Chroma keeps its index in memory per process, so chunks written by another
+    server process only show up once the client is reopened. The corpus
+    version is read at most once per CORPUS_CHECK_SECONDS. The reload waits
+    while this process is itself writing, so its own writes stay on one client,
+    and while an in-flight query still holds the old store.
+    """
+    global _corpus_version, _corpus_checked_at
+    now = time.monotonic()
+    if _corpus_version is not None and now - _corpus_checked_at < settings.corpus_check_seconds:
+        return
+    _corpus_checked_at = now
+    version, writer_pid = get_registry().corpus_version()
+    if version == _corpus_version:
+        return
+    with _reload_lock:
+        if _corpus_version is not None and writer_pid != os.getpid() and _vectorstore is not None:
+            if _writers or not _release_vectorstore():
+                return
+        _corpus_version = version
+
+
+def _release_vectorstore() -> bool:
+    """Drop the store and close its client, unless a query still holds the store."""
+    global _client, _vectorstore, _retriever
+    store = weakref.ref(_vectorstore)
+    retriever = weakref.ref(_retriever) if _retriever is not None else None
+    _vectorstore = _retriever = None
+    if store() is not None:
+        _vectorstore = store()
+        _retriever = retriever() if retriever is not None else None
+        return False
+    # The last client on the path stops its Chroma system, so the next one starts fresh
+    _client.close()
+    _client = None
+    return True
+
+
 def get_vectorstore() -> BatchedChroma:
-    global _vectorstore
-    if _vectorstore is None:
-        embeddings = OpenAIEmbeddings(model=settings.embedding_model)
-        _vectorstore = BatchedChroma(
-            collection_name="rpg_rules_ai",
-            embedding_function=embeddings,
-            persist_directory=settings.chroma_persist_dir,
-        )
-    return _vectorstore
+    global _client, _vectorstore
+    _reload_if_corpus_changed()
+    with _reload_lock:
+        if _vectorstore is None:
+            embeddings = get_embeddings(model=settings.embedding_model)
+            _client = chromadb.PersistentClient(path=settings.chroma_persist_dir)
+            _vectorstore = BatchedChroma(
+                collection_name="rpg_rules_ai",
+                embedding_function=embeddings,
+                client=_client,
+            )
+        return _vectorstore
 
 
 def get_docstore() -> LocalFileStore:
@@ -66,14 +272,15 @@ def get_docstore() -> LocalFileStore:
     return _docstore
 
 
-def get_retriever() -> ParentDocumentRetriever:
+def get_retriever() -> HitTrackingParentRetriever:
     global _retriever
+    _reload_if_corpus_changed()
     if _retriever is not None:
         return _retriever
 
     vectorstore = get_vectorstore()
 
-    _retriever = ParentDocumentRetriever(
+    _retriever = HitTrackingParentRetriever(
         vectorstore=vectorstore,
         byte_store=get_docstore(),
         child_splitter=get_child_splitter(),
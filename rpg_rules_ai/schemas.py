@@ -82,3 +82,13 @@ class State(MessagesState):
         None,
         "Final Answer, with Quoted Citation and book of origin",
     ]
+    retrieval_hops: Annotated[
+        List[dict],
+        None,
+        "Per-hop cost records from the retrieval strategy (queries, docs, LLM calls, tokens, time)",
+    ]
+    speculative_hit: Annotated[
+        bool,
+        None,
+        "Whether rewrite reused the speculative retrieval for the raw question",
+    ]
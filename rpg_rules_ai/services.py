@@ -1,17 +1,35 @@
 """Centralized service layer for RPG Rules AI.
 
-Owns the graph singleton and job registry. Both api.py and frontend.py
-delegate here instead of maintaining their own state.
+Owns the graph singleton and the ingestion job queue. Both api.py and
+frontend.py delegate here instead of maintaining their own state.
+
+State that must agree across uvicorn workers lives in SQLite files: the job
+queue, conversation checkpoints, the generation registry and corpus version.
+The singletons here are per-process handles to it. Metrics are summed across
+workers from the snapshots each one writes to METRICS_DIR.
 """
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
+from rpg_rules_ai import tracing
+from rpg_rules_ai.config import settings
+from rpg_rules_ai.generations import get_registry
 from rpg_rules_ai.ingest import delete_book as _delete_book
-from rpg_rules_ai.ingest import get_books_metadata
-from rpg_rules_ai.ingestion_job import IngestionJob
+from rpg_rules_ai.ingest import get_books_metadata, is_source_file, source_files
+from rpg_rules_ai.job_queue import JobQueue, JobWorkerPool
+from rpg_rules_ai.metrics import ACTIVE_JOBS, ASK_SECONDS, CHECKPOINTER_THREADS, REGISTRY
 from rpg_rules_ai.prompts import (
     PROMPT_CONFIGS,
     PROMPTS_DIR,
@@ -20,68 +38,331 @@ from rpg_rules_ai.prompts import (
     save_prompt as _save_prompt,
 )
 
+logger = logging.getLogger(__name__)
+
 _graph = None
-_jobs: dict[str, IngestionJob] = {}
+_job_queue: JobQueue | None = None
+_job_pool: JobWorkerPool | None = None
+_io_executor: ThreadPoolExecutor | None = None
+_metrics_writer: tuple[threading.Thread, threading.Event] | None = None
+_io_executor_lock = threading.Lock()
 
 
 def _get_graph():
+    """Build the graph on first use. Must be called from the running event loop."""
     global _graph
     if _graph is None:
         from rpg_rules_ai.graph import build_graph
 
-        _graph = build_graph()
+        _graph = build_graph(checkpointer=_conversation_checkpointer())
     return _graph
 
 
+def _conversation_checkpointer():
+    """Conversation memory in SQLite, so a thread_id works on any worker process."""
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    Path(settings.conversation_db_path).parent.mkdir(parents=True, exist_ok=True)
+    return AsyncSqliteSaver(aiosqlite.connect(settings.conversation_db_path))
+
+
+async def close_graph() -> None:
+    global _graph
+    conn = getattr(getattr(_graph, "checkpointer", None), "conn", None)
+    _graph = None
+    if conn is not None:
+        await conn.close()
+
+
+def _get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(settings.job_queue_path)
+    return _job_queue
+
+
+def start_job_workers() -> JobWorkerPool:
+    """Start the ingestion workers once; interrupted jobs are resumed."""
+    global _job_pool
+    if _job_pool is None:
+        _job_pool = JobWorkerPool(_get_job_queue(), workers=settings.ingest_workers)
+        _job_pool.start()
+    return _job_pool
+
+
+def stop_job_workers() -> None:
+    global _job_pool
+    if _job_pool is not None:
+        _job_pool.stop(timeout=5)
+        _job_pool = None
+
+
+def _get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=settings.blocking_io_workers, thread_name_prefix="blocking-io"
+            )
+        return _io_executor
+
+
+def stop_io_executor() -> None:
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=False, cancel_futures=True)
+            _io_executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the bounded I/O pool so the event loop keeps serving."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _write_metrics_snapshot() -> None:
+    try:
+        REGISTRY.write_snapshot(settings.metrics_dir)
+    except OSError as exc:
+        logger.warning("Could not write metrics snapshot: %s", exc)
+
+
+def start_metrics_snapshots() -> None:
+    """Write this worker's metrics to METRICS_DIR every METRICS_SNAPSHOT_SECONDS."""
+    global _metrics_writer
+    if not settings.metrics_dir or _metrics_writer is not None:
+        return
+    stop = threading.Event()
+
+    def write_periodically() -> None:
+        while not stop.wait(settings.metrics_snapshot_seconds):
+            _write_metrics_snapshot()
+
+    thread = threading.Thread(target=write_periodically, name="metrics-snapshots", daemon=True)
+    thread.start()
+    _metrics_writer = (thread, stop)
+
+
+def stop_metrics_snapshots() -> None:
+    global _metrics_writer
+    if _metrics_writer is not None:
+        thread, stop = _metrics_writer
+        stop.set()
+        thread.join(timeout=5)
+        _metrics_writer = None
+        _write_metrics_snapshot()
+
+
+def render_metrics() -> str:
+    """/metrics body: summed across workers when METRICS_DIR is set, else this process only."""
+    return REGISTRY.render(settings.metrics_dir or None)
+
+
+def _active_job_count() -> int:
+    return _get_job_queue().count_active()
+
+
+def _checkpointer_thread_count() -> int:
+    storage = getattr(getattr(_graph, "checkpointer", None), "storage", None)
+    if storage is not None:
+        return len(storage)
+    if not Path(settings.conversation_db_path).exists():
+        return 0
+    try:
+        conn = sqlite3.connect(settings.conversation_db_path)
+        try:
+            return conn.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+ACTIVE_JOBS.set_function(_active_job_count)
+CHECKPOINTER_THREADS.set_function(_checkpointer_thread_count)
+
+
 # --- Chat ---
 
 
-async def ask_question(question: str, thread_id: str | None = None) -> dict:
+async def ask_question(
+    question: str, thread_id: str | None = None, debug: bool = False
+) -> dict:
+    """Answer a question. With debug=True the answer carries a "trace" of the run."""
     if thread_id is None:
         thread_id = str(uuid.uuid4())
     graph = _get_graph()
-    result = await graph.ainvoke(
-        {"messages": {"role": "user", "content": question}},
-        config={"configurable": {"thread_id": thread_id}},
-    )
-    return result["answer"]
+    with ASK_SECONDS.time(), tracing.collect_trace() if debug else nullcontext() as trace:
+        result = await graph.ainvoke(
+            {"messages": {"role": "user", "content": question}},
+            config={"configurable": {"thread_id": thread_id}},
+        )
+    if trace is None:
+        return result["answer"]
+    return {**result["answer"], "trace": trace.to_dict()}
 
 
 # --- Documents ---
 
 
+def list_source_files(directory: Path) -> list[Path]:
+    """Ingestible .md and .pdf files in `directory`."""
+    return source_files(directory)
+
+
 def validate_upload_paths(paths: list[Path]) -> None:
     for p in paths:
-        if not p.name.endswith(".md"):
-            raise ValueError(f"Only .md files are accepted, got: {p.name}")
+        if not p.name or not is_source_file(p):
+            raise ValueError(f"Only .md and .pdf files are accepted, got: {p.name}")
+
+
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024  # 20MB
+MAX_PDF_UPLOAD_SIZE = 200 * 1024 * 1024  # scanned rulebooks run to 100MB+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def _write_chunk(out, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    out.write(chunk)
+
+
+async def _stream_upload(upload, dest: Path, max_size: int) -> tuple[Path, str]:
+    """Stream an upload next to `dest` in chunks; returns the temp path and sha256.
+
+    Only one chunk is held in memory. Hashing and file writes run on the
+    blocking I/O pool. The caller renames or removes the temp file.
+    """
+    if upload.size is not None and upload.size > max_size:
+        raise UploadTooLarge(
+            f"File too large: {upload.filename} ({upload.size} bytes, max {max_size})"
+        )
+    tmp = dest.with_name(f".{dest.name}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        out = await run_blocking(open, tmp, "wb")
+        try:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(
+                        f"File too large: {upload.filename} (over the {max_size} byte limit)"
+                    )
+                await run_blocking(_write_chunk, out, digest, chunk)
+        finally:
+            await run_blocking(out.close)
+    except BaseException:
+        await run_blocking(tmp.unlink, missing_ok=True)
+        raise
+    return tmp, digest.hexdigest()
+
+
+async def save_uploads(
+    files: list,
+    replace: bool = False,
+    max_size: int = MAX_UPLOAD_SIZE,
+    max_pdf_size: int = MAX_PDF_UPLOAD_SIZE,
+) -> tuple[list[Path], list[dict]]:
+    """Stream uploaded .md and .pdf files into SOURCES_DIR, skipping already-indexed content.
+
+    A file is skipped when an indexed book (or an earlier file of the same
+    upload) has byte-identical content, unless `replace` targets that same
+    book. Returns the saved paths and the skipped files as
+    {"filename", "duplicate_of"}. Raises ValueError for any other file type
+    and UploadTooLarge past `max_size` (`max_pdf_size` for PDFs).
+    """
+    validate_upload_paths([Path(f.filename or "") for f in files])
+    sources_dir = Path(settings.sources_dir)
+    await run_blocking(sources_dir.mkdir, parents=True, exist_ok=True)
+    registry = await run_blocking(get_registry)
+
+    saved: list[Path] = []
+    skipped: list[dict] = []
+    seen: dict[str, str] = {}
+    for f in files:
+        dest = sources_dir / Path(f.filename).name
+        limit = max_pdf_size if dest.suffix.lower() == ".pdf" else max_size
+        tmp, content_hash = await _stream_upload(f, dest, limit)
+        duplicate_of = seen.get(content_hash) or await run_blocking(
+            registry.book_with_source, content_hash
+        )
+        if duplicate_of and not (replace and duplicate_of == dest.name):
+            await run_blocking(tmp.unlink, missing_ok=True)
+            skipped.append({"filename": dest.name, "duplicate_of": duplicate_of})
+            continue
+        await run_blocking(os.replace, tmp, dest)
+        seen[content_hash] = dest.name
+        saved.append(dest)
+    return saved, skipped
 
 
 def create_ingestion_job(paths: list[Path], replace: bool = False) -> str:
     for p in paths:
         if not p.exists():
             raise FileNotFoundError(f"Path not found: {p}")
-    job_id = str(uuid.uuid4())
-    job = IngestionJob(paths=paths, replace=replace)
-    _jobs[job_id] = job
-    job.start()
+    job_id = _get_job_queue().enqueue(paths, replace=replace)
+    start_job_workers().notify()
     return job_id
 
 
 def get_job_progress(job_id: str) -> dict:
-    job = _jobs.get(job_id)
-    if job is None:
-        raise KeyError(f"Job not found: {job_id}")
-    return job.get_progress()
+    return _get_job_queue().get_progress(job_id)
+
+
+def cancel_ingestion_job(job_id: str) -> dict:
+    """Cancel a pending job, or stop a running one after its current file."""
+    _get_job_queue().request_cancel(job_id)
+    return _get_job_queue().get_progress(job_id)
+
+
+async def aget_job_progress(job_id: str) -> dict:
+    return await run_blocking(get_job_progress, job_id)
 
 
 def list_books() -> list[dict]:
     return get_books_metadata()
 
 
+async def alist_books() -> list[dict]:
+    return await run_blocking(list_books)
+
+
 def delete_book(book: str) -> None:
     _delete_book(book)
 
 
+async def adelete_book(book: str) -> None:
+    await run_blocking(delete_book, book)
+
+
+# --- Entity graph ---
+
+
+def get_entity_graph(chunk_ids: list[str]) -> dict:
+    """Entity graph for the given parent chunk ids; empty if the index is unavailable."""
+    if not chunk_ids:
+        return {"nodes": [], "edges": []}
+    try:
+        from rpg_rules_ai.entity_index import EntityIndex
+        idx = EntityIndex()
+        try:
+            return idx.build_graph_for_chunks(chunk_ids)
+        finally:
+            idx.close()
+    except Exception:
+        return {"nodes": [], "edges": []}
+
+
+async def aget_entity_graph(chunk_ids: list[str]) -> dict:
+    return await run_blocking(get_entity_graph, chunk_ids)
+
+
 # --- Prompts ---
 
 
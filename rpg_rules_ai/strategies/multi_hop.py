@@ -1,22 +1,42 @@
 import asyncio
 import hashlib
+import json
 import logging
+import re
+import time
 from typing import List
 
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
+from rpg_rules_ai import tracing
 from rpg_rules_ai.config import settings
+from rpg_rules_ai.metrics import HOP_SECONDS, HOP_STOPS, HOPS_TAKEN, timed_stage
 from rpg_rules_ai.prompts import get_multi_question_prompt
+from rpg_rules_ai.providers import get_chat_model
 from rpg_rules_ai.retriever import get_retriever
 from rpg_rules_ai.schemas import LLMQuestions, Question, Questions, State
 from rpg_rules_ai.strategies.base import RetrievalStrategy
+from rpg_rules_ai.tokens import count_tokens, truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
 MAX_HOPS = 3
 
+DIGEST_SNIPPET_CHARS = 160
+
+_TERM_RE = re.compile(r"[\w'-]+")
+
+# Question words that carry no retrieval signal (English and Portuguese).
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "can", "como", "com", "da", "das", "de", "do",
+    "does", "dos", "e", "em", "for", "from", "how", "in", "is", "it", "na",
+    "no", "o", "of", "on", "or", "os", "para", "por", "qual", "quais",
+    "que", "the", "to", "um", "uma", "what", "when", "where", "which",
+    "who", "why", "with",
+})
+
 
 class SufficiencyAnalysis(BaseModel):
     sufficient: bool = Field(
@@ -51,34 +71,99 @@ If the context is NOT sufficient, generate specific queries to find the missing
 If the context IS sufficient, confirm and explain why."""
 
 
+ANALYZER_INCREMENTAL_PROMPT = """You are analyzing whether retrieved documents contain enough context to answer a question about RPG rules (GURPS, etc.).
+
+## Original Question
+{question}
+
+## Previously Retrieved Documents (digest, one line per document)
+{digest}
+
+## Newly Retrieved Documents
+{context}
+
+## Task
+Analyze whether the previously and newly retrieved documents together provide sufficient context to fully answer the question. The digest lists documents you already analyzed in full on an earlier hop.
+
+Pay special attention to:
+- Cross-references to other books or sections (e.g., "see Powers, p. 100", "modified by Rapid Strike")
+- Rules that interact with other rules mentioned but not yet retrieved
+- Missing mechanical details (costs, modifiers, prerequisites) that are referenced but not present
+
+If the context is NOT sufficient, generate specific queries to find the missing information.
+If the context IS sufficient, confirm and explain why."""
+
+
+class _TokenUsage(BaseCallbackHandler):
+    """Sums the provider-reported prompt and completion tokens of the calls it is passed to."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.tokens = 0
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.tokens += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+def _schema_tokens(schema: type[BaseModel]) -> int:
+    """Estimated tokens of the function definition structured output sends with the prompt."""
+    return count_tokens(json.dumps(schema.model_json_schema()))
+
+
 def _doc_hash(doc: Document) -> str:
     book = doc.metadata.get("book", "")
     return hashlib.md5(f"{book}:{doc.page_content}".encode()).hexdigest()
 
 
 def _deduplicate(existing: List[Document], new: List[Document]) -> List[Document]:
+    """Drop repeated parents, and parents whose every hit is a copy of text already in context.
+
+    hit_groups (set by the retriever) are the near-duplicate groups of the
+    children a parent was retrieved for, so a reprint of an already retrieved
+    rule in another book is dropped too.
+    """
     seen = {_doc_hash(d) for d in existing}
+    seen_groups = {g for d in existing for g in d.metadata.get("hit_groups", ())}
     result = []
     for doc in new:
         h = _doc_hash(doc)
-        if h not in seen:
-            seen.add(h)
-            result.append(doc)
+        groups = doc.metadata.get("hit_groups") or []
+        if h in seen or (groups and seen_groups.issuperset(groups)):
+            continue
+        seen.add(h)
+        seen_groups.update(groups)
+        result.append(doc)
     return result
 
 
+def _question_terms(question: str) -> set[str]:
+    return {
+        t for t in (m.group().lower().strip("'-") for m in _TERM_RE.finditer(question))
+        if len(t) > 2 and t not in _STOPWORDS
+    }
+
+
 class MultiHopStrategy(RetrievalStrategy):
     async def execute(self, state: State) -> dict:
-        llm = ChatOpenAI(model=settings.llm_model, temperature=0)
+        started = time.monotonic()
+        llm = get_chat_model(model=settings.llm_model, temperature=0)
         retriever = get_retriever()
         main_question = state["main_question"]
+        hops: list[dict] = []
+        tokens_used = 0
 
         # Initial query expansion (same as multi-question)
         prompt = get_multi_question_prompt()
         chain = prompt | llm.with_structured_output(LLMQuestions)
-        llm_result = await chain.ainvoke(
-            {"messages": [("user", f"Expand the following question: {main_question}")]}
-        )
+        expansion_input = {"messages": [("user", f"Expand the following question: {main_question}")]}
+        usage = _TokenUsage()
+        with timed_stage("expansion"):
+            llm_result = await chain.ainvoke(expansion_input, config={"callbacks": [usage]})
         questions = Questions(
             questions=[Question(question=q.question) for q in llm_result.questions]
         )
@@ -86,28 +171,140 @@ class MultiHopStrategy(RetrievalStrategy):
 
         # Hop 1: retrieve for all initial queries
         all_docs: List[Document] = []
-        await self._retrieve_batch(retriever, questions.questions, all_docs)
+        await self._retrieve_batch(retriever, questions.questions, all_docs, hop=1)
+        # Provider-reported usage, else estimated from the rendered prompt,
+        # the structured output schema and the JSON completion
+        expansion_tokens = usage.tokens or (
+            count_tokens(prompt.format_prompt(**expansion_input).to_string())
+            + _schema_tokens(LLMQuestions)
+            + count_tokens(llm_result.model_dump_json())
+        )
+        tokens_used += expansion_tokens
+        hops.append({
+            "hop": 1,
+            "queries": len(questions.questions),
+            "docs_added": len(all_docs),
+            "llm_calls": 1,
+            "tokens": expansion_tokens,
+            "analyzer": "skipped",
+            "seconds": round(time.monotonic() - started, 3),
+        })
 
         # Iterative hops
         analyzer = llm.with_structured_output(SufficiencyAnalysis)
+        analyzed_count = 0
+        stop_reason = "max_hops"
         for hop in range(MAX_HOPS - 1):  # -1 because we already did hop 1
+            if (
+                settings.multi_hop_max_seconds > 0
+                and time.monotonic() - started >= settings.multi_hop_max_seconds
+            ):
+                stop_reason = "latency_budget"
+                break
+
+            hop_started = time.monotonic()
+            record = {
+                "hop": hop + 2,
+                "queries": 0,
+                "docs_added": 0,
+                "llm_calls": 0,
+                "tokens": 0,
+                "analyzer": "skipped",
+            }
+            hops.append(record)
+            docs_before = len(all_docs)
+
             # Cross-book entity lookup between hops
-            entity_questions = self._entity_cross_book_queries(all_docs)
+            with timed_stage("entity_lookup", hop=record["hop"]) as span:
+                entity_questions = self._entity_cross_book_queries(all_docs)
+                if span is not None:
+                    span.set(queries=len(entity_questions))
             if entity_questions:
-                await self._retrieve_batch(retriever, entity_questions, all_docs)
+                await self._retrieve_batch(retriever, entity_questions, all_docs, hop=record["hop"])
                 questions.questions.extend(entity_questions)
+                record["queries"] += len(entity_questions)
+
+            if settings.enable_multi_hop_precheck and self._context_covers_question(
+                main_question, all_docs
+            ):
+                record["docs_added"] = len(all_docs) - docs_before
+                record["seconds"] = round(time.monotonic() - hop_started, 3)
+                stop_reason = "precheck"
+                break
 
-            context_text = self._format_context(all_docs)
-            analysis = await analyzer.ainvoke(
-                ANALYZER_PROMPT.format(question=main_question, context=context_text)
+            if settings.analyzer_context_mode == "incremental":
+                digest_text, context_text, included = self._format_incremental_context(
+                    all_docs[:analyzed_count],
+                    all_docs[analyzed_count:],
+                    settings.analyzer_context_max_tokens,
+                )
+                analyzer_input = ANALYZER_INCREMENTAL_PROMPT.format(
+                    question=main_question, digest=digest_text, context=context_text
+                )
+            else:
+                context_text = self._format_context(all_docs)
+                analyzer_input = ANALYZER_PROMPT.format(question=main_question, context=context_text)
+                included = len(all_docs) - analyzed_count
+            prompt_tokens = count_tokens(analyzer_input) + _schema_tokens(SufficiencyAnalysis)
+            if (
+                settings.multi_hop_max_tokens > 0
+                and tokens_used + prompt_tokens > settings.multi_hop_max_tokens
+            ):
+                record["docs_added"] = len(all_docs) - docs_before
+                record["seconds"] = round(time.monotonic() - hop_started, 3)
+                stop_reason = "token_budget"
+                break
+
+            usage = _TokenUsage()
+            # One slow call must not overrun the latency budget either
+            remaining = (
+                settings.multi_hop_max_seconds - (time.monotonic() - started)
+                if settings.multi_hop_max_seconds > 0
+                else None
             )
+            try:
+                with timed_stage("analyzer", hop=record["hop"]) as span:
+                    analysis = await asyncio.wait_for(
+                        analyzer.ainvoke(analyzer_input, config={"callbacks": [usage]}), remaining
+                    )
+                    if span is not None:
+                        span.set(sufficient=analysis.sufficient, new_queries=len(analysis.new_queries))
+            except asyncio.TimeoutError:
+                record["analyzer"] = "timeout"
+                record["llm_calls"] += 1
+                record["docs_added"] = len(all_docs) - docs_before
+                record["seconds"] = round(time.monotonic() - hop_started, 3)
+                stop_reason = "latency_budget"
+                break
+            # Docs left out by the token cap stay new, so a later hop still sends them
+            analyzed_count += included
+            call_tokens = usage.tokens or prompt_tokens + count_tokens(analysis.model_dump_json())
+            tokens_used += call_tokens
+            record["analyzer"] = "sufficient" if analysis.sufficient else "insufficient"
+            record["llm_calls"] += 1
+            record["tokens"] += call_tokens
 
             if analysis.sufficient or not analysis.new_queries:
+                record["docs_added"] = len(all_docs) - docs_before
+                record["seconds"] = round(time.monotonic() - hop_started, 3)
+                stop_reason = "sufficient"
                 break
 
             new_questions = [Question(question=q) for q in analysis.new_queries]
-            await self._retrieve_batch(retriever, new_questions, all_docs)
+            await self._retrieve_batch(retriever, new_questions, all_docs, hop=record["hop"])
             questions.questions.extend(new_questions)
+            record["queries"] += len(new_questions)
+            record["docs_added"] = len(all_docs) - docs_before
+            record["seconds"] = round(time.monotonic() - hop_started, 3)
+
+        hops[-1]["stop_reason"] = stop_reason
+        for record in hops:
+            HOP_SECONDS.observe(record.get("seconds", 0.0), strategy="multi-hop", hop=str(record["hop"]))
+        HOPS_TAKEN.inc(len(hops), strategy="multi-hop")
+        HOP_STOPS.inc(reason=stop_reason)
+        span = tracing.current_span()
+        if span is not None:
+            span.set(hops=len(hops), stop_reason=stop_reason)
 
         # TODO: refactor to keep per-question doc association instead of dumping
         # all docs into questions[0].context. This would enable showing which
@@ -117,21 +314,35 @@ class MultiHopStrategy(RetrievalStrategy):
                 q.context = []
         questions.questions[0].context = all_docs
 
-        return {"questions": questions, "main_question": main_question}
+        return {
+            "questions": questions,
+            "main_question": main_question,
+            "retrieval_hops": hops,
+        }
 
     async def _retrieve_batch(
         self,
         retriever,
         questions: List[Question],
         accumulated: List[Document],
+        hop: int = 1,
     ):
-        async def fetch(q: Question):
-            return await retriever.ainvoke(q.question)
-
-        results = await asyncio.gather(*[fetch(q) for q in questions])
-        for docs in results:
+        async def fetch(q: Question, embedding: list[float]):
+            with tracing.span("retrieve", hop=hop, question=q.question) as span:
+                docs = await retriever.ainvoke_with_embedding(q.question, embedding)
+                if span is not None:
+                    span.set(docs=len(docs))
+                return docs, span
+
+        with tracing.span("retrieval", hop=hop, queries=len(questions)):
+            # One embeddings request for the whole hop, then the searches in parallel
+            embeddings = await retriever.aembed_queries([q.question for q in questions])
+            results = await asyncio.gather(*[fetch(q, e) for q, e in zip(questions, embeddings)])
+        for docs, span in results:
             new_docs = _deduplicate(accumulated, docs)
             accumulated.extend(new_docs)
+            if span is not None:
+                span.set(new_docs=len(new_docs))
 
     def _entity_cross_book_queries(self, docs: List[Document]) -> List[Question]:
         """Look up entities from retrieved chunks in the entity index.
@@ -196,8 +407,110 @@ class MultiHopStrategy(RetrievalStrategy):
         finally:
             index.close()
 
+    def _context_covers_question(self, question: str, docs: List[Document]) -> bool:
+        """Cheap local sufficiency check that can replace an analyzer call.
+
+        Every content term of the question must appear in the retrieved text, and
+        every indexed entity named in the question must be defined (not merely
+        referenced) by one of the retrieved chunks.
+        """
+        terms = _question_terms(question)
+        if not terms or not docs:
+            return False
+        context_lower = "\n".join(doc.page_content for doc in docs).lower()
+        if any(term not in context_lower for term in terms):
+            return False
+
+        if not settings.enable_entity_retrieval:
+            return True
+
+        try:
+            from rpg_rules_ai.entity_index import EntityIndex
+            index = EntityIndex()
+        except Exception:
+            return True
+
+        try:
+            defined: set[str] = set()
+            mentioned: set[str] = set()
+            for doc in docs:
+                cid = doc.metadata.get("doc_id", "")
+                if not cid:
+                    continue
+                for m in index.query_entity_by_chunk(cid):
+                    mentioned.add(m.entity_name.lower())
+                    if m.mention_type == "defines":
+                        defined.add(m.entity_name.lower())
+            question_lower = question.lower()
+            asked = {name for name in mentioned if name in question_lower}
+            return asked <= defined
+        except Exception as exc:
+            logger.warning("Entity sufficiency pre-check failed: %s", exc)
+            return False
+        finally:
+            index.close()
+
     def _format_context(self, docs: List[Document]) -> str:
         return "\n\n".join(
             f"[{doc.metadata.get('book', 'Unknown')}]\n{doc.page_content}"
             for doc in docs
         )
+
+    def _format_digest_line(self, doc: Document) -> str:
+        book = doc.metadata.get("book", "Unknown")
+        headers = " > ".join(
+            doc.metadata[key] for key in ("h2", "h3") if doc.metadata.get(key)
+        )
+        snippet = " ".join(doc.page_content.split())[:DIGEST_SNIPPET_CHARS]
+        if headers:
+            return f"- [{book}] {headers}: {snippet}"
+        return f"- [{book}] {snippet}"
+
+    def _format_incremental_context(
+        self,
+        seen_docs: List[Document],
+        new_docs: List[Document],
+        max_tokens: int,
+    ) -> tuple[str, str, int]:
+        """Build (digest, context, included) for the incremental analyzer.
+
+        Documents already analyzed collapse to one digest line each; only newly
+        retrieved documents are sent in full. The two parts together never exceed
+        max_tokens: the digest is capped at half the budget, dropping the oldest
+        lines first, and new documents fill the rest in retrieval order, the last
+        one truncated to fit. `included` is how many of new_docs were sent in
+        full; a truncated one is not counted, so it stays new for the next hop.
+        """
+        lines: list[str] = []
+        used = 0
+        for doc in reversed(seen_docs):
+            line = self._format_digest_line(doc)
+            cost = count_tokens(line) + (1 if lines else 0)
+            if used + cost > max_tokens // 2:
+                break
+            lines.append(line)
+            used += cost
+        digest = "\n".join(reversed(lines)) or "(none)"
+        digest = truncate_to_tokens(digest, max_tokens // 2)
+        remaining = max_tokens - count_tokens(digest)
+
+        blocks: list[str] = []
+        complete = 0
+        for doc in new_docs:
+            block = f"[{doc.metadata.get('book', 'Unknown')}]\n{doc.page_content}"
+            # Account for the blank line joining blocks
+            cost = count_tokens(block) + (1 if blocks else 0)
+            if cost > remaining:
+                truncated = truncate_to_tokens(block, remaining - (1 if blocks else 0))
+                if truncated:
+                    blocks.append(truncated)
+                break
+            blocks.append(block)
+            complete += 1
+            remaining -= cost
+        # Joining can merge tokens across block boundaries; enforce the cap on the result
+        joined = "\n\n".join(blocks)
+        context = truncate_to_tokens(joined, max_tokens - count_tokens(digest))
+        if context != joined and complete == len(blocks):
+            complete -= 1
+        return digest, context, complete
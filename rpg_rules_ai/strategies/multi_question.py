@@ -1,9 +1,11 @@
 import asyncio
+import time
 
-from langchain_openai import ChatOpenAI
-
+from rpg_rules_ai import tracing
 from rpg_rules_ai.config import settings
+from rpg_rules_ai.metrics import HOP_SECONDS, HOPS_TAKEN, timed_stage
 from rpg_rules_ai.prompts import get_multi_question_prompt
+from rpg_rules_ai.providers import get_chat_model
 from rpg_rules_ai.retriever import get_retriever
 from rpg_rules_ai.schemas import LLMQuestions, Question, Questions, State
 from rpg_rules_ai.strategies.base import RetrievalStrategy
@@ -11,14 +13,15 @@ from rpg_rules_ai.strategies.base import RetrievalStrategy
 
 class MultiQuestionStrategy(RetrievalStrategy):
     async def execute(self, state: State) -> dict:
-        llm = ChatOpenAI(model=settings.llm_model, temperature=0)
+        llm = get_chat_model(model=settings.llm_model, temperature=0)
         prompt = get_multi_question_prompt()
         chain = prompt | llm.with_structured_output(LLMQuestions)
 
         main_question = state["main_question"]
-        llm_result = await chain.ainvoke(
-            {"messages": [("user", f"Expand the following question: {main_question}")]}
-        )
+        with timed_stage("expansion"):
+            llm_result = await chain.ainvoke(
+                {"messages": [("user", f"Expand the following question: {main_question}")]}
+            )
         questions = Questions(
             questions=[Question(question=q.question) for q in llm_result.questions]
         )
@@ -26,9 +29,20 @@ class MultiQuestionStrategy(RetrievalStrategy):
 
         retriever = get_retriever()
 
-        async def process_question(question):
-            question.context = await retriever.ainvoke(question.question)
-
-        await asyncio.gather(*[process_question(q) for q in questions.questions])
+        async def process_question(question, embedding):
+            with tracing.span("retrieve", hop=1, question=question.question) as span:
+                question.context = await retriever.ainvoke_with_embedding(question.question, embedding)
+                if span is not None:
+                    span.set(docs=len(question.context))
+
+        started = time.monotonic()
+        with tracing.span("retrieval", hop=1, queries=len(questions.questions)):
+            # One embeddings request for all sub-questions, then the searches in parallel
+            embeddings = await retriever.aembed_queries([q.question for q in questions.questions])
+            await asyncio.gather(*[
+                process_question(q, e) for q, e in zip(questions.questions, embeddings)
+            ])
+        HOP_SECONDS.observe(time.monotonic() - started, strategy="multi-question", hop="1")
+        HOPS_TAKEN.inc(strategy="multi-question")
 
         return {"questions": questions, "main_question": main_question}
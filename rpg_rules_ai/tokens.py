@@ -0,0 +1,91 @@
+"""Local token counting for prompt budgets.
+
+Uses tiktoken when its encoding files are available. Otherwise falls back to a
+deterministic estimate so budgets still work offline.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import re
+
+from rpg_rules_ai.config import settings
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_ENCODING = "o200k_base"
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+_encoding_unavailable = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_unavailable
+    if _encoding is not None or _encoding_unavailable:
+        return _encoding
+    try:
+        import tiktoken
+
+        try:
+            _encoding = tiktoken.encoding_for_model(settings.llm_model)
+        except KeyError:
+            _encoding = tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as exc:
+        logger.info("tiktoken unavailable, using estimated token counts: %s", exc)
+        _encoding_unavailable = True
+    return _encoding
+
+
+def _piece_cost(piece: str) -> int:
+    return max(1, (len(piece) + 3) // 4)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text with the local tokenizer."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return sum(_piece_cost(m.group()) for m in _PIECE_RE.finditer(text))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# Texts up to this length have their counts memoized by token_length
+_CACHED_TEXT_MAX_CHARS = 2000
+
+
+@functools.lru_cache(maxsize=65536)
+def _cached_count(text: str) -> int:
+    return count_tokens(text)
+
+
+def token_length(text: str) -> int:
+    """count_tokens memoized for short texts.
+
+    The chunk splitters measure the same paragraphs and lines repeatedly
+    (recursion, overlap, then again for the children), so repeats are cached.
+    """
+    if len(text) > _CACHED_TEXT_MAX_CHARS:
+        return count_tokens(text)
+    return _cached_count(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens, keeping the beginning."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        used = 0
+        for m in _PIECE_RE.finditer(text):
+            used += _piece_cost(m.group())
+            if used > max_tokens:
+                return text[: m.start()].rstrip()
+        return text
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,140 @@
+"""Lightweight request tracing with contextvars, independent of LangSmith.
+
+A trace is only collected inside `collect_trace()`; elsewhere `span()` is a
+cheap no-op. Spans nest by async context, so concurrent sub-queries started
+with asyncio.gather each get their own span under the step that started them.
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    end: float | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    children: list[Span] = field(default_factory=list)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "end_ms": round((end - origin) * 1000, 2),
+            "duration_ms": round((end - self.start) * 1000, 2),
+            "attributes": dict(self.attributes),
+            "children": [c.to_dict(origin) for c in self.children],
+        }
+
+
+@dataclass
+class Trace:
+    started: float = field(default_factory=time.perf_counter)
+    spans: list[Span] = field(default_factory=list)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    embedding_calls: int = 0
+    cache_hits: dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "embedding_calls": self.embedding_calls,
+            "cache_hits": dict(self.cache_hits),
+            "spans": [s.to_dict(self.started) for s in self.spans],
+        }
+
+
+_trace: ContextVar[Trace | None] = ContextVar("rpg_trace", default=None)
+_span: ContextVar[Span | None] = ContextVar("rpg_span", default=None)
+
+
+@contextmanager
+def collect_trace() -> Iterator[Trace]:
+    """Collect spans for everything run inside the block."""
+    trace = Trace()
+    trace_token = _trace.set(trace)
+    span_token = _span.set(None)
+    try:
+        yield trace
+    finally:
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Record a timed span under the current one. Yields None when not tracing."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    current = Span(name=name, start=time.perf_counter(), attributes=attributes)
+    parent = _span.get()
+    (parent.children if parent is not None else trace.spans).append(current)
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.attributes["error"] = type(exc).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _span.reset(token)
+
+
+def current_span() -> Span | None:
+    return _span.get() if _trace.get() is not None else None
+
+
+def record_llm(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    trace = _trace.get()
+    if trace is None:
+        return
+    trace.llm_calls += 1
+    trace.prompt_tokens += prompt_tokens
+    trace.completion_tokens += completion_tokens
+    target = _span.get()
+    if target is not None:
+        target.attributes["model"] = model
+        target.add("llm_calls")
+        target.add("prompt_tokens", prompt_tokens)
+        target.add("completion_tokens", completion_tokens)
+
+
+def record_embedding_call() -> None:
+    trace = _trace.get()
+    if trace is None:
+        return
+    trace.embedding_calls += 1
+    target = _span.get()
+    if target is not None:
+        target.add("embedding_calls")
+
+
+def record_cache_hit(cache: str) -> None:
+    trace = _trace.get()
+    if trace is None:
+        return
+    trace.cache_hits[cache] = trace.cache_hits.get(cache, 0) + 1
+    target = _span.get()
+    if target is not None:
+        target.attributes.setdefault("cache_hits", []).append(cache)
@@ -0,0 +1,153 @@
+"""Benchmark the rerank stage against sending every retrieved parent to generate.
+
+For each question, runs the configured retrieval strategy once, then generates
+an answer from the full context (current behaviour) and from the reranked
+context. Reports context size, generation latency and citation recall: the
+share of passages cited by the full-context answer that survive reranking.
+
+Usage:
+    uv run python scripts/benchmark_rerank.py [--questions FILE] [--max-tokens N] [--output FILE]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.messages import HumanMessage
+
+from rpg_rules_ai.config import settings
+from rpg_rules_ai.context_packing import pack_context
+from rpg_rules_ai.graph import generate
+from rpg_rules_ai.rerank import rerank_documents, unique_documents
+from rpg_rules_ai.schemas import Question, Questions
+from rpg_rules_ai.strategies import get_strategy
+from rpg_rules_ai.tokens import count_tokens
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTIONS = [
+    "How does Rapid Strike work and what penalties apply?",
+    "Can I combine Extra Attack with All-Out Attack (Double)?",
+    "How much does Magery cost and what does each level do?",
+    "What are the rules for Deceptive Attack against a parry?",
+    "How does Fatigue work for spellcasting?",
+]
+
+
+def _text(doc) -> str:
+    return doc.metadata.get("original_text", doc.page_content)
+
+
+def _context_tokens(docs) -> int:
+    return sum(count_tokens(_text(d)) for d in docs)
+
+
+async def _answer(state: dict, docs) -> tuple[dict, float]:
+    questions = Questions(questions=[Question(question=state["main_question"], context=docs)])
+    start = time.perf_counter()
+    result = await generate({**state, "questions": questions})
+    return result["answer"], time.perf_counter() - start
+
+
+def _cited_texts(answer: dict, docs) -> set[str]:
+    # generate numbers the packed passages in order, starting at 1
+    packed = pack_context(docs, settings.context_max_tokens, settings.context_passage_max_tokens)
+    numbered = {i + 1: _text(d) for i, (d, _) in enumerate(packed)}
+    return {numbered[c["index"]] for c in answer.get("citations", []) if c.get("index") in numbered}
+
+
+async def benchmark_question(question: str, max_tokens: int) -> dict:
+    state = {"messages": [HumanMessage(content=question)], "main_question": question}
+    retrieved = await get_strategy().execute(state)
+    state = {**state, **retrieved}
+
+    full_docs = unique_documents([d for q in retrieved["questions"].questions for d in q.context])
+    reranked = rerank_documents(question, full_docs, max_tokens)
+
+    full_answer, full_seconds = await _answer(state, full_docs)
+    reranked_answer, reranked_seconds = await _answer(state, reranked)
+
+    cited = _cited_texts(full_answer, full_docs)
+    kept = {_text(d) for d in reranked}
+    recall = len(cited & kept) / len(cited) if cited else 1.0
+
+    return {
+        "question": question,
+        "full": {
+            "passages": len(full_docs),
+            "context_tokens": _context_tokens(full_docs),
+            "generate_seconds": round(full_seconds, 3),
+            "citations": len(full_answer.get("citations", [])),
+        },
+        "reranked": {
+            "passages": len(reranked),
+            "context_tokens": _context_tokens(reranked),
+            "generate_seconds": round(reranked_seconds, 3),
+            "citations": len(reranked_answer.get("citations", [])),
+        },
+        "citation_recall": round(recall, 3),
+    }
+
+
+def summarize(results: list[dict]) -> dict:
+    def median(section: str, key: str) -> float:
+        return statistics.median(r[section][key] for r in results)
+
+    return {
+        "questions": len(results),
+        "median_full_context_tokens": median("full", "context_tokens"),
+        "median_reranked_context_tokens": median("reranked", "context_tokens"),
+        "median_full_generate_seconds": median("full", "generate_seconds"),
+        "median_reranked_generate_seconds": median("reranked", "generate_seconds"),
+        "mean_citation_recall": round(statistics.mean(r["citation_recall"] for r in results), 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark rerank vs full-context generation")
+    parser.add_argument("--questions", type=Path, help="Text file with one question per line")
+    parser.add_argument("--max-tokens", type=int, default=settings.rerank_max_tokens)
+    parser.add_argument("--output", type=Path, help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    if args.questions:
+        questions = [
+            line.strip() for line in args.questions.read_text(encoding="utf-8").splitlines()
+            if line.strip()
+        ]
+    else:
+        questions = DEFAULT_QUESTIONS
+
+    results = []
+    for question in questions:
+        logger.info("Benchmarking: %s", question)
+        stats = await benchmark_question(question, args.max_tokens)
+        logger.info(
+            "  passages %d -> %d, tokens %d -> %d, generate %.2fs -> %.2fs, recall %.2f",
+            stats["full"]["passages"], stats["reranked"]["passages"],
+            stats["full"]["context_tokens"], stats["reranked"]["context_tokens"],
+            stats["full"]["generate_seconds"], stats["reranked"]["generate_seconds"],
+            stats["citation_recall"],
+        )
+        results.append(stats)
+
+    report = {"max_tokens": args.max_tokens, "summary": summarize(results), "results": results}
+    logger.info("Summary: %s", json.dumps(report["summary"]))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        logger.info("Wrote %s", args.output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -9,6 +9,7 @@ from langchain_core.documents import Document
 
 from rpg_rules_ai.api import app
 from rpg_rules_ai import services
+from rpg_rules_ai.job_queue import JobQueue
 from rpg_rules_ai.prompts import PROMPTS_DIR
 from rpg_rules_ai.schemas import Question, Questions
 
@@ -19,10 +20,14 @@ def client():
 
 
 @pytest.fixture(autouse=True)
-def clear_jobs():
-    services._jobs.clear()
-    yield
-    services._jobs.clear()
+def job_queue(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    with (
+        patch.object(services, "_job_queue", queue),
+        patch.object(services, "_job_pool", MagicMock()),
+    ):
+        yield queue
+    queue.close()
 
 
 # --- Health ---
@@ -34,6 +39,17 @@ def test_health(client):
     assert resp.json() == {"status": "ok"}
 
 
+def test_metrics_endpoint(client):
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    assert "# TYPE rpg_ask_seconds histogram" in body
+    assert "# TYPE rpg_llm_calls_total counter" in body
+    assert "rpg_ingest_jobs_active 0" in body
+    assert "rpg_checkpointer_threads" in body
+
+
 # --- POST /ask ---
 
 
@@ -57,6 +73,28 @@ def test_ask_returns_answer(client):
     assert "Basic Set" in data["sources"]
 
 
+def test_ask_debug_attaches_trace(client):
+    from rpg_rules_ai import tracing
+
+    async def fake_ainvoke(*args, **kwargs):
+        with tracing.span("node:generate"):
+            tracing.record_llm("gpt-4o", 100, 20)
+        return {"answer": {"answer": "A", "sources": [], "citations": []}}
+
+    mock_graph = AsyncMock()
+    mock_graph.ainvoke = fake_ainvoke
+
+    with patch("rpg_rules_ai.services._get_graph", return_value=mock_graph):
+        plain = client.post("/api/ask", json={"question": "Q"}).json()
+        debug = client.post("/api/ask", json={"question": "Q", "debug": True}).json()
+
+    assert "trace" not in plain
+    trace = debug["trace"]
+    assert trace["llm_calls"] == 1
+    assert trace["spans"][0]["name"] == "node:generate"
+    assert trace["spans"][0]["attributes"]["prompt_tokens"] == 100
+
+
 def test_ask_missing_question(client):
     resp = client.post("/api/ask", json={})
     assert resp.status_code == 422
@@ -86,21 +124,19 @@ def test_list_documents_empty(client):
 # --- POST /documents/ingest ---
 
 
-def test_ingest_starts_job(client, tmp_path):
+def test_ingest_starts_job(client, tmp_path, job_queue):
     md = tmp_path / "test.md"
     md.write_text("# Test")
 
-    with patch.object(
-        __import__("rpg_rules_ai.ingestion_job", fromlist=["IngestionJob"]).IngestionJob,
-        "start",
-    ):
-        resp = client.post(
-            "/api/documents/ingest",
-            json={"paths": [str(md)], "replace": False},
-        )
+    resp = client.post(
+        "/api/documents/ingest",
+        json={"paths": [str(md)], "replace": False},
+    )
 
     assert resp.status_code == 202
     assert "job_id" in resp.json()
+    assert job_queue.get_progress(resp.json()["job_id"])["status"] == "pending"
+    services._job_pool.notify.assert_called_once()
 
 
 def test_ingest_invalid_path(client):
@@ -114,14 +150,12 @@ def test_ingest_invalid_path(client):
 # --- GET /documents/jobs/{job_id} ---
 
 
-def test_job_progress_found(client):
-    from rpg_rules_ai.ingestion_job import IngestionJob
-
-    job = IngestionJob(paths=[])
-    job._progress["status"] = "done"
-    services._jobs["test-id"] = job
+def test_job_progress_found(client, job_queue):
+    job_id = job_queue.enqueue([])
+    job_queue.claim()
+    job_queue.finish(job_id, "done", job_queue.get_progress(job_id))
 
-    resp = client.get("/api/documents/jobs/test-id")
+    resp = client.get(f"/api/documents/jobs/{job_id}")
     assert resp.status_code == 200
     assert resp.json()["status"] == "done"
 
@@ -131,6 +165,24 @@ def test_job_progress_not_found(client):
     assert resp.status_code == 404
 
 
+# --- DELETE /documents/jobs/{job_id} ---
+
+
+def test_cancel_pending_job(client, job_queue):
+    job_id = job_queue.enqueue([])
+
+    resp = client.delete(f"/api/documents/jobs/{job_id}")
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "cancelled"
+
+    # Already finished
+    assert client.delete(f"/api/documents/jobs/{job_id}").status_code == 409
+
+
+def test_cancel_job_not_found(client):
+    assert client.delete("/api/documents/jobs/nonexistent").status_code == 404
+
+
 # --- DELETE /documents/{book} ---
 
 
@@ -0,0 +1,111 @@
+"""Tests for per-book ingestion checkpoints."""
+
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+from rpg_rules_ai import checkpoints
+from rpg_rules_ai.checkpoints import (
+    IngestCheckpoint,
+    discard_checkpoint,
+    incomplete_books,
+    source_fingerprint,
+)
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_root(tmp_path):
+    root = tmp_path / "checkpoints"
+    with patch("rpg_rules_ai.checkpoints._checkpoint_root", return_value=root):
+        yield root
+
+
+def _create(book: str = "Basic Set.md") -> IngestCheckpoint:
+    parents = [Document(page_content="parent", metadata={"book": book, "doc_id": "p1"})]
+    children = [
+        Document(page_content=f"child {i}", metadata={"book": book, "doc_id": "p1", "start_index": i})
+        for i in range(3)
+    ]
+    return IngestCheckpoint.create(book, "abc", "gen1", parents, children, ["c0", "c1", "c2"])
+
+
+def test_round_trip():
+    _create()
+    loaded = IngestCheckpoint.load("Basic Set.md")
+
+    assert loaded.resumed is True
+    assert loaded.fingerprint == "abc"
+    assert loaded.generation == "gen1"
+    assert loaded.stages == ["split"]
+    assert loaded.children_stored == 0
+    assert loaded.child_ids == ["c0", "c1", "c2"]
+    assert [c.page_content for c in loaded.children] == ["child 0", "child 1", "child 2"]
+    assert loaded.children[1].metadata["start_index"] == 1
+    assert list(loaded.parent_map) == ["p1"]
+
+
+def test_child_offsets_are_stored_without_text(checkpoint_root):
+    import json
+
+    from rpg_rules_ai.chunking import ChildChunks
+
+    parents = [Document(page_content="Rapid Strike: two attacks", metadata={"doc_id": "p1", "generation": "gen1"})]
+    children = ChildChunks(parents, [(0, 0, 12), (0, 14, 25)])
+    IngestCheckpoint.create("Martial Arts.md", "abc", "gen1", parents, children, ["c0", "c1"])
+
+    stored = json.loads(next(checkpoint_root.glob("*/chunks.json")).read_text())
+    assert "children" not in stored
+    assert stored["child_spans"] == [[0, 0, 12], [0, 14, 25]]
+
+    loaded = IngestCheckpoint.load("Martial Arts.md")
+    assert [c.page_content for c in loaded.children] == ["Rapid Strike", "two attacks"]
+    assert loaded.children[1].metadata == {"doc_id": "p1", "generation": "gen1", "start_index": 14}
+
+
+def test_stages_and_batches_persist():
+    checkpoint = _create()
+    checkpoint.update_children(
+        [Document(page_content="ctx child", metadata={"doc_id": "p1"})], "contextualize"
+    )
+    checkpoint.mark("entities")
+    checkpoint.mark_stored(2)
+
+    loaded = IngestCheckpoint.load("Basic Set.md")
+    assert loaded.done("contextualize") and loaded.done("entities")
+    assert loaded.children_stored == 2
+    assert [c.page_content for c in loaded.children] == ["ctx child"]
+
+
+def test_missing_or_corrupt_checkpoint_loads_as_none(checkpoint_root):
+    assert IngestCheckpoint.load("Nothing.md") is None
+
+    _create()
+    state = next(checkpoint_root.glob("*/state.json"))
+    state.write_text("{not json")
+    assert IngestCheckpoint.load("Basic Set.md") is None
+
+
+def test_incomplete_books_tracks_create_and_clear():
+    assert incomplete_books() == []
+    checkpoint = _create("B.md")
+    _create("A.md")
+    assert incomplete_books() == ["A.md", "B.md"]
+
+    checkpoint.clear()
+    assert incomplete_books() == ["A.md"]
+    discard_checkpoint("A.md")
+    assert incomplete_books() == []
+
+
+def test_fingerprint_covers_content_and_chunking(tmp_path):
+    path = tmp_path / "book.md"
+    path.write_text("# Book\nText.")
+    original = source_fingerprint(path)
+    assert source_fingerprint(path) == original
+
+    with patch.object(checkpoints.settings, "child_chunk_size", 9999):
+        assert source_fingerprint(path) != original
+
+    path.write_text("# Book\nOther text.")
+    assert source_fingerprint(path) != original
@@ -1,12 +1,21 @@
 """Tests for section-aware chunking module."""
 
+import random
 from unittest.mock import patch
 
 from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from rpg_rules_ai.chunking import (
+    ChildChunks,
+    _SpanSplitter,
+    child_ids,
+    chunk_length,
+    get_child_splitter,
+    iter_sections,
     split_into_sections,
     split_parents_into_children,
+    split_sections,
     split_sections_into_parents,
 )
 
@@ -36,6 +45,171 @@ class TestSplitIntoSections:
         assert "plain text" in sections[0].page_content
 
 
+class TestIterSections:
+    LINES = [
+        "## COMBAT", "### Rapid Strike", "#### Deeper", "# Title", "##", "###", "##nospace",
+        "Strike rules.", "  indented text  ", "", "", "```", "~~~", "inline ```code``` here",
+        "**BOLD**", "- item", "\t", "\x0bcontrol",
+    ]
+
+    def test_matches_split_into_sections_on_random_documents(self):
+        rng = random.Random(1234)
+        for _ in range(500):
+            md = "\n".join(rng.choice(self.LINES) for _ in range(rng.randint(0, 40)))
+            expected = split_into_sections(md)
+            streamed = list(iter_sections(md.split("\n")))
+            assert [(d.page_content, d.metadata) for d in streamed] == [
+                (d.page_content, d.metadata) for d in expected
+            ], md
+
+    def test_yields_section_once_the_next_one_starts(self):
+        def lines():
+            yield from ["## COMBAT", "Strike rules.", "## MAGIC", "Spells.", ""]
+            raise AssertionError("read past the next section's first paragraph")
+
+        sections = iter_sections(lines())
+        assert next(sections).metadata == {"h2": "COMBAT"}
+
+
+def _random_text(rng: random.Random, words: int) -> str:
+    # Numbered words keep every chunk unique, so langchain's start_index
+    # (found with str.find) is the true offset
+    pieces = []
+    for i in range(words):
+        pieces.append(f"w{i}" + "x" * rng.choice([0, 0, 0, 3, 40, 150]))
+        pieces.append(rng.choice([" ", " ", " ", "  ", "\n", "\n\n", "\n\n\n", " \n", "\t"]))
+    return "".join(pieces)
+
+
+class TestSpanSplitter:
+    def test_matches_recursive_character_splitter(self):
+        rng = random.Random(46)
+        for _ in range(300):
+            size = rng.choice([10, 50, 100, 200, 500])
+            overlap = rng.randint(0, size // 2)
+            text = _random_text(rng, rng.randint(0, 300))
+            expected = RecursiveCharacterTextSplitter(
+                chunk_size=size, chunk_overlap=overlap, add_start_index=True
+            ).create_documents([text])
+
+            spans = _SpanSplitter(size, overlap).split(text)
+
+            assert [text[a:b] for a, b in spans] == [d.page_content for d in expected]
+            assert [a for a, _ in spans] == [d.metadata["start_index"] for d in expected]
+
+    def test_splits_inside_a_span(self):
+        text = "head " + "Rapid Strike lets you attack twice. " * 10 + "tail"
+        start, end = 5, len(text) - 4
+        spans = _SpanSplitter(60, 10).split(text, start, end)
+
+        expected = RecursiveCharacterTextSplitter(chunk_size=60, chunk_overlap=10).split_text(text[start:end])
+        assert [text[a:b] for a, b in spans] == expected
+        assert all(start <= a < b <= end for a, b in spans)
+
+    def test_matches_splitter_with_length_function(self):
+        def words(t):
+            return len(t.split())
+
+        rng = random.Random(47)
+        for _ in range(100):
+            size = rng.choice([5, 20, 60])
+            overlap = rng.randint(0, size // 2)
+            text = _random_text(rng, rng.randint(0, 300))
+            expected = RecursiveCharacterTextSplitter(
+                chunk_size=size, chunk_overlap=overlap, length_function=words
+            ).split_text(text)
+
+            spans = _SpanSplitter(size, overlap, words).split(text)
+
+            assert [text[a:b] for a, b in spans] == expected
+
+
+class TestChunkLength:
+    @patch("rpg_rules_ai.chunking.settings")
+    def test_chars_by_default(self, mock_settings):
+        mock_settings.chunk_length_unit = "chars"
+        assert chunk_length() is len
+
+    @patch("rpg_rules_ai.chunking.settings")
+    def test_tokens_mode_uses_local_tokenizer(self, mock_settings):
+        from rpg_rules_ai.tokens import token_length
+
+        mock_settings.chunk_length_unit = "tokens"
+        mock_settings.child_chunk_size = 300
+        mock_settings.child_chunk_overlap = 50
+        assert chunk_length() is token_length
+        assert get_child_splitter()._length_function is token_length
+
+    @patch("rpg_rules_ai.chunking.settings")
+    def test_tokens_mode_sizes_parents_and_children_in_tokens(self, mock_settings):
+        mock_settings.chunk_length_unit = "tokens"
+        mock_settings.parent_chunk_max = 40
+        mock_settings.parent_chunk_overlap = 0
+        mock_settings.child_chunk_size = 10
+        mock_settings.child_chunk_overlap = 0
+        # 30 words: over 40 characters, but within 40 tokens
+        section = Document(page_content=" ".join(["a"] * 30), metadata={"h2": "Short"})
+
+        with patch("rpg_rules_ai.tokens.token_length", side_effect=lambda t: len(t.split())):
+            parents, children, _ = split_sections([section])
+
+        assert [p.page_content for p in parents] == [section.page_content]
+        assert [len(c.page_content.split()) for c in children] == [10, 10, 10]
+
+
+def _without_ids(docs):
+    return [(d.page_content, {k: v for k, v in d.metadata.items() if k != "doc_id"}) for d in docs]
+
+
+class TestSplitSections:
+    def _langchain(self, sections):
+        """The splitting split_sections replaces, on RecursiveCharacterTextSplitter."""
+        parent_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=40, add_start_index=True)
+        child_splitter = RecursiveCharacterTextSplitter(chunk_size=80, chunk_overlap=15, add_start_index=True)
+        parents = []
+        for section in sections:
+            if len(section.page_content) <= 300:
+                parents.append(section)
+            else:
+                parents.extend(parent_splitter.split_documents([section]))
+        children = []
+        for parent in parents:
+            children.extend(child_splitter.split_documents([parent]))
+        return parents, children
+
+    @patch("rpg_rules_ai.chunking.settings")
+    def test_same_chunks_as_separate_splitters(self, mock_settings):
+        mock_settings.parent_chunk_max = 300
+        mock_settings.parent_chunk_overlap = 40
+        mock_settings.child_chunk_size = 80
+        mock_settings.child_chunk_overlap = 15
+        rng = random.Random(7)
+        sections = [
+            Document(page_content=_random_text(rng, rng.randint(1, 120)), metadata={"h2": f"S{i}", "book": "B.md"})
+            for i in range(30)
+        ]
+
+        parents, children, parent_map = split_sections([Document(**s.model_dump()) for s in sections])
+        expected_parents, expected_children = self._langchain(sections)
+
+        assert _without_ids(parents) == _without_ids(expected_parents)
+        assert _without_ids(children) == _without_ids(expected_children)
+        assert {c.metadata["doc_id"] for c in children} <= set(parent_map)
+        assert list(parent_map.values()) == parents
+
+    def test_children_are_built_on_access_from_parent_metadata(self):
+        parents = [Document(page_content="Rapid Strike: two attacks", metadata={"doc_id": "p1"})]
+        children = ChildChunks(parents, [(0, 0, 12), (0, 14, 25)])
+
+        parents[0].metadata["generation"] = "g1"
+
+        assert len(children) == 2
+        assert children[1].page_content == "two attacks"
+        assert children[1].metadata == {"doc_id": "p1", "generation": "g1", "start_index": 14}
+        assert [c.page_content for c in children[:1]] == ["Rapid Strike"]
+        assert [c.page_content for c in children] == ["Rapid Strike", "two attacks"]
+
+
 class TestSplitSectionsIntoParents:
     @patch("rpg_rules_ai.chunking.settings")
     def test_small_sections_stay_whole(self, mock_settings):
@@ -118,3 +292,64 @@ class TestSplitParentsIntoChildren:
 
         assert len(parent_map) == 2
         assert len(children) >= 2
+
+
+class TestDeterministicIds:
+    def _sections(self, text="Rapid Strike lets you attack twice. " * 20):
+        return [
+            Document(page_content=text, metadata={"book": "Martial Arts.md", "h2": "Combat", "h3": "Rapid Strike"}),
+            Document(page_content="Feint: a Quick Contest.", metadata={"book": "Martial Arts.md", "h2": "Combat"}),
+        ]
+
+    @patch("rpg_rules_ai.chunking.settings")
+    def test_same_content_gives_same_ids(self, mock_settings):
+        mock_settings.parent_chunk_max = 300
+        mock_settings.parent_chunk_overlap = 0
+        mock_settings.child_chunk_size = 100
+        mock_settings.child_chunk_overlap = 0
+
+        first, first_children, _ = split_sections(self._sections())
+        second, second_children, _ = split_sections(self._sections())
+
+        assert [p.metadata["doc_id"] for p in first] == [p.metadata["doc_id"] for p in second]
+        assert child_ids(first_children) == child_ids(second_children)
+        assert len(set(child_ids(first_children))) == len(first_children)
+
+    @patch("rpg_rules_ai.chunking.settings")
+    def test_ids_change_with_content_book_and_section(self, mock_settings):
+        mock_settings.parent_chunk_max = 4000
+        mock_settings.parent_chunk_overlap = 0
+        mock_settings.child_chunk_size = 100
+        mock_settings.child_chunk_overlap = 0
+
+        def first_id(section):
+            return split_sections([section])[0][0].metadata["doc_id"]
+
+        base = Document(page_content="Feint", metadata={"book": "A.md", "h2": "Combat"})
+        ids = {
+            first_id(base),
+            first_id(Document(page_content="Feint!", metadata={"book": "A.md", "h2": "Combat"})),
+            first_id(Document(page_content="Feint", metadata={"book": "B.md", "h2": "Combat"})),
+            first_id(Document(page_content="Feint", metadata={"book": "A.md", "h2": "Magic"})),
+        }
+        assert len(ids) == 4
+
+    @patch("rpg_rules_ai.chunking.settings")
+    def test_identical_sections_get_distinct_ids(self, mock_settings):
+        mock_settings.parent_chunk_max = 4000
+        mock_settings.parent_chunk_overlap = 0
+        mock_settings.child_chunk_size = 100
+        mock_settings.child_chunk_overlap = 0
+        sections = [Document(page_content="See p. B123.", metadata={"book": "A.md", "h2": "Example"}) for _ in range(3)]
+
+        parents, _, parent_map = split_sections(sections)
+
+        assert len(parent_map) == 3
+        assert parents[1].metadata["doc_id"] == parents[0].metadata["doc_id"] + "-1"
+
+    def test_child_ids_depend_on_generation(self):
+        child = Document(page_content="Feint", metadata={"doc_id": "p1", "start_index": 0, "generation": "g1"})
+        other = Document(page_content="Feint", metadata={"doc_id": "p1", "start_index": 0, "generation": "g2"})
+
+        assert child_ids([child]) == child_ids([child])
+        assert child_ids([child]) != child_ids([other])
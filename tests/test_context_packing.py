@@ -0,0 +1,111 @@
+"""Tests for token-budgeted context packing."""
+
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+from rpg_rules_ai import tokens
+from rpg_rules_ai.context_packing import pack_context, trim_around_hits
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens():
+    with patch.object(tokens, "_get_encoding", return_value=None):
+        yield
+
+
+def _doc(text: str, book: str = "Basic Set", **meta) -> Document:
+    return Document(page_content=text, metadata={"book": book, **meta})
+
+
+def _long_section(hit: str) -> tuple[str, list[list[int]]]:
+    filler = " ".join(f"filler{i}" for i in range(400))
+    text = f"## Combat\n{filler} {hit} {filler}"
+    start = text.index(hit)
+    return text, [[start, start + len(hit)]]
+
+
+class TestTrimAroundHits:
+    def test_short_text_unchanged(self):
+        assert trim_around_hits("Rapid Strike.", [[0, 5]], 100) == "Rapid Strike."
+
+    def test_keeps_hit_and_heading(self):
+        hit = "Rapid Strike allows two attacks at -6 each."
+        text, hits = _long_section(hit)
+
+        trimmed = trim_around_hits(text, hits, 120)
+
+        assert hit in trimmed
+        assert trimmed.startswith("## Combat")
+        assert "[...]" in trimmed
+        assert tokens.count_tokens(trimmed) <= 120
+
+    def test_without_hits_keeps_beginning(self):
+        text, _ = _long_section("anything")
+        trimmed = trim_around_hits(text, [], 50)
+        assert text.startswith(trimmed)
+        assert tokens.count_tokens(trimmed) <= 50
+
+    def test_out_of_range_hits_ignored(self):
+        text, _ = _long_section("anything")
+        trimmed = trim_around_hits(text, [[len(text) + 10, len(text) + 20]], 50)
+        assert text.startswith(trimmed)
+
+    def test_first_hits_win_when_budget_is_tight(self):
+        filler = " ".join(f"filler{i}" for i in range(300))
+        first_hit = "FIRSTHIT " + "alpha " * 30
+        second_hit = "SECONDHIT " + "beta " * 30
+        text = f"{filler} {first_hit} {filler} {second_hit} {filler}"
+        first = text.index(first_hit)
+        second = text.index(second_hit)
+        hits = [[second, second + len(second_hit)], [first, first + len(first_hit)]]
+
+        trimmed = trim_around_hits(text, hits, 50)
+
+        assert "SECONDHIT" in trimmed
+        assert "FIRSTHIT" not in trimmed
+        assert tokens.count_tokens(trimmed) <= 50
+
+
+class TestPackContext:
+    def test_everything_fits(self):
+        docs = [_doc("Rapid Strike rules."), _doc("Fireball rules.")]
+        packed = pack_context(docs, max_tokens=1000, passage_max_tokens=500)
+        assert [text for _, text in packed] == ["Rapid Strike rules.", "Fireball rules."]
+
+    def test_dedupes_passages(self):
+        docs = [_doc("Same."), _doc("Same.")]
+        assert len(pack_context(docs, 1000, 500)) == 1
+
+    def test_total_budget_respected(self):
+        docs = [_doc(f"Passage {i}. " + "word " * 60) for i in range(10)]
+        packed = pack_context(docs, max_tokens=300, passage_max_tokens=0)
+
+        assert 0 < len(packed) < 10
+        assert [d for d, _ in packed] == docs[: len(packed)]
+        total = sum(tokens.count_tokens(text) for _, text in packed)
+        assert total <= 300
+
+    def test_oversized_parent_trimmed_around_hit(self):
+        hit = "Rapid Strike allows two attacks at -6 each."
+        text, hits = _long_section(hit)
+        packed = pack_context([_doc(text, child_hits=hits)], 5000, passage_max_tokens=150)
+
+        _, sent = packed[0]
+        assert hit in sent
+        assert len(sent) < len(text)
+
+    def test_last_passage_trimmed_to_remaining_budget(self):
+        hit = "Deceptive Attack reduces the defense by 1 per -2."
+        text, hits = _long_section(hit)
+        first = _doc("Short first passage.")
+        packed = pack_context([first, _doc(text, child_hits=hits)], 200, passage_max_tokens=0)
+
+        assert len(packed) == 2
+        assert hit in packed[1][1]
+
+    def test_zero_budgets_disable_limits(self):
+        text, hits = _long_section("hit")
+        packed = pack_context([_doc(text, child_hits=hits)], 0, 0)
+        assert packed[0][1] == text
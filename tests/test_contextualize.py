@@ -23,7 +23,7 @@ def child_doc():
 
 
 @pytest.mark.asyncio
-@patch("rpg_rules_ai.contextualize.ChatOpenAI")
+@patch("rpg_rules_ai.contextualize.get_chat_model")
 async def test_generate_context_returns_string(mock_chat_cls, parent_doc, child_doc):
     mock_llm = MagicMock()
     mock_response = MagicMock()
@@ -42,7 +42,7 @@ async def test_generate_context_returns_string(mock_chat_cls, parent_doc, child_
 
 
 @pytest.mark.asyncio
-@patch("rpg_rules_ai.contextualize.ChatOpenAI")
+@patch("rpg_rules_ai.contextualize.get_chat_model")
 async def test_generate_context_uses_custom_model(mock_chat_cls, parent_doc, child_doc):
     mock_llm = MagicMock()
     mock_response = MagicMock()
@@ -58,7 +58,7 @@ async def test_generate_context_uses_custom_model(mock_chat_cls, parent_doc, chi
 
 
 @pytest.mark.asyncio
-@patch("rpg_rules_ai.contextualize.ChatOpenAI")
+@patch("rpg_rules_ai.contextualize.get_chat_model")
 async def test_generate_context_falls_back_to_parent_headers(mock_chat_cls):
     parent = Document(
         page_content="Parent content.",
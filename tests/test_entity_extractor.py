@@ -17,7 +17,7 @@ def parent_doc():
 
 
 @pytest.mark.asyncio
-@patch("rpg_rules_ai.entity_extractor.ChatOpenAI")
+@patch("rpg_rules_ai.entity_extractor.get_chat_model")
 @patch("rpg_rules_ai.entity_extractor.ChatPromptTemplate")
 async def test_extract_entities_returns_list(mock_prompt_cls, mock_chat_cls, parent_doc):
     mock_result = ExtractedEntities(entities=[
@@ -2,6 +2,8 @@
 
 from unittest.mock import patch
 
+import pytest
+
 from rpg_rules_ai.extraction import clean_page_artifacts, postprocess_headers
 
 
@@ -120,3 +122,245 @@ class TestExtractPdf:
 
         mock_pymupdf.to_markdown.assert_called_once_with("/fake/book.pdf")
         assert result == "# Title\nContent"
+
+
+def _make_real_pdf(path, pages: int):
+    import pymupdf
+
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Rapid Strike rules, page {i}.", fontsize=11)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+class TestParallelExtractPdf:
+    @pytest.fixture(autouse=True)
+    def page_cache(self, tmp_path):
+        with patch("rpg_rules_ai.extraction.settings") as mock_settings:
+            mock_settings.pdf_page_cache_dir = str(tmp_path / "pages")
+            mock_settings.pdf_extract_workers = 0
+            yield tmp_path / "pages"
+
+    def test_page_ranges_stitched_in_order(self, tmp_path):
+        import pymupdf4llm
+
+        from rpg_rules_ai import extraction
+
+        pdf = _make_real_pdf(tmp_path / "book.pdf", 7)
+        reports = []
+        with patch.object(extraction, "PDF_PAGES_PER_RANGE", 2):
+            result = extraction.extract_pdf(pdf, on_pages=lambda d, t: reports.append((d, t)), workers=2)
+
+        assert result == pymupdf4llm.to_markdown(str(pdf))
+        assert [result.index(f"page {i}.") for i in range(7)] == sorted(result.index(f"page {i}.") for i in range(7))
+        assert reports[0] == (0, 7)
+        assert reports[-1] == (7, 7)
+        assert len(reports) == 5  # initial report plus one per range
+
+    def test_cached_pages_are_not_extracted_again(self, tmp_path, page_cache):
+        from rpg_rules_ai import extraction
+
+        pdf = _make_real_pdf(tmp_path / "book.pdf", 3)
+        first = extraction.extract_pdf(pdf, workers=1)
+        assert len(list(page_cache.glob("*/*.md"))) == 3
+
+        # Drop one page from the cache: only that page is extracted again
+        sorted(page_cache.glob("*/1.md"))[0].unlink()
+        with patch.object(extraction, "_extract_pages", wraps=extraction._extract_pages) as spy:
+            second = extraction.extract_pdf(pdf, workers=1)
+
+        assert second == first
+        spy.assert_called_once_with(str(pdf), [1])
+
+    def test_changed_file_misses_cache(self, tmp_path, page_cache):
+        from rpg_rules_ai import extraction
+
+        pdf = _make_real_pdf(tmp_path / "book.pdf", 2)
+        extraction.extract_pdf(pdf, workers=1)
+        _make_real_pdf(pdf, 3)
+        result = extraction.extract_pdf(pdf, workers=1)
+
+        assert "page 2." in result
+        assert len(list(page_cache.iterdir())) == 2
+
+    def test_pages_are_yielded_as_ranges_finish(self, tmp_path):
+        from rpg_rules_ai import extraction
+
+        pdf = _make_real_pdf(tmp_path / "book.pdf", 5)
+        with (
+            patch.object(extraction, "PDF_PAGES_PER_RANGE", 2),
+            patch.object(extraction, "_extract_pages", wraps=extraction._extract_pages) as spy,
+        ):
+            pages = extraction.iter_pdf_pages(pdf, workers=1)
+            first = next(pages)
+            assert spy.call_count == 1
+            rest = list(pages)
+
+        assert "page 0." in first
+        assert len(rest) == 4
+        assert spy.call_count == 3
+
+
+class TestStreamingPostprocess:
+    def test_iter_lines_matches_split(self):
+        chunks = ["ab\ncd", "ef", "\n", "", "gh\n\nij\n", "kl"]
+        from rpg_rules_ai.extraction import iter_lines
+
+        assert list(iter_lines(chunks)) == "".join(chunks).split("\n")
+        assert list(iter_lines([])) == [""]
+
+    def test_iter_clean_lines_matches_whole_document(self):
+        from rpg_rules_ai.extraction import iter_clean_lines
+
+        md = (
+            "**COMBAT**\n42\n***Rapid Strike***\ntext\n---\npage 7\n"
+            "**COMBAT 99**\n**_Feint_**\n  **MAGIC**  \n***ab***"
+        )
+        expected = postprocess_headers(clean_page_artifacts(md))
+        assert "\n".join(iter_clean_lines(md.split("\n"))) == expected
+
+
+_BODIES = [
+    "Rapid Strike lets you attack twice.", "Feint is a Quick Contest of skill.",
+    "All-Out Attack trades defense for damage.", "Aim adds Accuracy to your next shot.",
+    "Evaluate gives +1 to hit next turn.", "Wait lets you act out of turn.",
+    "Ready a weapon or other item.", "Concentrate on a spell or ability.",
+    "Move and Attack at a penalty.", "Do Nothing and recover.",
+]
+
+
+def _page(n: int, body: str) -> str:
+    return f"GURPS Basic Set\n\nCHAPTER {n % 3}\n\n{body}\n\n**COMBAT {n + 10}**\n\n{n + 10}\n\n-----\n\n"
+
+
+class TestRepeatedEdgeLines:
+    def test_running_headers_and_footers_are_found(self):
+        from rpg_rules_ai.extraction import repeated_edge_lines
+
+        pages = [_page(n, _BODIES[n]) for n in range(10)]
+        repeated = repeated_edge_lines(pages, 0.5)
+
+        assert repeated == {"gurps basic set", "chapter #", "combat #"}
+
+    def test_body_text_on_every_page_is_kept(self):
+        from rpg_rules_ai.extraction import drop_edge_lines, repeated_edge_lines
+
+        body = "\n".join(_BODIES)
+        pages = [_page(n, body) for n in range(8)]
+        repeated = repeated_edge_lines(pages, 0.5)
+        cleaned = drop_edge_lines(pages[0], repeated)
+
+        assert "GURPS Basic Set" not in cleaned
+        assert "**COMBAT 10**" not in cleaned
+        # Only page edges are candidates: the same text mid-page stays
+        assert "All-Out Attack trades defense for damage." in cleaned
+        assert "Do Nothing and recover." not in cleaned  # last line on every page
+
+    def test_short_documents_are_left_alone(self):
+        from rpg_rules_ai.extraction import repeated_edge_lines
+
+        assert repeated_edge_lines([_page(n, "Body.") for n in range(3)], 0.5) == set()
+
+    def test_counter_is_bounded(self):
+        from rpg_rules_ai.extraction import _FrequentLines
+
+        counter = _FrequentLines(4)
+        for i in range(100):
+            counter.add("header")
+            counter.add(f"line {i}")
+        assert len(counter.counts) <= 4
+        assert counter.counts["header"] > 50
+
+
+class TestIterPdfLines:
+    @pytest.fixture(autouse=True)
+    def threshold(self):
+        with patch("rpg_rules_ai.extraction.settings") as mock_settings:
+            mock_settings.pdf_repeated_line_threshold = 0.5
+            yield mock_settings
+
+    def test_drops_running_headers_before_cleanup(self):
+        from rpg_rules_ai.extraction import iter_pdf_lines
+
+        pages = [_page(n, _BODIES[n]) for n in range(6)]
+        with patch("rpg_rules_ai.extraction.iter_pdf_pages", side_effect=lambda *a, **kw: iter(pages)) as mock_pages:
+            lines = list(iter_pdf_lines("book.pdf"))
+
+        assert mock_pages.call_count == 2
+        assert "GURPS Basic Set" not in lines
+        assert _BODIES[3] in lines
+        assert not any("COMBAT" in line for line in lines)
+
+    def test_short_pdf_is_read_once(self):
+        from rpg_rules_ai.extraction import iter_pdf_lines
+
+        with patch("rpg_rules_ai.extraction.iter_pdf_pages", return_value=iter(["# Title\nBody"])) as mock_pages:
+            lines = list(iter_pdf_lines("book.pdf"))
+
+        mock_pages.assert_called_once()
+        assert lines == ["# Title", "Body"]
+
+    def test_disabled(self, threshold):
+        from rpg_rules_ai.extraction import iter_pdf_lines
+
+        threshold.pdf_repeated_line_threshold = 0
+        pages = [_page(n, "Body.") for n in range(6)]
+        with patch("rpg_rules_ai.extraction.iter_pdf_pages", return_value=iter(pages)):
+            lines = list(iter_pdf_lines("book.pdf"))
+
+        assert lines.count("GURPS Basic Set") == 6
+
+
+class TestExtractedMarkdownCache:
+    @pytest.fixture(autouse=True)
+    def threshold(self):
+        with patch("rpg_rules_ai.extraction.settings") as mock_settings:
+            mock_settings.pdf_repeated_line_threshold = 0.5
+            yield mock_settings
+
+    def _lines(self, pdf, **kwargs):
+        from rpg_rules_ai.extraction import iter_cached_pdf_lines
+
+        return list(iter_cached_pdf_lines(pdf, **kwargs))
+
+    def test_second_read_skips_extraction(self, tmp_path):
+        pdf = tmp_path / "book.pdf"
+        pdf.write_bytes(b"%PDF one")
+        lines = ["## COMBAT", "", "Rapid Strike\r", ""]
+
+        with patch("rpg_rules_ai.extraction.iter_pdf_lines", return_value=iter(lines)) as mock_lines:
+            first = self._lines(pdf)
+            second = self._lines(pdf)
+
+        assert first == second == lines
+        mock_lines.assert_called_once()
+        assert (tmp_path / "book.pdf.extracted.md").exists()
+
+    def test_changed_pdf_or_threshold_extracts_again(self, tmp_path, threshold):
+        pdf = tmp_path / "book.pdf"
+        pdf.write_bytes(b"%PDF one")
+
+        with patch("rpg_rules_ai.extraction.iter_pdf_lines", side_effect=lambda *a, **kw: iter(["x"])) as mock_lines:
+            self._lines(pdf)
+            pdf.write_bytes(b"%PDF two")
+            self._lines(pdf)
+            threshold.pdf_repeated_line_threshold = 0
+            self._lines(pdf)
+
+        assert mock_lines.call_count == 3
+
+    def test_failed_extraction_leaves_no_cache(self, tmp_path):
+        pdf = tmp_path / "book.pdf"
+        pdf.write_bytes(b"%PDF")
+
+        def failing(*args, **kwargs):
+            yield "## COMBAT"
+            raise RuntimeError("Corrupt PDF")
+
+        with patch("rpg_rules_ai.extraction.iter_pdf_lines", side_effect=failing), pytest.raises(RuntimeError):
+            self._lines(pdf)
+
+        assert [p.name for p in tmp_path.iterdir()] == ["book.pdf"]
@@ -0,0 +1,185 @@
+"""Tests for blue/green book generations."""
+
+from unittest.mock import patch
+
+import pytest
+
+from rpg_rules_ai import generations
+from rpg_rules_ai.generations import GenerationRegistry, collect_garbage, hidden_generations
+
+
+@pytest.fixture
+def registry(tmp_path):
+    reg = GenerationRegistry(tmp_path / "generations.db")
+    with patch("rpg_rules_ai.generations._registry", reg):
+        yield reg
+    reg.close()
+
+
+def test_staging_generation_is_hidden(registry):
+    gen = registry.stage("Basic Set.md")
+
+    assert registry.active("Basic Set.md") is None
+    assert hidden_generations() == [gen]
+
+
+def test_activate_retires_previous(registry):
+    old = registry.stage("Basic Set.md")
+    registry.activate("Basic Set.md", old)
+    new = registry.stage("Basic Set.md")
+    assert hidden_generations() == [new]
+
+    registry.activate("Basic Set.md", new)
+
+    assert registry.active("Basic Set.md") == new
+    assert registry.retired("Basic Set.md") == [old]
+    assert hidden_generations() == [old]
+    assert registry.books_with_retired() == ["Basic Set.md"]
+
+
+def test_activation_is_per_book(registry):
+    a = registry.stage("A.md")
+    b = registry.stage("B.md")
+    registry.activate("A.md", a)
+    registry.activate("B.md", b)
+
+    assert registry.active("A.md") == a
+    assert registry.active("B.md") == b
+    assert hidden_generations() == []
+
+
+def test_collect_garbage_keeps_live_generations(registry):
+    old = registry.stage("Book.md")
+    registry.activate("Book.md", old)
+    new = registry.stage("Book.md")
+    registry.activate("Book.md", new)
+    pending = registry.stage("Book.md")
+
+    with patch("rpg_rules_ai.ingest.delete_book_chunks") as mock_delete:
+        assert collect_garbage() == 1
+
+    mock_delete.assert_called_once_with(
+        "Book.md", where={"generation": {"$nin": [new, pending]}}
+    )
+    assert registry.retired("Book.md") == []
+    assert hidden_generations() == [pending]
+
+
+def test_collect_garbage_discards_page_cache_of_replaced_sources(registry, tmp_path):
+    old = registry.stage("Book.pdf", source_hash="old-sha")
+    registry.activate("Book.pdf", old)
+    registry.activate("Book.pdf", registry.stage("Book.pdf", source_hash="new-sha"))
+    for source_hash in ("old-sha", "new-sha"):
+        (tmp_path / "pages" / source_hash).mkdir(parents=True)
+        (tmp_path / "pages" / source_hash / "0.md").write_text("page")
+
+    with (
+        patch("rpg_rules_ai.ingest.delete_book_chunks"),
+        patch("rpg_rules_ai.extraction.settings.pdf_page_cache_dir", str(tmp_path / "pages")),
+    ):
+        collect_garbage("Book.pdf")
+
+    assert not (tmp_path / "pages" / "old-sha").exists()
+    assert (tmp_path / "pages" / "new-sha" / "0.md").exists()
+
+
+def test_orphaned_sources_skips_hashes_still_in_use(registry):
+    a = registry.stage("A.pdf", source_hash="shared")
+    b = registry.stage("B.pdf", source_hash="shared")
+    c = registry.stage("A.pdf", source_hash="only-a")
+
+    assert registry.orphaned_sources([a, c]) == ["only-a"]
+    assert registry.orphaned_sources([a, b]) == ["shared"]
+    assert registry.orphaned_sources([]) == []
+
+
+def test_collect_garbage_skips_books_without_active_generation(registry):
+    registry.stage("New.md")
+
+    with patch("rpg_rules_ai.ingest.delete_book_chunks") as mock_delete:
+        assert collect_garbage("New.md") == 0
+    mock_delete.assert_not_called()
+
+
+def test_forget_book(registry):
+    registry.activate("Gone.md", registry.stage("Gone.md"))
+    registry.stage("Gone.md")
+
+    registry.forget_book("Gone.md")
+
+    assert registry.live("Gone.md") == []
+    assert generations.hidden_generations() == []
+
+
+def test_book_with_source_only_matches_active(registry):
+    staging = registry.stage("A.md", source_hash="h1")
+    assert registry.book_with_source("h1") is None
+
+    registry.activate("A.md", staging)
+    assert registry.book_with_source("h1") == "A.md"
+    assert registry.book_with_source("other") is None
+
+
+def test_corpus_version_tracks_visible_changes(registry):
+    import os
+
+    start, _ = registry.corpus_version()
+    gen = registry.stage("A.md")
+    assert registry.corpus_version()[0] == start  # staging is invisible
+
+    registry.activate("A.md", gen)
+    registry.forget_book("A.md")
+    registry.stage("B.md")
+    registry.reset()
+
+    assert registry.corpus_version() == (start + 3, os.getpid())
+    assert registry.hidden() == []
+
+
+def test_corpus_version_shared_between_connections(registry, tmp_path):
+    other = GenerationRegistry(tmp_path / "generations.db")
+    try:
+        registry.activate("A.md", registry.stage("A.md"))
+        assert other.corpus_version() == registry.corpus_version()
+        assert other.active("A.md") == registry.active("A.md")
+    finally:
+        other.close()
+
+
+def _acquired_within(registry, book, timeout=0.2):
+    """Whether `registry.lock(book)` is taken on another thread within `timeout`."""
+    import threading
+
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def take():
+        with registry.lock(book):
+            acquired.set()
+            release.wait()
+
+    thread = threading.Thread(target=take)
+    thread.start()
+    result = acquired.wait(timeout)
+    return result, release, thread
+
+
+def test_book_lock_excludes_other_processes(registry, tmp_path):
+    other = GenerationRegistry(tmp_path / "generations.db")
+    try:
+        with registry.lock("A.md"):
+            with registry.lock("A.md"):  # reentrant
+                pass
+            same, release_same, same_thread = _acquired_within(other, "A.md")
+            book, release_book, book_thread = _acquired_within(other, "B.md")
+            corpus, release_corpus, corpus_thread = _acquired_within(other, None)
+            assert (same, book, corpus) == (False, True, False)
+            release_book.set()
+            book_thread.join()
+        # Waiters get the lock once it is released
+        release_same.set()
+        same_thread.join()
+        release_corpus.set()
+        corpus_thread.join()
+    finally:
+        other.close()
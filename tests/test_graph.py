@@ -61,7 +61,7 @@ def test_setup_langsmith_without_key(mock_settings):
 
 
 @patch("rpg_rules_ai.graph.settings")
-@patch("rpg_rules_ai.graph.ChatOpenAI")
+@patch("rpg_rules_ai.graph.get_chat_model")
 def test_get_llm(mock_chat, mock_settings):
     mock_settings.llm_model = "gpt-4o-mini"
     sentinel = MagicMock()
@@ -99,6 +99,47 @@ async def test_retrieve_with_strategy(mock_get_strategy):
     assert result is expected
 
 
+# ---------------------------------------------------------------------------
+# rerank
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+@patch("rpg_rules_ai.graph.settings")
+async def test_rerank_disabled_is_noop(mock_settings):
+    mock_settings.enable_rerank = False
+    from rpg_rules_ai.graph import rerank
+
+    state = {"main_question": "Q", "questions": Questions(questions=[]), "messages": []}
+    assert await rerank(state) == {}
+
+
+@pytest.mark.asyncio
+@patch("rpg_rules_ai.graph.settings")
+async def test_rerank_moves_kept_docs_to_first_question(mock_settings):
+    mock_settings.enable_rerank = True
+    mock_settings.rerank_max_tokens = 10_000
+    from rpg_rules_ai.graph import rerank
+
+    fireball = Document(page_content="Fireball costs 1 FP.", metadata={"book": "Magic"})
+    strike = Document(page_content="Rapid Strike gives two attacks.", metadata={"book": "Basic"})
+    questions = Questions(
+        questions=[
+            Question(question="Q1", context=[fireball]),
+            Question(question="Q2", context=[strike, fireball]),
+        ]
+    )
+    state = {"main_question": "How does Rapid Strike work?", "questions": questions, "messages": []}
+
+    result = await rerank(state)
+
+    new_questions = result["questions"].questions
+    assert [q.question for q in new_questions] == ["Q1", "Q2"]
+    assert new_questions[0].context[0] is strike
+    assert len(new_questions[0].context) == 2
+    assert new_questions[1].context == []
+
+
 # ---------------------------------------------------------------------------
 # generate
 # ---------------------------------------------------------------------------
@@ -261,6 +302,86 @@ async def test_generate_empty_context(mock_get_llm, mock_get_prompt):
     assert result["answer"]["answer"] == answer["answer"]
 
 
+@pytest.mark.asyncio
+@patch("rpg_rules_ai.graph.get_rag_prompt")
+@patch("rpg_rules_ai.graph._get_llm")
+async def test_generate_attaches_retrieval_hops(mock_get_llm, mock_get_prompt):
+    doc = Document(page_content="Rule A.", metadata={"book": "Book1"})
+    questions = Questions(questions=[Question(question="Q1", context=[doc])])
+    answer: AnswerWithSources = {
+        "answer": "Rule A applies [1].",
+        "sources": ["Book1"],
+        "citations": [{"index": 1, "quote": "Rule A.", "source": "Book1"}],
+        "see_also": [],
+    }
+
+    mock_prompt = MagicMock()
+    mock_prompt.ainvoke = AsyncMock(return_value="msgs")
+    mock_get_prompt.return_value = mock_prompt
+    mock_structured = MagicMock()
+    mock_structured.ainvoke = AsyncMock(return_value=answer)
+    mock_llm = MagicMock()
+    mock_llm.with_structured_output.return_value = mock_structured
+    mock_get_llm.return_value = mock_llm
+
+    hops = [{"hop": 1, "queries": 2, "docs_added": 1, "stop_reason": "sufficient"}]
+    state = {
+        "main_question": "Q1",
+        "questions": questions,
+        "messages": [],
+        "retrieval_hops": hops,
+    }
+
+    from rpg_rules_ai.graph import generate
+
+    result = await generate(state)
+
+    assert result["answer"]["hops"] == hops
+
+
+@pytest.mark.asyncio
+@patch("rpg_rules_ai.graph.settings")
+@patch("rpg_rules_ai.graph.get_rag_prompt")
+@patch("rpg_rules_ai.graph._get_llm")
+async def test_generate_packs_context_within_budget(mock_get_llm, mock_get_prompt, mock_settings):
+    mock_settings.context_max_tokens = 70
+    mock_settings.context_passage_max_tokens = 0
+    filler = "word " * 40
+    docs = [
+        Document(page_content=f"First {filler}", metadata={"book": "BookA", "doc_id": "p1"}),
+        Document(page_content=f"Second {filler}", metadata={"book": "BookB", "doc_id": "p2"}),
+        Document(page_content="Third short.", metadata={"book": "BookC", "doc_id": "p3"}),
+    ]
+    questions = Questions(questions=[Question(question="Q1", context=docs)])
+    answer: AnswerWithSources = {
+        "answer": "See [2].",
+        "sources": ["BookC"],
+        "citations": [{"index": 2, "quote": "Third short.", "source": "BookC"}],
+        "see_also": [],
+    }
+
+    mock_prompt = MagicMock()
+    mock_prompt.ainvoke = AsyncMock(return_value="msgs")
+    mock_get_prompt.return_value = mock_prompt
+    mock_structured = MagicMock()
+    mock_structured.ainvoke = AsyncMock(return_value=answer)
+    mock_llm = MagicMock()
+    mock_llm.with_structured_output.return_value = mock_structured
+    mock_get_llm.return_value = mock_llm
+
+    from rpg_rules_ai.graph import generate
+
+    with patch("rpg_rules_ai.tokens._get_encoding", return_value=None):
+        result = await generate({"main_question": "Q1", "questions": questions, "messages": []})
+
+    context = mock_prompt.ainvoke.call_args[0][0]["context"]
+    # Second passage does not fit; the third is renumbered so indices stay contiguous
+    assert "Second" not in context
+    assert "[2] Source: BookC\nThird short." in context
+    assert result["answer"]["doc_ids"] == ["p1", "p3"]
+    assert result["answer"]["citations"][0]["source"] == "BookC"
+
+
 @pytest.mark.asyncio
 @patch("rpg_rules_ai.graph.get_rag_prompt")
 @patch("rpg_rules_ai.graph._get_llm")
@@ -391,12 +512,15 @@ async def test_generate_fallback_on_persistent_missing_citations(
     state = {"main_question": "Q?", "questions": questions, "messages": []}
 
     from rpg_rules_ai.graph import generate
+    from rpg_rules_ai.metrics import CITATION_RETRIES
 
+    fallbacks_before = CITATION_RETRIES.value(outcome="fallback")
     result = await generate(state)
 
     assert mock_structured.ainvoke.await_count == 2
     assert "could not produce" in result["answer"]["answer"]
     assert result["answer"]["citations"] == []
+    assert CITATION_RETRIES.value(outcome="fallback") == fallbacks_before + 1
 
 
 # ---------------------------------------------------------------------------
@@ -701,6 +825,7 @@ def test_build_graph_returns_compiled_graph(mock_setup):
     node_names = set(graph.get_graph().nodes.keys())
     assert "rewrite" in node_names
     assert "retrieve" in node_names
+    assert "rerank" in node_names
     assert "generate" in node_names
 
     # Verify it's a runnable (compiled graph)
@@ -787,7 +912,7 @@ def test_get_recent_history_over_limit():
 
 
 @pytest.mark.asyncio
-@patch("rpg_rules_ai.graph.ChatOpenAI")
+@patch("rpg_rules_ai.graph.get_chat_model")
 @patch("rpg_rules_ai.graph.settings")
 async def test_rewrite_no_history_passes_through(mock_settings, mock_chat_cls):
     """First question with no history should pass through unchanged."""
@@ -799,15 +924,17 @@ async def test_rewrite_no_history_passes_through(mock_settings, mock_chat_cls):
     result = await rewrite(state)
 
     assert result["main_question"] == "What is Rapid Strike?"
+    assert result["retrieval_hops"] == []
     mock_chat_cls.assert_not_called()
 
 
 @pytest.mark.asyncio
-@patch("rpg_rules_ai.graph.ChatOpenAI")
+@patch("rpg_rules_ai.graph.get_chat_model")
 @patch("rpg_rules_ai.graph.settings")
 async def test_rewrite_with_history_calls_llm(mock_settings, mock_chat_cls):
     """Follow-up question with history should call LLM for rewriting."""
     mock_settings.context_model = "gpt-4o-mini"
+    mock_settings.enable_speculative_retrieval = False
 
     mock_llm = MagicMock()
     mock_response = MagicMock()
@@ -822,14 +949,148 @@ async def test_rewrite_with_history_calls_llm(mock_settings, mock_chat_cls):
             HumanMessage(content="What is Rapid Strike?"),
             AIMessage(content='{"answer": "A combat maneuver."}'),
             HumanMessage(content="How many levels does it have?"),
-        ]
+        ],
+        "retrieval_hops": [{"hop": 1, "queries": ["What is Rapid Strike?"]}],
     }
     result = await rewrite(state)
 
     assert result["main_question"] == "How many levels does Rapid Strike have in GURPS?"
+    # Hops from the previous turn must not reach this turn's response
+    assert result["retrieval_hops"] == []
     mock_llm.ainvoke.assert_awaited_once()
 
 
+def _follow_up_state():
+    return {
+        "messages": [
+            HumanMessage(content="What is Rapid Strike?"),
+            AIMessage(content='{"answer": "A combat maneuver."}'),
+            HumanMessage(content="What is Rapid Strike in GURPS?"),
+        ]
+    }
+
+
+@pytest.mark.asyncio
+@patch("rpg_rules_ai.graph.get_strategy")
+@patch("rpg_rules_ai.graph.get_chat_model")
+@patch("rpg_rules_ai.graph.settings")
+async def test_rewrite_speculative_reuses_retrieval_when_unchanged(
+    mock_settings, mock_chat_cls, mock_get_strategy
+):
+    """An unchanged rewrite reuses the retrieval launched for the raw question."""
+    mock_settings.context_model = "gpt-4o-mini"
+    mock_settings.enable_speculative_retrieval = True
+    mock_settings.speculative_similarity_threshold = 0.9
+
+    mock_llm = MagicMock()
+    mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content="what is rapid strike in GURPS?"))
+    mock_chat_cls.return_value = mock_llm
+
+    retrieved = {"questions": Questions(questions=[]), "main_question": "raw"}
+    mock_strategy = MagicMock()
+    mock_strategy.execute = AsyncMock(return_value=retrieved)
+    mock_get_strategy.return_value = mock_strategy
+
+    from rpg_rules_ai.graph import rewrite
+
+    result = await rewrite(_follow_up_state())
+
+    assert result["speculative_hit"] is True
+    assert result["questions"] is retrieved["questions"]
+    assert result["main_question"] == "what is rapid strike in GURPS?"
+    assert result["retrieval_hops"] == []
+    state_arg = mock_strategy.execute.call_args[0][0]
+    assert state_arg["main_question"] == "What is Rapid Strike in GURPS?"
+
+
+@pytest.mark.asyncio
+@patch("rpg_rules_ai.graph.get_strategy")
+@patch("rpg_rules_ai.graph.get_chat_model")
+@patch("rpg_rules_ai.graph.settings")
+async def test_rewrite_speculative_cancels_when_question_changes(
+    mock_settings, mock_chat_cls, mock_get_strategy
+):
+    """A substantially different rewrite cancels the speculative retrieval."""
+    import asyncio
+
+    mock_settings.context_model = "gpt-4o-mini"
+    mock_settings.enable_speculative_retrieval = True
+    mock_settings.speculative_similarity_threshold = 0.9
+
+    async def slow_rewrite(messages):
+        await asyncio.sleep(0.01)
+        return MagicMock(content="How many attacks does Rapid Strike give with Extra Attack?")
+
+    mock_llm = MagicMock()
+    mock_llm.ainvoke = slow_rewrite
+    mock_chat_cls.return_value = mock_llm
+
+    cancelled = asyncio.Event()
+
+    async def slow_execute(state):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    mock_strategy = MagicMock()
+    mock_strategy.execute = slow_execute
+    mock_get_strategy.return_value = mock_strategy
+
+    from rpg_rules_ai.graph import rewrite
+
+    result = await rewrite(_follow_up_state())
+
+    assert result["speculative_hit"] is False
+    assert "questions" not in result
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+@patch("rpg_rules_ai.graph.get_strategy")
+@patch("rpg_rules_ai.graph.get_chat_model")
+@patch("rpg_rules_ai.graph.settings")
+async def test_rewrite_speculative_failure_falls_back_to_retrieve(
+    mock_settings, mock_chat_cls, mock_get_strategy
+):
+    mock_settings.context_model = "gpt-4o-mini"
+    mock_settings.enable_speculative_retrieval = True
+    mock_settings.speculative_similarity_threshold = 0.9
+
+    mock_llm = MagicMock()
+    mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content="What is Rapid Strike in GURPS?"))
+    mock_chat_cls.return_value = mock_llm
+
+    mock_strategy = MagicMock()
+    mock_strategy.execute = AsyncMock(side_effect=RuntimeError("vector store down"))
+    mock_get_strategy.return_value = mock_strategy
+
+    from rpg_rules_ai.graph import rewrite
+
+    result = await rewrite(_follow_up_state())
+
+    assert result["speculative_hit"] is False
+
+
+def test_route_after_rewrite():
+    from rpg_rules_ai.graph import _route_after_rewrite
+
+    assert _route_after_rewrite({"speculative_hit": True}) == "rerank"
+    assert _route_after_rewrite({"speculative_hit": False}) == "retrieve"
+    assert _route_after_rewrite({}) == "retrieve"
+
+
+@patch("rpg_rules_ai.graph.settings")
+def test_is_near_identical(mock_settings):
+    mock_settings.speculative_similarity_threshold = 0.9
+    from rpg_rules_ai.graph import _is_near_identical
+
+    assert _is_near_identical("What is  Magery?", "what is magery?")
+    assert _is_near_identical("What is Magery?", "What is Magery")
+    assert not _is_near_identical("What is Magery?", "How much does Magery 3 cost in Thaumatology?")
+
+
 # ---------------------------------------------------------------------------
 # ask_question with thread_id
 # ---------------------------------------------------------------------------
@@ -12,6 +12,26 @@ def _setup_collection_metadatas(vs, metadatas):
     vs._collection.get.return_value = {"metadatas": metadatas}
 
 
+@pytest.fixture(autouse=True)
+def isolated_stores(tmp_path):
+    """Keep the generation registry, indexes and checkpoints out of the working tree."""
+    from rpg_rules_ai import checkpoints, entity_index, generations, near_duplicates
+
+    with (
+        patch.object(generations.settings, "generations_path", str(tmp_path / "generations.db")),
+        patch.object(generations, "_registry", None),
+        patch.object(entity_index.settings, "entity_index_path", str(tmp_path / "entity_index.db")),
+        patch.object(near_duplicates.settings, "near_duplicate_index_path", str(tmp_path / "near_duplicates.db")),
+        patch.object(near_duplicates, "_index", None),
+        patch.object(checkpoints.settings, "ingest_checkpoint_dir", str(tmp_path / "checkpoints")),
+    ):
+        yield
+        if generations._registry is not None:
+            generations._registry.close()
+        if near_duplicates._index is not None:
+            near_duplicates._index.close()
+
+
 @pytest.fixture
 def tmp_sources(tmp_path):
     sources_dir = tmp_path / "sources"
@@ -46,6 +66,24 @@ class TestDeleteBook:
         mock_vectorstore._collection.delete.assert_called_once_with(where={"book": "Magic.md"})
         mock_docstore.mdelete.assert_called_once_with(["p1"])
 
+    def test_delete_discards_cached_pdf_pages(self, tmp_path, mock_vectorstore):
+        from rpg_rules_ai.generations import get_registry
+
+        registry = get_registry()
+        registry.activate("Magic.pdf", registry.stage("Magic.pdf", source_hash="magic-sha"))
+        (tmp_path / "pages" / "magic-sha").mkdir(parents=True)
+
+        with (
+            patch("rpg_rules_ai.ingest.get_vectorstore", return_value=mock_vectorstore),
+            patch("rpg_rules_ai.ingest.get_docstore", return_value=MagicMock()),
+            patch("rpg_rules_ai.extraction.settings.pdf_page_cache_dir", str(tmp_path / "pages")),
+        ):
+            from rpg_rules_ai.ingest import delete_book
+            delete_book("Magic.pdf")
+
+        assert not (tmp_path / "pages" / "magic-sha").exists()
+        assert registry.live("Magic.pdf") == []
+
     def test_delete_nonexistent_idempotent(self, mock_vectorstore):
         mock_vectorstore._collection.get.return_value = {"metadatas": []}
 
@@ -59,6 +97,26 @@ class TestDeleteBook:
         mock_vectorstore._collection.delete.assert_called_once()
 
 
+    def test_delete_generation_keeps_parents_shared_with_live_ones(self, mock_vectorstore):
+        mock_vectorstore._collection.get.side_effect = [
+            {"metadatas": [{"book": "Magic.md", "doc_id": "p1"}, {"book": "Magic.md", "doc_id": "p2"}]},
+            {"metadatas": [{"book": "Magic.md", "doc_id": "p1", "generation": "new"}]},
+        ]
+        mock_docstore = MagicMock()
+
+        with (
+            patch("rpg_rules_ai.ingest.get_vectorstore", return_value=mock_vectorstore),
+            patch("rpg_rules_ai.ingest.get_docstore", return_value=mock_docstore),
+            patch("rpg_rules_ai.entity_index.EntityIndex") as mock_index,
+        ):
+            from rpg_rules_ai.ingest import delete_book_chunks
+            removed = delete_book_chunks("Magic.md", where={"generation": "old"})
+
+        assert removed == 1
+        mock_docstore.mdelete.assert_called_once_with(["p2"])
+        mock_index.return_value.delete_chunk_mentions.assert_called_once_with(["p2"])
+
+
 class TestGetBooksMetadata:
     def test_with_books(self, tmp_sources, mock_vectorstore):
         sources_dir, _ = tmp_sources
@@ -144,6 +202,22 @@ class TestReindexDirectory:
         mock_vectorstore.reset_collection.assert_called_once()
         mock_pipeline.assert_called_once()
 
+    def test_reindex_includes_pdfs_but_not_extraction_caches(self, tmp_path, mock_vectorstore):
+        (tmp_path / "A.md").write_text("# A")
+        (tmp_path / "B.pdf").write_bytes(b"%PDF")
+        (tmp_path / "B.pdf.extracted.md").write_text("# B")
+        (tmp_path / "notes.txt").write_text("x")
+
+        with (
+            patch("rpg_rules_ai.ingest.get_vectorstore", return_value=mock_vectorstore),
+            patch("rpg_rules_ai.pipeline.run_layered_pipeline") as mock_pipeline,
+        ):
+            mock_pipeline.return_value = {"status": "done", "file_results": []}
+            from rpg_rules_ai.ingest import reindex_directory
+            reindex_directory(tmp_path)
+
+        assert [p.name for p in mock_pipeline.call_args[0][0]] == ["A.md", "B.pdf"]
+
     def test_reindex_empty_dir(self, tmp_path, mock_vectorstore):
         with (
             patch("rpg_rules_ai.ingest.get_vectorstore", return_value=mock_vectorstore),
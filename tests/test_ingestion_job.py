@@ -23,7 +23,9 @@ class TestIngestionJobInit:
         assert progress["phase"] == ""
         assert progress["file_results"] == []
         assert progress["error"] is None
-        assert job._thread is None
+        assert progress["file_stats"] == []
+        assert progress["stage_totals"] == {}
+        assert progress["current_file"] is None
 
     def test_replace_flag(self, tmp_path: Path):
         p = tmp_path / "b.md"
@@ -65,7 +67,7 @@ class TestRun:
             "error": None,
         }
 
-        job._run()
+        job.run()
 
         progress = job.get_progress()
         assert progress["status"] == "done"
@@ -79,7 +81,7 @@ class TestRun:
         job = IngestionJob(paths=[p1], replace=True)
         mock_pipeline.return_value = {"status": "done", "phase": "", "phase_completed": 0, "phase_total": 0, "file_results": [], "error": None}
 
-        job._run()
+        job.run()
 
         _, kwargs = mock_pipeline.call_args
         assert kwargs["replace"] is True
@@ -91,51 +93,30 @@ class TestRun:
         job = IngestionJob(paths=[p1])
         mock_pipeline.side_effect = RuntimeError("disk full")
 
-        job._run()
+        job.run()
 
         progress = job.get_progress()
         assert progress["status"] == "error"
         assert progress["error"] == "disk full"
 
-
-class TestStart:
     @patch("rpg_rules_ai.pipeline.run_layered_pipeline")
-    def test_start_launches_thread(self, mock_pipeline: MagicMock, tmp_path: Path):
-        p1 = tmp_path / "a.md"
-        p1.touch()
-        mock_pipeline.return_value = {"status": "done", "phase": "", "phase_completed": 0, "phase_total": 0, "file_results": [], "error": None}
-
-        job = IngestionJob(paths=[p1])
-        job.start()
-        job._thread.join(timeout=5)
+    def test_run_forwards_updates_and_cancel_hook(self, mock_pipeline: MagicMock, tmp_path: Path):
+        updates: list[dict] = []
 
-        assert job.get_progress()["status"] == "done"
-        assert not job._thread.is_alive()
+        def should_cancel():
+            return False
 
-    @patch("rpg_rules_ai.pipeline.run_layered_pipeline")
-    def test_start_thread_is_daemon(self, mock_pipeline: MagicMock, tmp_path: Path):
-        p1 = tmp_path / "a.md"
-        p1.touch()
-        mock_pipeline.return_value = {"status": "done", "phase": "", "phase_completed": 0, "phase_total": 0, "file_results": [], "error": None}
+        def fake_pipeline(paths, replace=False, on_progress=None, should_cancel=None):
+            on_progress({"status": "running", "phase": "ingesting"})
+            return {"status": "done"}
 
-        job = IngestionJob(paths=[p1])
-        job.start()
-        assert job._thread.daemon is True
-        job._thread.join(timeout=5)
-
-    @patch("rpg_rules_ai.pipeline.run_layered_pipeline")
-    def test_start_error_in_thread(self, mock_pipeline: MagicMock, tmp_path: Path):
-        p1 = tmp_path / "a.md"
-        p1.touch()
-        mock_pipeline.side_effect = ValueError("bad data")
+        mock_pipeline.side_effect = fake_pipeline
+        job = IngestionJob(paths=[], should_cancel=should_cancel, on_update=updates.append)
 
-        job = IngestionJob(paths=[p1])
-        job.start()
-        job._thread.join(timeout=5)
+        job.run()
 
-        progress = job.get_progress()
-        assert progress["status"] == "error"
-        assert progress["error"] == "bad data"
+        assert updates == [{"status": "running", "phase": "ingesting"}]
+        assert mock_pipeline.call_args[1]["should_cancel"] is should_cancel
 
 
 class TestThreadSafety:
@@ -147,7 +128,7 @@ class TestThreadSafety:
 
         barrier = threading.Barrier(2, timeout=5)
 
-        def fake_pipeline(paths, replace=False, on_progress=None):
+        def fake_pipeline(paths, replace=False, on_progress=None, should_cancel=None):
             if on_progress:
                 on_progress({"status": "running", "phase": "embedding", "phase_completed": 5, "phase_total": 10, "file_results": [], "error": None})
             barrier.wait()
@@ -166,8 +147,9 @@ class TestThreadSafety:
         reader_thread = threading.Thread(target=reader)
         reader_thread.start()
 
-        job.start()
-        job._thread.join(timeout=5)
+        runner_thread = threading.Thread(target=job.run)
+        runner_thread.start()
+        runner_thread.join(timeout=5)
         reader_thread.join(timeout=5)
 
         assert len(snapshots) == 10
@@ -0,0 +1,273 @@
+"""Tests for the SQLite ingestion job queue and its worker pool."""
+
+from __future__ import annotations
+
+import multiprocessing
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from rpg_rules_ai.job_queue import JobQueue, JobWorkerPool
+
+
+@pytest.fixture
+def queue(tmp_path: Path):
+    q = JobQueue(tmp_path / "jobs.db")
+    yield q
+    q.close()
+
+
+def _paths(tmp_path: Path, *names: str) -> list[Path]:
+    paths = []
+    for name in names:
+        p = tmp_path / name
+        p.write_text(f"# {name}")
+        paths.append(p)
+    return paths
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _drain(db_path: str) -> list[str]:
+    """Claim jobs from another process until the queue is empty."""
+    queue = JobQueue(db_path)
+    claimed = []
+    while (job := queue.claim()) is not None:
+        claimed.append(job.id)
+    queue.close()
+    return claimed
+
+
+class TestJobQueue:
+    def test_enqueue_is_pending(self, queue):
+        job_id = queue.enqueue([Path("/x/a.md")])
+        progress = queue.get_progress(job_id)
+        assert progress["status"] == "pending"
+        assert progress["file_results"] == []
+        assert queue.count_active() == 1
+
+    def test_unknown_job_raises(self, queue):
+        with pytest.raises(KeyError):
+            queue.get_progress("missing")
+        with pytest.raises(KeyError):
+            queue.request_cancel("missing")
+
+    def test_claim_is_fifo_and_exclusive(self, queue):
+        first = queue.enqueue([Path("/x/a.md")], replace=True)
+        second = queue.enqueue([Path("/x/b.md")])
+
+        claimed = queue.claim()
+        assert claimed.id == first
+        assert claimed.paths == [Path("/x/a.md")]
+        assert claimed.replace is True
+        assert queue.claim().id == second
+        assert queue.claim() is None
+
+    def test_survives_reopen(self, tmp_path):
+        db = tmp_path / "jobs.db"
+        q = JobQueue(db)
+        job_id = q.enqueue([Path("/x/a.md")])
+        q.close()
+
+        reopened = JobQueue(db)
+        assert reopened.get_progress(job_id)["status"] == "pending"
+        reopened.close()
+
+    def test_recover_requeues_with_checkpoint(self, queue):
+        job_id = queue.enqueue([Path("/x/a.md"), Path("/x/b.md"), Path("/x/c.md")])
+        queue.claim()
+        queue.update_progress(job_id, {
+            "status": "running",
+            "phase": "ingesting",
+            "file_results": [{"filename": "a.md", "status": "success", "error_message": None}],
+            "current_file": "b.md",
+        })
+
+        # Simulated crash: a new process recovers the running job
+        assert queue.recover() == 1
+        resumed = queue.claim()
+        assert resumed.id == job_id
+        assert resumed.completed_files == {"a.md"}
+
+    def test_recover_leaves_jobs_of_live_processes(self, queue):
+        sleeper = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        try:
+            first = queue.enqueue([])
+            second = queue.enqueue([])
+            queue.claim()
+            queue.claim()
+            # first is owned by another live server process, second by a dead one
+            queue._conn.execute("UPDATE jobs SET owner_pid = ? WHERE id = ?", (sleeper.pid, first))
+            queue._conn.execute("UPDATE jobs SET owner_pid = ? WHERE id = ?", (_dead_pid(), second))
+            queue._conn.commit()
+
+            assert queue.recover() == 1
+            assert queue.get_progress(first)["status"] == "running"
+            assert queue.get_progress(second)["status"] == "pending"
+        finally:
+            sleeper.kill()
+            sleeper.wait()
+
+    def test_claim_respects_global_running_cap(self, queue):
+        queue.enqueue([])
+        queue.enqueue([])
+        assert queue.claim(max_running=1) is not None
+        assert queue.claim(max_running=1) is None
+        assert queue.claim(max_running=2) is not None
+
+    def test_claims_are_exclusive_across_processes(self, tmp_path):
+        db = tmp_path / "jobs.db"
+        setup = JobQueue(db)
+        ids = {setup.enqueue([]) for _ in range(40)}
+        setup.close()
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(4) as pool:
+            claimed = pool.map(_drain, [str(db)] * 4)
+
+        flat = [job_id for batch in claimed for job_id in batch]
+        assert sorted(flat) == sorted(ids)
+
+    def test_cancel_pending_is_immediate(self, queue):
+        job_id = queue.enqueue([])
+        assert queue.request_cancel(job_id) == "cancelled"
+        assert queue.get_progress(job_id)["status"] == "cancelled"
+        assert queue.claim() is None
+        with pytest.raises(ValueError):
+            queue.request_cancel(job_id)
+
+    def test_cancel_running_sets_flag(self, queue):
+        job_id = queue.enqueue([])
+        queue.claim()
+        assert not queue.cancel_requested(job_id)
+        assert queue.request_cancel(job_id) == "running"
+        assert queue.cancel_requested(job_id)
+
+    def test_evict_keeps_recent_finished_jobs(self, queue):
+        ids = [queue.enqueue([]) for _ in range(4)]
+        for job_id in ids[:3]:
+            queue.claim()
+            queue.finish(job_id, "done", queue.get_progress(job_id))
+
+        assert queue.evict(keep=1) == 2
+        with pytest.raises(KeyError):
+            queue.get_progress(ids[0])
+        assert queue.get_progress(ids[2])["status"] == "done"
+        # Unfinished jobs are never evicted
+        assert queue.get_progress(ids[3])["status"] == "pending"
+
+
+class TestJobWorkerPool:
+    def test_runs_job_to_completion(self, queue, tmp_path):
+        paths = _paths(tmp_path, "a.md", "b.md")
+
+        def fake_pipeline(paths, replace=False, on_progress=None, should_cancel=None):
+            results = [{"filename": p.name, "status": "success", "error_message": None} for p in paths]
+            return {"status": "done", "phase": "ingesting", "phase_completed": len(paths),
+                    "phase_total": len(paths), "file_results": results, "error": None}
+
+        job_id = queue.enqueue(paths)
+        pool = JobWorkerPool(queue, workers=1, poll_interval=0.01)
+        with patch("rpg_rules_ai.pipeline.run_layered_pipeline", side_effect=fake_pipeline):
+            pool.start()
+            _wait_for(lambda: queue.get_progress(job_id)["status"] == "done")
+            pool.stop(timeout=5)
+
+        progress = queue.get_progress(job_id)
+        assert [r["filename"] for r in progress["file_results"]] == ["a.md", "b.md"]
+        assert queue.count_active() == 0
+
+    def test_resume_skips_finished_files(self, queue, tmp_path):
+        paths = _paths(tmp_path, "a.md", "b.md", "c.md")
+        job_id = queue.enqueue(paths)
+        queue.claim()
+        queue.update_progress(job_id, {
+            "status": "running",
+            "phase": "ingesting",
+            "file_results": [{"filename": "a.md", "status": "success", "error_message": None}],
+            "current_file": "b.md",
+        })
+        seen: list[list[str]] = []
+
+        def fake_pipeline(paths, replace=False, on_progress=None, should_cancel=None):
+            seen.append([p.name for p in paths])
+            results = [{"filename": p.name, "status": "success", "error_message": None} for p in paths]
+            return {"status": "done", "phase": "ingesting", "phase_completed": len(paths),
+                    "phase_total": len(paths), "file_results": results, "error": None}
+
+        pool = JobWorkerPool(queue, workers=1, poll_interval=0.01)
+        with patch("rpg_rules_ai.pipeline.run_layered_pipeline", side_effect=fake_pipeline):
+            pool.start()  # recovers the "crashed" job
+            _wait_for(lambda: queue.get_progress(job_id)["status"] == "done")
+            pool.stop(timeout=5)
+
+        # b.md was in flight: it is handed back to the pipeline, which resumes it
+        assert seen == [["b.md", "c.md"]]
+        progress = queue.get_progress(job_id)
+        assert [r["filename"] for r in progress["file_results"]] == ["a.md", "b.md", "c.md"]
+        assert progress["phase_completed"] == 3
+        assert progress["phase_total"] == 3
+
+    def test_single_worker_runs_jobs_one_at_a_time(self, queue, tmp_path):
+        running = 0
+        peak = 0
+        order: list[str] = []
+        lock = threading.Lock()
+
+        def fake_pipeline(paths, replace=False, on_progress=None, should_cancel=None):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+                order.append(paths[0].name)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+            return {"status": "done", "phase": "", "phase_completed": 0, "phase_total": 0,
+                    "file_results": [], "error": None}
+
+        ids = [queue.enqueue(_paths(tmp_path, f"{i}.md")) for i in range(3)]
+        pool = JobWorkerPool(queue, workers=1, poll_interval=0.01)
+        with patch("rpg_rules_ai.pipeline.run_layered_pipeline", side_effect=fake_pipeline):
+            pool.start()
+            _wait_for(lambda: queue.count_active() == 0)
+            pool.stop(timeout=5)
+
+        assert peak == 1
+        assert order == ["0.md", "1.md", "2.md"]
+        assert all(queue.get_progress(i)["status"] == "done" for i in ids)
+
+    def test_cancel_reaches_running_pipeline(self, queue, tmp_path):
+        started = threading.Event()
+
+        def fake_pipeline(paths, replace=False, on_progress=None, should_cancel=None):
+            started.set()
+            _wait_for(should_cancel)
+            return {"status": "cancelled", "phase": "", "phase_completed": 0, "phase_total": 0,
+                    "file_results": [], "error": None}
+
+        job_id = queue.enqueue(_paths(tmp_path, "a.md"))
+        pool = JobWorkerPool(queue, workers=1, poll_interval=0.01)
+        with patch("rpg_rules_ai.pipeline.run_layered_pipeline", side_effect=fake_pipeline):
+            pool.start()
+            assert started.wait(5)
+            queue.request_cancel(job_id)
+            _wait_for(lambda: queue.get_progress(job_id)["status"] == "cancelled")
+            pool.stop(timeout=5)
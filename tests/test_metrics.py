@@ -0,0 +1,177 @@
+"""Tests for the in-process metrics registry."""
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from rpg_rules_ai.metrics import (
+    LLM_CALLS,
+    LLM_TOKENS,
+    Counter,
+    Gauge,
+    Histogram,
+    LLMMetricsHandler,
+    Registry,
+)
+
+
+class TestCounter:
+    def test_inc_and_render(self):
+        counter = Counter("test_requests_total", "Requests", ("route",))
+        counter.inc(route="/ask")
+        counter.inc(2, route="/ask")
+        counter.inc(route="/health")
+
+        assert counter.value(route="/ask") == 3
+        rendered = counter.render()
+        assert "# TYPE test_requests_total counter" in rendered
+        assert 'test_requests_total{route="/ask"} 3' in rendered
+        assert 'test_requests_total{route="/health"} 1' in rendered
+
+    def test_rejects_wrong_labels(self):
+        counter = Counter("test_labels_total", "x", ("route",))
+        with pytest.raises(ValueError):
+            counter.inc(path="/ask")
+
+    def test_rejects_negative(self):
+        with pytest.raises(ValueError):
+            Counter("test_negative_total", "x").inc(-1)
+
+    def test_escapes_label_values(self):
+        counter = Counter("test_escape_total", "x", ("q",))
+        counter.inc(q='say "hi"\n')
+        assert 'q="say \\"hi\\"\\n"' in counter.render()
+
+
+class TestGauge:
+    def test_set_inc_dec(self):
+        gauge = Gauge("test_gauge", "x")
+        gauge.set(5)
+        gauge.inc()
+        gauge.dec(2)
+        assert gauge.value() == 4
+        assert "test_gauge 4" in gauge.render()
+
+    def test_function_evaluated_at_render(self):
+        state = {"n": 1}
+        gauge = Gauge("test_fn_gauge", "x", function=lambda: state["n"])
+        state["n"] = 7
+        assert "test_fn_gauge 7" in gauge.render()
+
+    def test_failing_function_renders_no_sample(self):
+        gauge = Gauge("test_broken_gauge", "x", function=lambda: 1 / 0)
+        assert gauge.render().splitlines()[-1].startswith("# TYPE")
+
+
+class TestHistogram:
+    def test_cumulative_buckets(self):
+        histogram = Histogram("test_seconds", "x", ("stage",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage="a")
+        histogram.observe(0.5, stage="a")
+        histogram.observe(5, stage="a")
+
+        rendered = histogram.render()
+        assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in rendered
+        assert 'test_seconds_bucket{stage="a",le="1"} 2' in rendered
+        assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in rendered
+        assert 'test_seconds_count{stage="a"} 3' in rendered
+        assert 'test_seconds_sum{stage="a"} 5.55' in rendered
+
+    def test_time_observes_on_error(self):
+        histogram = Histogram("test_timed_seconds", "x")
+        with pytest.raises(RuntimeError):
+            with histogram.time():
+                raise RuntimeError("boom")
+        assert histogram.count() == 1
+
+
+class TestRegistry:
+    def test_render_all(self):
+        registry = Registry()
+        registry.register(Counter("a_total", "A")).inc()
+        registry.register(Gauge("b", "B")).set(2)
+        rendered = registry.render()
+        assert "a_total 1" in rendered
+        assert "b 2" in rendered
+        assert rendered.endswith("\n")
+
+    def test_duplicate_name_rejected(self):
+        registry = Registry()
+        registry.register(Counter("dup_total", "x"))
+        with pytest.raises(ValueError):
+            registry.register(Counter("dup_total", "x"))
+
+
+class TestSnapshots:
+    def _registry(self):
+        registry = Registry()
+        counter = registry.register(Counter("req_total", "x", ("route",)))
+        histogram = registry.register(Histogram("lat_seconds", "x", buckets=(1.0,)))
+        registry.register(Gauge("jobs", "x", function=lambda: 2))
+        return registry, counter, histogram
+
+    def test_render_sums_live_processes(self, tmp_path):
+        import json
+        import os
+
+        other, other_counter, other_histogram = self._registry()
+        other_counter.inc(3, route="/ask")
+        other_histogram.observe(0.5)
+        # Another worker's snapshot; the parent process is alive
+        (tmp_path / f"{os.getppid()}.json").write_text(json.dumps({
+            "req_total": other_counter.snapshot(),
+            "lat_seconds": other_histogram.snapshot(),
+        }))
+
+        registry, counter, histogram = self._registry()
+        counter.inc(route="/ask")
+        counter.inc(route="/health")
+        histogram.observe(5)
+        rendered = registry.render(tmp_path)
+
+        assert 'req_total{route="/ask"} 4' in rendered
+        assert 'req_total{route="/health"} 1' in rendered
+        assert 'lat_seconds_bucket{le="1"} 1' in rendered
+        assert 'lat_seconds_count 2' in rendered
+        assert "jobs 2" in rendered
+        assert (tmp_path / f"{os.getpid()}.json").exists()
+
+    def test_exited_processes_are_dropped(self, tmp_path):
+        import json
+        import subprocess
+        import sys
+
+        finished = subprocess.Popen([sys.executable, "-c", "pass"])
+        finished.wait()
+        stale = tmp_path / f"{finished.pid}.json"
+        stale.write_text(json.dumps({"req_total": [[["/ask"], 10]]}))
+
+        registry, counter, _ = self._registry()
+        counter.inc(route="/ask")
+
+        assert 'req_total{route="/ask"} 1' in registry.render(tmp_path)
+        assert not stale.exists()
+
+
+class TestLLMMetricsHandler:
+    def test_counts_usage_metadata(self):
+        message = AIMessage(
+            content="hi",
+            usage_metadata={"input_tokens": 10, "output_tokens": 3, "total_tokens": 13},
+        )
+        calls_before = LLM_CALLS.value(model="handler-test")
+        LLMMetricsHandler("handler-test").on_llm_end(
+            LLMResult(generations=[[ChatGeneration(message=message)]])
+        )
+        assert LLM_CALLS.value(model="handler-test") == calls_before + 1
+        assert LLM_TOKENS.value(model="handler-test", kind="prompt") >= 10
+        assert LLM_TOKENS.value(model="handler-test", kind="completion") >= 3
+
+    def test_falls_back_to_llm_output(self):
+        result = LLMResult(
+            generations=[[ChatGeneration(message=AIMessage(content="hi"))]],
+            llm_output={"token_usage": {"prompt_tokens": 4, "completion_tokens": 2}},
+        )
+        before = LLM_TOKENS.value(model="handler-legacy", kind="prompt")
+        LLMMetricsHandler("handler-legacy").on_llm_end(result)
+        assert LLM_TOKENS.value(model="handler-legacy", kind="prompt") == before + 4
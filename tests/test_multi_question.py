@@ -22,7 +22,7 @@ async def test_execute_happy_path():
     with (
         patch("rpg_rules_ai.strategies.multi_question.get_multi_question_prompt") as mock_prompt,
         patch("rpg_rules_ai.strategies.multi_question.get_retriever") as mock_retriever,
-        patch("rpg_rules_ai.strategies.multi_question.ChatOpenAI") as mock_llm_cls,
+        patch("rpg_rules_ai.strategies.multi_question.get_chat_model") as mock_llm_cls,
     ):
         # Setup chain: prompt | llm.with_structured_output(Questions)
         mock_chain = AsyncMock()
@@ -36,7 +36,8 @@ async def test_execute_happy_path():
 
         # Setup retriever
         mock_ret = AsyncMock()
-        mock_ret.ainvoke = AsyncMock(return_value=docs)
+        mock_ret.aembed_queries = AsyncMock(side_effect=lambda queries: [[0.0] for _ in queries])
+        mock_ret.ainvoke_with_embedding = AsyncMock(return_value=docs)
         mock_retriever.return_value = mock_ret
 
         state = _make_state("How does Magery work?")
@@ -47,8 +48,9 @@ async def test_execute_happy_path():
         # Original question should be appended
         question_texts = [q.question for q in questions.questions]
         assert "How does Magery work?" in question_texts
-        # Retriever called for each question (expanded + original)
-        assert mock_ret.ainvoke.call_count == len(questions.questions)
+        # All questions embedded in one request, then one search per question
+        mock_ret.aembed_queries.assert_awaited_once_with(question_texts)
+        assert mock_ret.ainvoke_with_embedding.call_count == len(questions.questions)
         # Context assigned to each question
         for q in questions.questions:
             assert q.context == docs
@@ -0,0 +1,96 @@
+"""Tests for near-duplicate child detection."""
+
+import pytest
+
+from rpg_rules_ai.near_duplicates import NearDuplicateIndex, minhash, similarity
+
+RAPID_STRIKE = (
+    "Rapid Strike: you may make two attacks with one weapon on your turn, each at -6 to skill. "
+    "Weapon Master halves this penalty. You cannot use Rapid Strike with a weapon that becomes "
+    "unready after attacking, and the second blow may target a different foe within reach."
+)
+FEINT = (
+    "Feint: roll a Quick Contest of weapon skill against your foe's best melee skill. If you "
+    "win, subtract your margin of victory from his active defense against your next attack."
+)
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = NearDuplicateIndex(tmp_path / "near_duplicates.db")
+    yield idx
+    idx.close()
+
+
+class TestMinhash:
+    def test_identical_text_and_formatting(self):
+        assert minhash(RAPID_STRIKE) == minhash(RAPID_STRIKE.upper().replace(" ", "\n"))
+
+    def test_small_edit_stays_similar(self):
+        reprint = RAPID_STRIKE.replace("-6", "-3")
+        assert similarity(minhash(RAPID_STRIKE), minhash(reprint)) >= 0.75
+
+    def test_different_text_is_dissimilar(self):
+        assert similarity(minhash(RAPID_STRIKE), minhash(FEINT)) < 0.2
+
+    def test_no_words(self):
+        assert minhash(" -- \n") is None
+
+
+def _add(index, entries, threshold=0.9):
+    """Match a batch and index it, as the pipeline does once it is stored."""
+    matches = index.match([(r, sig) for r, _, sig in entries], threshold)
+    index.add([(r, book, sig, m[1] if m else r) for (r, book, sig), m in zip(entries, matches)])
+    return matches
+
+
+class TestNearDuplicateIndex:
+    def test_matches_children_indexed_before(self, index):
+        assert _add(index, [("basic-1", "Basic Set.md", minhash(RAPID_STRIKE))]) == [None]
+
+        matches = _add(
+            index,
+            [("ma-1", "Martial Arts.md", minhash(RAPID_STRIKE)), ("ma-2", "Martial Arts.md", minhash(FEINT))],
+        )
+
+        assert matches == [("basic-1", "basic-1"), None]
+        assert index.count() == 3
+
+    def test_match_does_not_index(self, index):
+        assert index.match([("basic-1", minhash(RAPID_STRIKE))], 0.9) == [None]
+        assert index.match([("ma-1", minhash(RAPID_STRIKE))], 0.9) == [None]
+        assert index.count() == 0
+
+    def test_copies_join_the_first_group(self, index):
+        _add(index, [("basic-1", "Basic Set.md", minhash(RAPID_STRIKE))])
+        _add(index, [("ma-1", "Martial Arts.md", minhash(RAPID_STRIKE))])
+        index.forget(["basic-1"])
+
+        assert index.match([("pow-1", minhash(RAPID_STRIKE))], 0.9) == [("ma-1", "basic-1")]
+
+    def test_matches_earlier_in_the_same_batch(self, index):
+        matches = index.match(
+            [("a", minhash(RAPID_STRIKE)), ("b", minhash(FEINT)), ("c", minhash(RAPID_STRIKE))],
+            0.9,
+        )
+
+        assert matches == [None, None, ("a", "a")]
+
+    def test_threshold_and_reindexing_the_same_record(self, index):
+        reprint = RAPID_STRIKE.replace("-6", "-3")
+        _add(index, [("basic-1", "Basic Set.md", minhash(RAPID_STRIKE))])
+
+        assert index.match([("ma-1", minhash(reprint))], 0.99) == [None]
+        # A resumed batch indexes its records again without matching itself
+        assert _add(index, [("basic-1", "Basic Set.md", minhash(RAPID_STRIKE))]) == [None]
+        assert index.count() == 1
+
+    def test_resumed_batch_ignores_its_own_indexed_rows(self, index):
+        batch = [("a", "Basic Set.md", minhash(RAPID_STRIKE)), ("b", "Basic Set.md", minhash(RAPID_STRIKE))]
+        _add(index, batch)
+
+        assert index.match([(r, sig) for r, _, sig in batch], 0.9) == [None, ("a", "a")]
+
+    def test_entries_without_signature_are_skipped(self, index):
+        assert _add(index, [("empty", "Basic Set.md", None)]) == [None]
+        assert index.count() == 0
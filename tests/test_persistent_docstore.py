@@ -18,6 +18,21 @@ def reset_singletons():
     retriever_module._docstore = None
 
 
+@pytest.fixture(autouse=True)
+def isolated_stores(tmp_path):
+    """Keep the generation registry and entity index out of the working tree."""
+    from rpg_rules_ai import entity_index, generations
+
+    with (
+        patch.object(generations.settings, "generations_path", str(tmp_path / "generations.db")),
+        patch.object(generations, "_registry", None),
+        patch.object(entity_index.settings, "entity_index_path", str(tmp_path / "entity_index.db")),
+    ):
+        yield
+        if generations._registry is not None:
+            generations._registry.close()
+
+
 class TestDocstorePersistence:
     def test_docstore_uses_local_file_store(self, tmp_path):
         with patch("rpg_rules_ai.retriever.settings") as mock_settings:
@@ -1,10 +1,14 @@
 """Tests for the layered ingestion pipeline."""
 
+import hashlib
 import sys
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from langchain_core.documents import Document
+
+from rpg_rules_ai.generations import GenerationRegistry
 
 
 def _make_md(tmp_path: Path, name: str, content: str = "# Test\nSome content here.") -> Path:
@@ -13,8 +17,22 @@ def _make_md(tmp_path: Path, name: str, content: str = "# Test\nSome content her
     return p
 
 
+@pytest.fixture(autouse=True)
+def isolated_near_duplicates(tmp_path):
+    """Keep the near-duplicate index out of the working tree."""
+    from rpg_rules_ai import near_duplicates
+
+    with (
+        patch.object(near_duplicates.settings, "near_duplicate_index_path", str(tmp_path / "near_duplicates.db")),
+        patch.object(near_duplicates, "_index", None),
+    ):
+        yield
+        if near_duplicates._index is not None:
+            near_duplicates._index.close()
+
+
 @pytest.fixture
-def mock_infra():
+def mock_infra(tmp_path):
     """Mock vectorstore, docstore, embeddings, and settings."""
     mock_vs = MagicMock()
     mock_collection = MagicMock()
@@ -29,17 +47,20 @@ def mock_infra():
     with (
         patch("rpg_rules_ai.pipeline.get_vectorstore", return_value=mock_vs),
         patch("rpg_rules_ai.pipeline.get_docstore", return_value=mock_docstore),
-        patch("rpg_rules_ai.pipeline.OpenAIEmbeddings", return_value=mock_embedder),
+        patch("rpg_rules_ai.pipeline.get_embeddings", return_value=mock_embedder),
         patch("rpg_rules_ai.ingest.get_vectorstore", return_value=mock_vs),
         patch("rpg_rules_ai.ingest.get_docstore", return_value=mock_docstore),
         patch("rpg_rules_ai.ingest.settings") as mock_ingest_settings,
         patch("rpg_rules_ai.pipeline.settings") as mock_pipeline_settings,
+        patch("rpg_rules_ai.checkpoints._checkpoint_root", return_value=tmp_path / "checkpoints"),
+        patch("rpg_rules_ai.generations._registry", GenerationRegistry(tmp_path / "generations.db")),
     ):
         mock_ingest_settings.sources_dir = "/tmp/fake_sources"
         mock_pipeline_settings.embedding_model = "text-embedding-3-large"
         mock_pipeline_settings.enable_contextual_embeddings = False
         mock_pipeline_settings.enable_entity_extraction = False
         mock_pipeline_settings.context_model = "gpt-4o-mini"
+        mock_pipeline_settings.near_duplicate_threshold = 0.0
         yield {
             "vs": mock_vs,
             "collection": mock_collection,
@@ -64,24 +85,11 @@ class TestLayeredPipeline:
     def test_parse_error_isolation(self, tmp_path, mock_infra):
         good1 = _make_md(tmp_path, "Good1.md")
         good2 = _make_md(tmp_path, "Good2.md")
-        bad = _make_md(tmp_path, "Bad.md")
-
-        call_count = 0
-        original_loader = None
-
-        def mock_loader_factory(path):
-            nonlocal call_count
-            call_count += 1
-            if "Bad.md" in str(path):
-                loader = MagicMock()
-                loader.load.side_effect = ValueError("Parse failed")
-                return loader
-            from langchain_community.document_loaders import UnstructuredMarkdownLoader
-            return UnstructuredMarkdownLoader(path)
-
-        with patch("rpg_rules_ai.pipeline.UnstructuredMarkdownLoader", side_effect=mock_loader_factory):
-            from rpg_rules_ai.pipeline import run_layered_pipeline
-            result = run_layered_pipeline([good1, bad, good2])
+        bad = tmp_path / "Bad.md"
+        bad.write_bytes(b"# Bad\n\xff\xfe not utf-8")
+
+        from rpg_rules_ai.pipeline import run_layered_pipeline
+        result = run_layered_pipeline([good1, bad, good2])
 
         assert result["status"] == "done"
         statuses = {r["filename"]: r["status"] for r in result["file_results"]}
@@ -180,22 +188,150 @@ class TestLayeredPipeline:
         assert embed_calls >= 1
         assert mock_infra["collection"].add.called
 
+    def test_embed_batches_packed_by_tokens(self, mock_infra):
+        from rpg_rules_ai import pipeline
+
+        children = [
+            Document(page_content="x", metadata={"book": "B", "doc_id": "p1", "start_index": i})
+            for i in range(250)
+        ]
+        with (
+            patch.object(pipeline, "count_tokens", side_effect=lambda t: 10),
+            patch.object(pipeline, "EMBED_BATCH_MAX_TOKENS", 1500),
+        ):
+            pipeline._embed_and_store(children, {})
+
+        sizes = [len(c.args[0]) for c in mock_infra["embedder"].embed_documents.call_args_list]
+        assert sizes == [150, 100]
+        # Each embedding batch is written to Chroma in CHROMA_BATCH_LIMIT slices
+        stored = [len(c.kwargs["ids"]) for c in mock_infra["collection"].add.call_args_list]
+        assert stored == [100, 50, 100]
+
+
+class TestNearDuplicateReuse:
+    TEXT = (
+        "Rapid Strike: you may make two attacks with one weapon on your turn, each at -6 to skill. "
+        "Weapon Master halves this penalty."
+    )
+
+    @pytest.fixture
+    def index(self, tmp_path, mock_infra):
+        from rpg_rules_ai import pipeline
+        from rpg_rules_ai.near_duplicates import NearDuplicateIndex
+
+        idx = NearDuplicateIndex(tmp_path / "near_duplicates.db")
+        pipeline.settings.near_duplicate_threshold = 0.9
+        stored: dict[str, list[float]] = {}
+
+        def add(ids, embeddings, **kwargs):
+            stored.update(zip(ids, embeddings))
+
+        def get(ids=None, **kwargs):
+            found = [i for i in ids or [] if i in stored]
+            return {"ids": found, "embeddings": [stored[i] for i in found], "metadatas": []}
+
+        mock_infra["collection"].add.side_effect = add
+        mock_infra["collection"].get.side_effect = get
+        with patch("rpg_rules_ai.near_duplicates.get_near_duplicate_index", return_value=idx):
+            yield idx
+        idx.close()
+
+    def _children(self, book, texts):
+        return [
+            Document(page_content=t, metadata={"book": book, "doc_id": f"{book}-p", "start_index": i, "generation": "g"})
+            for i, t in enumerate(texts)
+        ]
+
+    def test_reprint_reuses_stored_embedding(self, index, mock_infra):
+        from rpg_rules_ai import pipeline
+
+        pipeline._embed_and_store(self._children("Basic Set.md", [self.TEXT]), {})
+        stats = pipeline.FileStats(filename="Martial Arts.md")
+        reprint = self._children("Martial Arts.md", [self.TEXT, "Feint: a Quick Contest of skills."])
+        pipeline._embed_and_store(reprint, {}, stats=stats)
+
+        calls = mock_infra["embedder"].embed_documents.call_args_list
+        assert [c.args[0] for c in calls] == [[self.TEXT], ["Feint: a Quick Contest of skills."]]
+        stored = mock_infra["collection"].add.call_args_list[-1].kwargs
+        first_id = mock_infra["collection"].add.call_args_list[0].kwargs["ids"][0]
+        assert stored["metadatas"][0]["dup_group"] == first_id
+        assert "dup_group" not in stored["metadatas"][1]
+        assert stats.stages["embed"].embeddings_reused == 1
+
+    def test_copies_in_one_batch_are_embedded_once(self, index, mock_infra):
+        from rpg_rules_ai import pipeline
+
+        children = self._children("Basic Set.md", [self.TEXT, "Feint.", self.TEXT])
+        pipeline._embed_and_store(children, {})
+
+        assert mock_infra["embedder"].embed_documents.call_args.args[0] == [self.TEXT, "Feint."]
+        assert len(mock_infra["collection"].add.call_args.kwargs["embeddings"]) == 3
+
+    def test_missing_record_is_embedded_and_forgotten(self, index, mock_infra):
+        from rpg_rules_ai import pipeline
+        from rpg_rules_ai.near_duplicates import minhash
+
+        index.add([("gone", "Old.md", minhash(self.TEXT), "gone")])
+        pipeline._embed_and_store(self._children("Basic Set.md", [self.TEXT]), {})
+
+        assert mock_infra["embedder"].embed_documents.call_args.args[0] == [self.TEXT]
+        assert index.count() == 1
+
+    def test_resumed_batch_is_embedded_again(self, index, mock_infra):
+        from rpg_rules_ai import pipeline
+
+        children = self._children("Basic Set.md", [self.TEXT, self.TEXT])
+        ids = ["basic-1", "basic-2"]
+        stage = pipeline.StageStats()
+        # Indexed before a crash, but the records never reached the store
+        _, rows = pipeline._embed_batch(mock_infra["embedder"], mock_infra["collection"], children, ids, stage)
+        index.add(rows)
+
+        embeddings, _ = pipeline._embed_batch(mock_infra["embedder"], mock_infra["collection"], children, ids, stage)
+
+        assert embeddings == [[0.1] * 10, [0.1] * 10]
+
+    def test_batch_is_indexed_after_it_is_stored(self, index, mock_infra):
+        from rpg_rules_ai import pipeline
+
+        mock_infra["collection"].add.side_effect = RuntimeError("store down")
+        with pytest.raises(RuntimeError):
+            pipeline._embed_and_store(self._children("Basic Set.md", [self.TEXT]), {})
+
+        assert index.count() == 0
+
+
+class TestTokenBatches:
+    def _docs(self, *tokens):
+        return [Document(page_content="w " * n) for n in tokens]
+
+    def _batches(self, docs, start=0, max_tokens=10, max_items=500):
+        from rpg_rules_ai import pipeline
+
+        with (
+            patch.object(pipeline, "count_tokens", side_effect=lambda t: len(t.split())),
+            patch.object(pipeline, "EMBED_BATCH_MAX_TOKENS", max_tokens),
+            patch.object(pipeline, "EMBED_BATCH_SIZE", max_items),
+        ):
+            return list(pipeline._token_batches(docs, start))
+
+    def test_packs_up_to_token_limit(self):
+        assert self._batches(self._docs(4, 4, 4, 6, 3)) == [(0, 2, 8), (2, 4, 10), (4, 5, 3)]
+
+    def test_oversized_text_gets_its_own_batch(self):
+        assert self._batches(self._docs(2, 30, 2)) == [(0, 1, 2), (1, 2, 30), (2, 3, 2)]
+
+    def test_item_limit_and_start(self):
+        assert self._batches(self._docs(1, 1, 1, 1, 1), start=1, max_items=3) == [(1, 4, 3), (4, 5, 1)]
+
     def test_error_in_one_file_preserves_previous(self, tmp_path, mock_infra):
         """If file 2 fails, file 1's data is already stored."""
         good = _make_md(tmp_path, "Good.md", "# Good\nContent.")
-        bad = _make_md(tmp_path, "Bad.md")
+        bad = tmp_path / "Bad.md"
+        bad.write_bytes(b"# Bad\n\xff\xfe not utf-8")
 
-        def mock_loader_factory(path):
-            if "Bad.md" in str(path):
-                loader = MagicMock()
-                loader.load.side_effect = RuntimeError("Corrupt file")
-                return loader
-            from langchain_community.document_loaders import UnstructuredMarkdownLoader
-            return UnstructuredMarkdownLoader(path)
-
-        with patch("rpg_rules_ai.pipeline.UnstructuredMarkdownLoader", side_effect=mock_loader_factory):
-            from rpg_rules_ai.pipeline import run_layered_pipeline
-            result = run_layered_pipeline([good, bad])
+        from rpg_rules_ai.pipeline import run_layered_pipeline
+        result = run_layered_pipeline([good, bad])
 
         assert result["status"] == "done"
         statuses = {r["filename"]: r["status"] for r in result["file_results"]}
@@ -205,6 +341,24 @@ class TestLayeredPipeline:
         assert mock_infra["docstore"].mset.call_count == 1
 
 
+    def test_cancel_stops_between_files(self, tmp_path, mock_infra):
+        files = [_make_md(tmp_path, f"Book{i}.md", f"# Book {i}\nContent.") for i in range(3)]
+        snapshots: list[dict] = []
+
+        def should_cancel():
+            return bool(snapshots and snapshots[-1]["file_results"])
+
+        from rpg_rules_ai.pipeline import run_layered_pipeline
+        with patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed):
+            result = run_layered_pipeline(files, on_progress=snapshots.append, should_cancel=should_cancel)
+
+        assert result["status"] == "cancelled"
+        assert [r["filename"] for r in result["file_results"]] == ["Book0.md"]
+        # The file in flight is reported so a crashed job knows what to clean up
+        assert any(s["current_file"] == "Book0.md" for s in snapshots)
+        assert result["current_file"] is None
+
+
 class TestContextualEmbeddings:
     def test_disabled_skips_contextualize(self, tmp_path, mock_infra):
         """When ENABLE_CONTEXTUAL_EMBEDDINGS=false, no contextualize runs."""
@@ -302,6 +456,47 @@ Ranged attacks use DX-based weapon skills.
 """
 
 
+class TestParseMarkdown:
+    def test_headers_cut_sections(self, tmp_path):
+        from rpg_rules_ai.chunking import split_into_sections
+        from rpg_rules_ai.pipeline import _parse_file
+
+        md_file = tmp_path / "Rules.md"
+        md_file.write_text(
+            "# Combat\n\nThis chapter covers fighting.\n\n## Melee Attacks\n\nRoll against your skill.\n\n"
+            "### Rapid Strike\n\nTwo attacks at -6 each.\n\n## Ranged Attacks\n\nRanged attacks use DX-based skills.\n",
+            encoding="utf-8",
+        )
+
+        docs = _parse_file(md_file, "Rules.md")
+
+        assert docs[0].metadata == {"book": "Rules.md", "source": str(md_file)}
+        # Pinned: the unstructured loader dropped the header markers, so the
+        # same file used to come out as one section without header metadata
+        assert [(d.page_content, d.metadata) for d in split_into_sections(docs[0].page_content)] == [
+            ("# Combat  \nThis chapter covers fighting.", {}),
+            ("## Melee Attacks  \nRoll against your skill.", {"h2": "Melee Attacks"}),
+            ("### Rapid Strike  \nTwo attacks at -6 each.", {"h2": "Melee Attacks", "h3": "Rapid Strike"}),
+            ("## Ranged Attacks  \nRanged attacks use DX-based skills.", {"h2": "Ranged Attacks"}),
+        ]
+
+    def test_parse_version_is_part_of_the_fingerprint(self, tmp_path):
+        from rpg_rules_ai import checkpoints
+
+        md_file = _make_md(tmp_path, "Rules.md")
+        current = checkpoints.source_fingerprint(md_file)
+        with patch.object(checkpoints, "PARSE_VERSION", checkpoints.PARSE_VERSION - 1):
+            assert checkpoints.source_fingerprint(md_file) != current
+
+    def test_bom_and_crlf_are_normalized(self, tmp_path):
+        from rpg_rules_ai.pipeline import _parse_file
+
+        md_file = tmp_path / "Windows.md"
+        md_file.write_bytes(b"\xef\xbb\xbf## COMBAT\r\nRapid Strike.\r\n")
+
+        assert _parse_file(md_file, "Windows.md")[0].page_content == "## COMBAT\nRapid Strike.\n"
+
+
 class TestPdfPipeline:
     def test_pdf_full_pipeline(self, tmp_path, mock_infra):
         """PDF files go through extract_pdf -> postprocess_headers -> section-aware splitting."""
@@ -386,6 +581,66 @@ class TestPdfPipeline:
         assert statuses["Good.md"] == "success"
         assert statuses["Bad.pdf"] == "error"
 
+    def test_pdf_page_progress_reported(self, tmp_path, mock_infra):
+        pdf_file = _make_pdf(tmp_path, "Paged.pdf")
+        snapshots = []
+
+        def fake_pages(path, on_pages=None, workers=None):
+            for done in (0, 16, 20):
+                on_pages(done, 20)
+            yield SAMPLE_PDF_MARKDOWN
+
+        with patch("rpg_rules_ai.extraction.iter_pdf_pages", side_effect=fake_pages):
+            from rpg_rules_ai.pipeline import run_layered_pipeline
+            result = run_layered_pipeline([pdf_file], on_progress=snapshots.append)
+
+        pages = [(s["current_file"], s["pages_completed"], s["pages_total"]) for s in snapshots]
+        assert ("Paged.pdf", 16, 20) in pages
+        assert (result["pages_completed"], result["pages_total"]) == (0, 0)
+
+    def test_pdf_sections_match_whole_document_path(self, tmp_path):
+        """Streaming the PDF page by page yields the same sections as the old whole-string path."""
+        from rpg_rules_ai.chunking import split_into_sections
+        from rpg_rules_ai.extraction import clean_page_artifacts, postprocess_headers
+        from rpg_rules_ai.pipeline import _parse_file
+
+        pdf_file = _make_pdf(tmp_path, "Streamed.pdf")
+        pages = [SAMPLE_PDF_MARKDOWN[:40], SAMPLE_PDF_MARKDOWN[40:200], "\n42\n", SAMPLE_PDF_MARKDOWN[200:]]
+
+        with patch("rpg_rules_ai.extraction.iter_pdf_pages", side_effect=lambda *a, **kw: iter(pages)):
+            sections = list(_parse_file(pdf_file, "Streamed.pdf"))
+
+        expected = split_into_sections(postprocess_headers(clean_page_artifacts("".join(pages))))
+        assert [(d.page_content, d.metadata) for d in sections] == [
+            (d.page_content, d.metadata) for d in expected
+        ]
+        assert any("h2" in d.metadata for d in sections)
+
+    def test_pdf_sections_stream_into_the_split(self, tmp_path, mock_infra):
+        """Sections are split as the PDF is extracted, not collected first."""
+        from rpg_rules_ai.chunking import split_sections
+
+        pdf_file = _make_pdf(tmp_path, "Lazy.pdf")
+        pages = [SAMPLE_PDF_MARKDOWN[:200], SAMPLE_PDF_MARKDOWN[200:]]
+        seen: list[object] = []
+
+        def recording_split(sections):
+            seen.append(sections)
+            return split_sections(sections)
+
+        from rpg_rules_ai.pipeline import run_layered_pipeline
+        with (
+            patch("rpg_rules_ai.extraction.iter_pdf_pages", side_effect=lambda *a, **kw: iter(pages)),
+            patch("rpg_rules_ai.pipeline.split_sections", side_effect=recording_split),
+        ):
+            result = run_layered_pipeline([pdf_file])
+
+        assert result["status"] == "done"
+        assert not isinstance(seen[0], list)
+        stages = result["file_stats"][0]["stages"]
+        # Each streamed section is counted by the parse stage
+        assert stages["parse"]["items"] > 1
+
 
 class TestEntityExtraction:
     def test_disabled_skips_entity_extraction(self, tmp_path, mock_infra):
@@ -423,3 +678,282 @@ class TestEntityExtraction:
             assert result["status"] == "done"
             mock_idx.add_entities.assert_called()
             mock_idx.close.assert_called()
+
+
+def _parsed(path, book_name, on_pages=None):
+    from langchain_core.documents import Document
+
+    return [Document(page_content=path.read_text(), metadata={"book": book_name})]
+
+
+class TestStageStats:
+    def test_records_per_file_stage_stats(self, tmp_path, mock_infra):
+        files = [_make_md(tmp_path, "Stats.md", "# Stats\n## Rules\n" + "Rapid Strike. " * 100)]
+
+        from rpg_rules_ai.pipeline import run_layered_pipeline
+        with patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed):
+            result = run_layered_pipeline(files)
+
+        [file_stats] = result["file_stats"]
+        assert file_stats["filename"] == "Stats.md"
+        assert file_stats["bytes_read"] == files[0].stat().st_size
+        stages = file_stats["stages"]
+        assert list(stages) == ["parse", "split", "embed", "store"]
+        assert stages["parse"]["items"] == 1
+        assert stages["split"]["items"] > 0
+        assert stages["embed"]["items"] == stages["split"]["items"]
+        assert stages["embed"]["embedding_calls"] == mock_infra["embedder"].embed_documents.call_count
+        assert stages["embed"]["tokens"] > 0
+        assert stages["embed"]["retries"] == 0
+        assert stages["store"]["bytes_written"] > 0
+        assert result["stage_totals"]["embed"]["items"] == stages["embed"]["items"]
+
+    def test_stage_totals_sum_files(self, tmp_path, mock_infra):
+        files = [_make_md(tmp_path, f"Book{i}.md", f"# Book {i}\nContent.") for i in range(2)]
+
+        from rpg_rules_ai.pipeline import run_layered_pipeline
+        with patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed):
+            result = run_layered_pipeline(files)
+
+        assert result["stage_totals"]["parse"]["items"] == 2
+        assert list(result["stage_totals"]) == ["parse", "split", "embed", "store"]
+
+    def test_llm_stages_counted_when_enabled(self, tmp_path, mock_infra):
+        files = [_make_md(tmp_path, "Ctx.md", "# Ctx\nRapid Strike lets you attack twice.")]
+
+        def fake_contextualize(children, parent_map):
+            return children
+
+        with (
+            patch("rpg_rules_ai.pipeline.settings") as mock_settings,
+            patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed),
+            patch("rpg_rules_ai.pipeline._contextualize_chunks", side_effect=fake_contextualize),
+            patch("rpg_rules_ai.pipeline._extract_and_store_entities"),
+        ):
+            mock_settings.embedding_model = "text-embedding-3-large"
+            mock_settings.enable_contextual_embeddings = True
+            mock_settings.enable_entity_extraction = True
+
+            from rpg_rules_ai.pipeline import run_layered_pipeline
+            result = run_layered_pipeline(files)
+
+        stages = result["file_stats"][0]["stages"]
+        assert stages["contextualize"]["llm_calls"] == stages["split"]["items"]
+        assert stages["entities"]["llm_calls"] >= 1
+        assert stages["entities"]["tokens"] > 0
+
+    def test_embedding_retry_counted(self, tmp_path, mock_infra):
+        calls = {"n": 0}
+
+        def flaky(texts):
+            calls["n"] += 1
+            if calls["n"] == 1:
+                raise RuntimeError("rate limited")
+            return [[0.1] * 10 for _ in texts]
+
+        mock_infra["embedder"].embed_documents.side_effect = flaky
+        files = [_make_md(tmp_path, "Retry.md", "# Retry\nContent.")]
+
+        from rpg_rules_ai.pipeline import run_layered_pipeline
+        with (
+            patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed),
+            patch("rpg_rules_ai.pipeline.time.sleep") as mock_sleep,
+        ):
+            result = run_layered_pipeline(files)
+
+        assert result["file_results"][0]["status"] == "success"
+        embed = result["file_stats"][0]["stages"]["embed"]
+        assert embed["retries"] == 1
+        assert embed["embedding_calls"] == 2
+        mock_sleep.assert_called_once()
+
+    def test_embedding_gives_up_after_max_retries(self, tmp_path, mock_infra):
+        mock_infra["embedder"].embed_documents.side_effect = RuntimeError("down")
+        files = [_make_md(tmp_path, "Down.md", "# Down\nContent.")]
+
+        from rpg_rules_ai.pipeline import EMBED_MAX_RETRIES, run_layered_pipeline
+        with (
+            patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed),
+            patch("rpg_rules_ai.pipeline.time.sleep"),
+        ):
+            result = run_layered_pipeline(files)
+
+        assert result["file_results"][0]["status"] == "error"
+        embed = result["file_stats"][0]["stages"]["embed"]
+        assert embed["embedding_calls"] == EMBED_MAX_RETRIES + 1
+        mock_infra["collection"].add.assert_not_called()
+
+
+class TestResume:
+    def _crash_on_batch(self, mock_infra, batch: int):
+        """Make the collection fail on the given (1-based) add call."""
+        calls = {"n": 0}
+
+        def add(**kwargs):
+            calls["n"] += 1
+            if calls["n"] == batch:
+                raise RuntimeError("killed")
+
+        mock_infra["collection"].add.side_effect = add
+
+    def test_resume_skips_stored_batches(self, tmp_path, mock_infra):
+        files = [_make_md(tmp_path, "Big.md", "# Big\n## Rules\n" + "Rapid Strike text. " * 400)]
+        from rpg_rules_ai import pipeline
+        from rpg_rules_ai.checkpoints import IngestCheckpoint, incomplete_books
+
+        with (
+            patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed) as mock_parse,
+            patch.object(pipeline, "EMBED_BATCH_SIZE", 2),
+        ):
+            self._crash_on_batch(mock_infra, 2)
+            first = pipeline.run_layered_pipeline(files)
+            assert first["file_results"][0]["status"] == "error"
+            checkpoint = IngestCheckpoint.load("Big.md")
+            assert checkpoint.children_stored == 2
+            assert incomplete_books() == ["Big.md"]
+
+            # Partial chunks are in Chroma, but the book resumes instead of being skipped
+            mock_infra["collection"].get.return_value = {"metadatas": [{"book": "Big.md"}]}
+            mock_infra["collection"].count.return_value = 1
+            embedded_before = mock_infra["embedder"].embed_documents.call_count
+            second = pipeline.run_layered_pipeline(files)
+
+        assert second["file_results"][0]["status"] == "success"
+        assert mock_parse.call_count == 1  # split result came from the checkpoint
+        total_batches = -(-len(checkpoint.children) // 2)
+        assert mock_infra["embedder"].embed_documents.call_count - embedded_before == total_batches - 1
+        upserted = [c.kwargs["ids"] for c in mock_infra["collection"].upsert.call_args_list]
+        assert [i for ids in upserted for i in ids] == checkpoint.child_ids[2:]
+        mock_infra["docstore"].mset.assert_called_once()
+        assert IngestCheckpoint.load("Big.md") is None
+        assert incomplete_books() == []
+
+    def test_changed_source_discards_checkpoint(self, tmp_path, mock_infra):
+        path = _make_md(tmp_path, "Edit.md", "# Edit\n" + "Old text. " * 200)
+        from rpg_rules_ai import pipeline
+        from rpg_rules_ai.checkpoints import IngestCheckpoint
+
+        with (
+            patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed) as mock_parse,
+            patch.object(pipeline, "EMBED_BATCH_SIZE", 2),
+            patch("rpg_rules_ai.ingest.delete_book_chunks") as mock_delete,
+        ):
+            self._crash_on_batch(mock_infra, 2)
+            pipeline.run_layered_pipeline([path])
+            stale = IngestCheckpoint.load("Edit.md").generation
+
+            path.write_text("# Edit\n" + "New text. " * 200)
+            mock_infra["collection"].add.side_effect = None
+            result = pipeline.run_layered_pipeline([path])
+
+        assert result["file_results"][0]["status"] == "success"
+        # Only the abandoned staging generation is dropped, not the whole book
+        mock_delete.assert_any_call("Edit.md", where={"generation": stale})
+        assert stale not in pipeline.get_registry().hidden()
+        assert mock_parse.call_count == 2
+        mock_infra["collection"].upsert.assert_not_called()
+
+    def test_reindex_after_interrupted_ingest_starts_over(self, tmp_path, mock_infra):
+        books = tmp_path / "books"
+        books.mkdir()
+        _make_md(books, "Big.md", "# Big\n## Rules\n" + "Rapid Strike text. " * 400)
+        from rpg_rules_ai import pipeline
+        from rpg_rules_ai.checkpoints import IngestCheckpoint, incomplete_books
+        from rpg_rules_ai.ingest import reindex_directory
+        from rpg_rules_ai.near_duplicates import get_near_duplicate_index, minhash
+
+        with (
+            patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed),
+            patch.object(pipeline, "EMBED_BATCH_SIZE", 2),
+        ):
+            self._crash_on_batch(mock_infra, 2)
+            pipeline.run_layered_pipeline([books / "Big.md"])
+            checkpoint = IngestCheckpoint.load("Big.md")
+            get_near_duplicate_index().add([("stale", "Big.md", minhash("Rapid Strike text."), "stale")])
+
+            mock_infra["collection"].add.reset_mock(side_effect=True)
+            assert reindex_directory(books) == 1
+
+        # Every child is written again into the reset collection, none skipped
+        added = [i for c in mock_infra["collection"].add.call_args_list for i in c.kwargs["ids"]]
+        assert len(added) == len(checkpoint.child_ids)
+        mock_infra["collection"].upsert.assert_not_called()
+        assert incomplete_books() == []
+        registry = pipeline.get_registry()
+        assert registry.hidden() == []
+        assert registry.active("Big.md") != checkpoint.generation
+        assert get_near_duplicate_index().count() == 0
+
+    def test_resume_skips_paid_llm_stages(self, tmp_path, mock_infra):
+        files = [_make_md(tmp_path, "Ctx.md", "# Ctx\n" + "Rapid Strike lets you attack twice. " * 100)]
+        from rpg_rules_ai import pipeline
+
+        def fake_contextualize(children, parent_map):
+            return [
+                type(c)(page_content="ctx\n\n" + c.page_content,
+                        metadata={**c.metadata, "original_text": c.page_content, "context_prefix": "ctx"})
+                for c in children
+            ]
+
+        with (
+            patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed),
+            patch("rpg_rules_ai.pipeline._contextualize_chunks", side_effect=fake_contextualize) as mock_ctx,
+            patch("rpg_rules_ai.pipeline._extract_and_store_entities") as mock_entities,
+            patch.object(pipeline, "EMBED_BATCH_SIZE", 2),
+        ):
+            pipeline.settings.enable_contextual_embeddings = True
+            pipeline.settings.enable_entity_extraction = True
+            self._crash_on_batch(mock_infra, 1)
+            pipeline.run_layered_pipeline(files)
+            mock_infra["collection"].add.side_effect = None
+            result = pipeline.run_layered_pipeline(files)
+
+        assert result["file_results"][0]["status"] == "success"
+        assert mock_ctx.call_count == 1
+        assert mock_entities.call_count == 1
+        stored = [d for c in mock_infra["collection"].upsert.call_args_list for d in c.kwargs["documents"]]
+        assert stored and all(d.startswith("ctx\n\n") for d in stored)
+
+
+class TestGenerations:
+    def test_chunks_tagged_and_activated(self, tmp_path, mock_infra):
+        files = [_make_md(tmp_path, "Gen.md", "# Gen\nContent.")]
+        from rpg_rules_ai import pipeline
+
+        with patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed):
+            pipeline.run_layered_pipeline(files)
+
+        generation = pipeline.get_registry().active("Gen.md")
+        assert generation is not None
+        metadatas = mock_infra["collection"].add.call_args.kwargs["metadatas"]
+        assert {m["generation"] for m in metadatas} == {generation}
+        parents = [d for _, d in mock_infra["docstore"].mset.call_args.args[0]]
+        assert parents and all(b'"generation"' in p for p in parents)
+        content_hash = hashlib.sha256(files[0].read_bytes()).hexdigest()
+        assert pipeline.get_registry().book_with_source(content_hash) == "Gen.md"
+
+    def test_replace_keeps_old_chunks_until_activation(self, tmp_path, mock_infra):
+        path = _make_md(tmp_path, "Swap.md", "# Swap\nOld content.")
+        from rpg_rules_ai import pipeline
+        registry = pipeline.get_registry()
+
+        with patch("rpg_rules_ai.pipeline._parse_file", side_effect=_parsed):
+            pipeline.run_layered_pipeline([path])
+            old = registry.active("Swap.md")
+
+            mock_infra["collection"].get.return_value = {"metadatas": [{"book": "Swap.md"}]}
+            mock_infra["collection"].count.return_value = 1
+            events = []
+            mock_infra["collection"].add.side_effect = lambda **kw: events.append("add")
+            mock_infra["collection"].delete.side_effect = lambda **kw: events.append(("delete", kw["where"]))
+            path.write_text("# Swap\nNew content.")
+            result = pipeline.run_layered_pipeline([path], replace=True)
+
+        new = registry.active("Swap.md")
+        assert result["file_results"][0]["status"] == "success"
+        assert new != old
+        assert registry.hidden() == []
+        # Old chunks are deleted only after the new ones are stored and active
+        assert events == ["add", ("delete", {
+            "$and": [{"book": "Swap.md"}, {"generation": {"$nin": [new]}}],
+        })]
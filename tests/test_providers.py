@@ -0,0 +1,154 @@
+"""Tests for model provider selection and the deterministic fakes."""
+
+import asyncio
+import math
+import time
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from rpg_rules_ai.entity_extractor import ExtractedEntities
+from rpg_rules_ai.metrics import LLMMetricsHandler
+from rpg_rules_ai.providers import (
+    FakeChatModel,
+    FakeEmbeddings,
+    MeteredEmbeddings,
+    get_chat_model,
+    get_embeddings,
+)
+from rpg_rules_ai.schemas import AnswerWithSources, LLMQuestions
+from rpg_rules_ai.strategies.multi_hop import SufficiencyAnalysis
+
+
+class TestProviderSelection:
+    @patch("rpg_rules_ai.providers.ChatOpenAI")
+    @patch("rpg_rules_ai.providers.settings")
+    def test_openai_chat_by_default(self, mock_settings, mock_chat_cls):
+        mock_settings.model_provider = "openai"
+        get_chat_model(model="gpt-4o-mini", temperature=0)
+        kwargs = mock_chat_cls.call_args[1]
+        assert kwargs["model"] == "gpt-4o-mini"
+        assert kwargs["temperature"] == 0
+        assert isinstance(kwargs["callbacks"][0], LLMMetricsHandler)
+
+    @patch("rpg_rules_ai.providers.settings")
+    def test_fake_chat(self, mock_settings):
+        mock_settings.model_provider = "fake"
+        mock_settings.fake_latency_ms = 5
+        llm = get_chat_model(model="gpt-4o-mini")
+        assert isinstance(llm, FakeChatModel)
+        assert llm.latency_ms == 5
+
+    @patch("rpg_rules_ai.providers.OpenAIEmbeddings")
+    @patch("rpg_rules_ai.providers.settings")
+    def test_openai_embeddings_by_default(self, mock_settings, mock_emb_cls):
+        mock_settings.model_provider = "openai"
+        get_embeddings(model="text-embedding-3-large")
+        mock_emb_cls.assert_called_once_with(model="text-embedding-3-large")
+
+    @patch("rpg_rules_ai.providers.settings")
+    def test_fake_embeddings(self, mock_settings):
+        mock_settings.model_provider = "fake"
+        mock_settings.fake_latency_ms = 0
+        embeddings = get_embeddings(model="anything")
+        assert isinstance(embeddings, MeteredEmbeddings)
+        assert isinstance(embeddings.inner, FakeEmbeddings)
+
+
+class TestFakeEmbeddings:
+    def test_deterministic_and_normalized(self):
+        emb = FakeEmbeddings()
+        a = emb.embed_query("Rapid Strike penalty")
+        assert a == FakeEmbeddings().embed_query("Rapid Strike penalty")
+        assert len(a) == 256
+        assert math.isclose(sum(v * v for v in a), 1.0, rel_tol=1e-9)
+
+    def test_shared_words_are_closer(self):
+        emb = FakeEmbeddings()
+        query, related, unrelated = emb.embed_documents([
+            "rapid strike penalty",
+            "rapid strike gives a penalty to each attack",
+            "fireball costs fatigue per die",
+        ])
+
+        def dot(x, y):
+            return sum(i * j for i, j in zip(x, y))
+
+        assert dot(query, related) > dot(query, unrelated)
+
+    @pytest.mark.asyncio
+    async def test_latency_injected(self):
+        emb = FakeEmbeddings(latency_ms=20)
+        start = time.perf_counter()
+        await emb.aembed_documents(["a"])
+        assert time.perf_counter() - start >= 0.015
+
+
+class TestFakeChatModel:
+    @pytest.mark.asyncio
+    async def test_rewrite_echoes_follow_up(self):
+        llm = FakeChatModel()
+        result = await llm.ainvoke([
+            SystemMessage(content="Rewrite"),
+            HumanMessage(content="Conversation history:\n...\n\nFollow-up question: What about Magery?"),
+        ])
+        assert result.content == "What about Magery?"
+
+    @pytest.mark.asyncio
+    async def test_question_expansion_through_prompt(self):
+        prompt = ChatPromptTemplate.from_messages([("system", "Expand."), ("placeholder", "{messages}")])
+        chain = prompt | FakeChatModel().with_structured_output(LLMQuestions)
+        result = await chain.ainvoke(
+            {"messages": [("user", "Expand the following question: How does Rapid Strike work?")]}
+        )
+        assert [q.question for q in result.questions] == [
+            "How does Rapid Strike work?",
+            "How does Rapid Strike work? rules",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_analyzer_is_sufficient(self):
+        result = await FakeChatModel().with_structured_output(SufficiencyAnalysis).ainvoke("context")
+        assert result.sufficient is True
+
+    @pytest.mark.asyncio
+    async def test_answer_cites_first_passage(self):
+        context = "[1] Source: Basic Set\nRapid Strike allows two attacks. Each is at -6.\n---\n[2] Source: Martial Arts\nOther."
+        result = await FakeChatModel().with_structured_output(AnswerWithSources).ainvoke(
+            [HumanMessage(content=f"Question: Q\n\nContext:\n{context}")]
+        )
+        assert result["citations"] == [
+            {"index": 1, "quote": "Rapid Strike allows two attacks.", "source": "Basic Set"}
+        ]
+        assert result["sources"] == ["Basic Set"]
+
+    @pytest.mark.asyncio
+    async def test_answer_without_context(self):
+        result = await FakeChatModel().with_structured_output(AnswerWithSources).ainvoke("Question: Q")
+        assert result["citations"] == []
+
+    @pytest.mark.asyncio
+    async def test_entities_from_title_case_names(self):
+        result = await FakeChatModel().with_structured_output(ExtractedEntities).ainvoke(
+            "Rapid Strike is a maneuver. See also Extra Attack and Rapid Strike."
+        )
+        names = [e.name for e in result.entities]
+        assert names == ["Rapid Strike", "Extra Attack"]
+        assert result.entities[0].mention_type == "defines"
+
+    def test_unknown_schema_raises(self):
+        class Unknown:
+            pass
+
+        with pytest.raises(ValueError):
+            FakeChatModel().with_structured_output(Unknown).invoke("x")
+
+    @pytest.mark.asyncio
+    async def test_latency_injected(self):
+        llm = FakeChatModel(latency_ms=20)
+        start = time.perf_counter()
+        await asyncio.gather(llm.ainvoke("a"), llm.ainvoke("b"))
+        # Concurrent calls overlap instead of serializing
+        assert 0.015 <= time.perf_counter() - start < 0.2
@@ -0,0 +1,89 @@
+"""Tests for local lexical reranking."""
+
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+
+from rpg_rules_ai import tokens
+from rpg_rules_ai.rerank import bm25_scores, rerank_documents, unique_documents
+
+
+def _doc(text: str, book: str = "Basic Set", **meta) -> Document:
+    return Document(page_content=text, metadata={"book": book, **meta})
+
+
+class TestBm25:
+    def test_matching_text_scores_higher(self):
+        scores = bm25_scores(
+            "rapid strike penalty",
+            ["Rapid Strike gives a -6 penalty.", "Fireball costs 1 FP per die."],
+        )
+        assert scores[0] > scores[1]
+        assert scores[1] == 0.0
+
+    def test_rare_terms_weigh_more(self):
+        texts = [
+            "attack attack attack",
+            "attack feint",
+            "attack",
+        ]
+        scores = bm25_scores("feint attack", texts)
+        assert scores[1] == max(scores)
+
+    def test_empty(self):
+        assert bm25_scores("anything", []) == []
+
+
+class TestUniqueDocuments:
+    def test_dedupes_by_book_and_text(self):
+        docs = [_doc("Same."), _doc("Same."), _doc("Same.", "Other Book")]
+        assert len(unique_documents(docs)) == 2
+
+    def test_uses_original_text(self):
+        docs = [
+            _doc("Prefix A\n\nBody", original_text="Body"),
+            _doc("Prefix B\n\nBody", original_text="Body"),
+        ]
+        assert len(unique_documents(docs)) == 1
+
+    def test_drops_documents_retrieved_only_for_seen_copies(self):
+        first = _doc("Rapid Strike, Basic Set wording.", hit_groups=["g1", "g2"])
+        reprint = _doc("Rapid Strike, Martial Arts wording.", "Martial Arts", hit_groups=["g1"])
+        extra = _doc("Rapid Strike and Feint.", "Martial Arts", hit_groups=["g1", "g3"])
+
+        assert unique_documents([first, reprint, extra]) == [first, extra]
+
+
+class TestRerankDocuments:
+    def setup_method(self):
+        self._patch = patch.object(tokens, "_get_encoding", return_value=None)
+        self._patch.start()
+
+    def teardown_method(self):
+        self._patch.stop()
+
+    def test_keeps_everything_within_budget(self):
+        docs = [_doc("Rapid Strike rules."), _doc("Fireball rules.")]
+        kept = rerank_documents("rapid strike", docs, max_tokens=10_000)
+        assert len(kept) == 2
+        assert kept[0].page_content == "Rapid Strike rules."
+
+    def test_budget_drops_low_value_docs(self):
+        relevant = _doc("Rapid Strike allows two attacks at -6 each.")
+        filler = [_doc(f"Unrelated cooking recipe number {i}. " * 20) for i in range(5)]
+        budget = tokens.count_tokens(relevant.page_content) + 5
+        kept = rerank_documents("rapid strike attacks", filler + [relevant], max_tokens=budget)
+        assert kept == [relevant]
+
+    def test_always_keeps_top_document(self):
+        big = _doc("Rapid Strike " * 500)
+        kept = rerank_documents("rapid strike", [big], max_tokens=10)
+        assert kept == [big]
+
+    def test_retrieval_order_breaks_lexical_ties(self):
+        docs = [_doc("First passage."), _doc("Second passage.")]
+        kept = rerank_documents("unrelated question", docs, max_tokens=10_000)
+        assert [d.page_content for d in kept] == ["First passage.", "Second passage."]
+
+    def test_empty(self):
+        assert rerank_documents("q", [], max_tokens=100) == []
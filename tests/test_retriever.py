@@ -1,4 +1,4 @@
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -10,12 +10,28 @@ def reset_singletons():
     """Reset module-level singletons between tests."""
     retriever_module._retriever = None
     retriever_module._vectorstore = None
-    yield
+    with patch("rpg_rules_ai.retriever.chromadb.PersistentClient", side_effect=lambda **kwargs: MagicMock()):
+        yield
     retriever_module._retriever = None
     retriever_module._vectorstore = None
+    retriever_module._client = None
 
 
-@patch("rpg_rules_ai.retriever.OpenAIEmbeddings")
+@pytest.fixture(autouse=True)
+def isolated_generations(tmp_path):
+    """Keep the generation registry out of the working tree."""
+    from rpg_rules_ai import generations
+
+    with (
+        patch.object(generations.settings, "generations_path", str(tmp_path / "generations.db")),
+        patch.object(generations, "_registry", None),
+    ):
+        yield
+        if generations._registry is not None:
+            generations._registry.close()
+
+
+@patch("rpg_rules_ai.retriever.get_embeddings")
 @patch("rpg_rules_ai.retriever.BatchedChroma")
 def test_get_vectorstore_creates_instance(mock_chroma_cls, mock_embeddings_cls):
     mock_embeddings = MagicMock()
@@ -30,11 +46,14 @@ def test_get_vectorstore_creates_instance(mock_chroma_cls, mock_embeddings_cls):
     mock_chroma_cls.assert_called_once_with(
         collection_name="rpg_rules_ai",
         embedding_function=mock_embeddings,
-        persist_directory=retriever_module.settings.chroma_persist_dir,
+        client=retriever_module._client,
+    )
+    retriever_module.chromadb.PersistentClient.assert_called_once_with(
+        path=retriever_module.settings.chroma_persist_dir
     )
 
 
-@patch("rpg_rules_ai.retriever.OpenAIEmbeddings")
+@patch("rpg_rules_ai.retriever.get_embeddings")
 @patch("rpg_rules_ai.retriever.BatchedChroma")
 def test_get_vectorstore_returns_cached(mock_chroma_cls, mock_embeddings_cls):
     mock_chroma_cls.return_value = MagicMock()
@@ -45,7 +64,7 @@ def test_get_vectorstore_returns_cached(mock_chroma_cls, mock_embeddings_cls):
 
 @patch("rpg_rules_ai.retriever.get_child_splitter")
 @patch("rpg_rules_ai.retriever.get_parent_splitter")
-@patch("rpg_rules_ai.retriever.ParentDocumentRetriever")
+@patch("rpg_rules_ai.retriever.HitTrackingParentRetriever")
 @patch("rpg_rules_ai.retriever.get_vectorstore")
 @patch("rpg_rules_ai.retriever.get_docstore")
 def test_get_retriever_creates_instance(mock_get_ds, mock_get_vs, mock_pdr_cls, mock_parent_sp, mock_child_sp):
@@ -77,7 +96,7 @@ def test_get_retriever_returns_cached(mock_get_vs):
 
 @patch("rpg_rules_ai.retriever.get_child_splitter")
 @patch("rpg_rules_ai.retriever.get_parent_splitter")
-@patch("rpg_rules_ai.retriever.ParentDocumentRetriever")
+@patch("rpg_rules_ai.retriever.HitTrackingParentRetriever")
 @patch("rpg_rules_ai.retriever.get_vectorstore")
 @patch("rpg_rules_ai.retriever.get_docstore")
 def test_get_retriever_uses_mmr_search_type(mock_get_ds, mock_get_vs, mock_pdr_cls, mock_parent_sp, mock_child_sp):
@@ -93,7 +112,7 @@ def test_get_retriever_uses_mmr_search_type(mock_get_ds, mock_get_vs, mock_pdr_c
 
 @patch("rpg_rules_ai.retriever.get_child_splitter")
 @patch("rpg_rules_ai.retriever.get_parent_splitter")
-@patch("rpg_rules_ai.retriever.ParentDocumentRetriever")
+@patch("rpg_rules_ai.retriever.HitTrackingParentRetriever")
 @patch("rpg_rules_ai.retriever.get_vectorstore")
 @patch("rpg_rules_ai.retriever.get_docstore")
 def test_get_retriever_passes_search_kwargs_from_config(mock_get_ds, mock_get_vs, mock_pdr_cls, mock_parent_sp, mock_child_sp):
@@ -108,3 +127,196 @@ def test_get_retriever_passes_search_kwargs_from_config(mock_get_ds, mock_get_vs
     assert search_kwargs["k"] == retriever_module.settings.retriever_k
     assert search_kwargs["fetch_k"] == retriever_module.settings.retriever_fetch_k
     assert search_kwargs["lambda_mult"] == retriever_module.settings.retriever_lambda_mult
+
+
+def _hit_retriever(children, parents):
+    from langchain_core.stores import InMemoryStore
+    from langchain_core.vectorstores import VectorStore
+    from langchain_text_splitters import TextSplitter
+
+    vectorstore = MagicMock(spec=VectorStore)
+    vectorstore.max_marginal_relevance_search.return_value = children
+    docstore = InMemoryStore()
+    docstore.mset(list(parents.items()))
+    return retriever_module.HitTrackingParentRetriever(
+        vectorstore=vectorstore,
+        docstore=docstore,
+        child_splitter=MagicMock(spec=TextSplitter),
+        search_type="mmr",
+    )
+
+
+def test_hit_tracking_retriever_attaches_child_offsets():
+    from langchain_core.documents import Document
+
+    children = [
+        Document(page_content="second child", metadata={"doc_id": "p1", "start_index": 400}),
+        Document(page_content="other", metadata={"doc_id": "p2", "start_index": 0}),
+        Document(
+            page_content="Context prefix\n\nfirst child",
+            metadata={"doc_id": "p1", "start_index": 0, "original_text": "first child"},
+        ),
+    ]
+    parents = {
+        "p1": Document(page_content="parent one", metadata={"book": "A"}),
+        "p2": Document(page_content="parent two", metadata={"book": "B"}),
+    }
+
+    docs = _hit_retriever(children, parents).invoke("query")
+
+    assert [d.page_content for d in docs] == ["parent one", "parent two"]
+    assert docs[0].metadata["child_hits"] == [[400, 412], [0, 11]]
+    assert docs[1].metadata["child_hits"] == [[0, 5]]
+
+
+def test_hit_tracking_retriever_collapses_near_duplicate_children():
+    from langchain_core.documents import Document
+
+    children = [
+        Document(id="c1", page_content="Rapid Strike", metadata={"doc_id": "p1", "start_index": 0}),
+        Document(id="c2", page_content="Rapid Strike", metadata={"doc_id": "p2", "start_index": 0, "dup_group": "c1"}),
+        Document(id="c3", page_content="Feint", metadata={"doc_id": "p3", "start_index": 0, "dup_group": "c9"}),
+    ]
+    parents = {
+        "p1": Document(page_content="Basic Set parent", metadata={"book": "Basic Set.md"}),
+        "p2": Document(page_content="Martial Arts parent", metadata={"book": "Martial Arts.md"}),
+        "p3": Document(page_content="Feint parent", metadata={"book": "Martial Arts.md"}),
+    }
+
+    docs = _hit_retriever(children, parents).invoke("query")
+
+    assert [d.page_content for d in docs] == ["Basic Set parent", "Feint parent"]
+    assert docs[0].metadata["hit_groups"] == ["c1"]
+    assert docs[1].metadata["hit_groups"] == ["c9"]
+
+
+@pytest.mark.asyncio
+async def test_hit_tracking_retriever_searches_with_precomputed_embeddings():
+    from langchain_core.documents import Document
+
+    children = [Document(page_content="Rapid Strike", metadata={"doc_id": "p1", "start_index": 0})]
+    retriever = _hit_retriever(children, {"p1": Document(page_content="parent", metadata={"book": "A"})})
+    vectorstore = retriever.vectorstore
+    vectorstore.embeddings.aembed_documents = AsyncMock(return_value=[[0.1], [0.2]])
+    vectorstore.amax_marginal_relevance_search_by_vector = AsyncMock(return_value=children)
+
+    embeddings = await retriever.aembed_queries(["Rapid Strike?", "Feint?"])
+    docs = await retriever.ainvoke_with_embedding("Feint?", embeddings[1])
+
+    vectorstore.embeddings.aembed_documents.assert_awaited_once_with(["Rapid Strike?", "Feint?"])
+    assert vectorstore.amax_marginal_relevance_search_by_vector.call_args.args == ([0.2],)
+    vectorstore.max_marginal_relevance_search.assert_not_called()
+    assert [d.page_content for d in docs] == ["parent"]
+    assert docs[0].metadata["child_hits"] == [[0, 12]]
+
+
+def test_hit_tracking_retriever_skips_missing_parents():
+    from langchain_core.documents import Document
+
+    children = [Document(page_content="orphan", metadata={"doc_id": "gone", "start_index": 0})]
+
+    assert _hit_retriever(children, {}).invoke("query") == []
+
+
+def test_hit_tracking_retriever_hides_inactive_generations():
+    retriever = _hit_retriever([], {})
+    retriever.search_kwargs = {"k": 4, "filter": {"edition": "4e"}}
+
+    with patch("rpg_rules_ai.retriever.hidden_generations", return_value=[]):
+        retriever.invoke("query")
+    assert retriever.vectorstore.max_marginal_relevance_search.call_args.kwargs == {
+        "k": 4, "filter": {"edition": "4e"},
+    }
+
+    with patch("rpg_rules_ai.retriever.hidden_generations", return_value=["g-staging"]):
+        retriever.invoke("query")
+    assert retriever.vectorstore.max_marginal_relevance_search.call_args.kwargs["filter"] == {
+        "$and": [{"edition": "4e"}, {"generation": {"$nin": ["g-staging"]}}],
+    }
+
+
+class _Store:
+    """Stand-in store without the reference cycles of a MagicMock."""
+
+
+@patch("rpg_rules_ai.retriever.get_embeddings")
+@patch("rpg_rules_ai.retriever.BatchedChroma")
+def test_vectorstore_reopens_after_other_process_changes_corpus(mock_chroma_cls, mock_embeddings_cls):
+    import os
+
+    mock_chroma_cls.side_effect = lambda **kwargs: _Store()
+    registry = MagicMock()
+    registry.corpus_version.return_value = (1, os.getpid())
+
+    with (
+        patch("rpg_rules_ai.retriever.get_registry", return_value=registry),
+        patch.object(retriever_module, "_corpus_version", None),
+        patch.object(retriever_module.settings, "corpus_check_seconds", 0),
+    ):
+        first_id = id(retriever_module.get_vectorstore())
+        old_client = retriever_module._client
+
+        # A change made by this process keeps the same client
+        registry.corpus_version.return_value = (2, os.getpid())
+        assert id(retriever_module.get_vectorstore()) == first_id
+
+        # A change by another process is deferred while this one is writing
+        registry.corpus_version.return_value = (3, os.getpid() + 1)
+        with retriever_module.holding_vectorstore():
+            assert id(retriever_module.get_vectorstore()) == first_id
+        old_client.close.assert_not_called()
+
+        reopened = retriever_module.get_vectorstore()
+        assert retriever_module._corpus_version == 3
+
+    assert id(reopened) != first_id
+    old_client.close.assert_called_once()
+    assert retriever_module._client is not old_client
+
+
+@patch("rpg_rules_ai.retriever.get_embeddings")
+@patch("rpg_rules_ai.retriever.BatchedChroma")
+def test_vectorstore_reload_waits_for_in_flight_queries(mock_chroma_cls, mock_embeddings_cls):
+    import os
+
+    mock_chroma_cls.side_effect = lambda **kwargs: _Store()
+    registry = MagicMock()
+    registry.corpus_version.return_value = (1, os.getpid())
+
+    with (
+        patch("rpg_rules_ai.retriever.get_registry", return_value=registry),
+        patch.object(retriever_module, "_corpus_version", None),
+        patch.object(retriever_module.settings, "corpus_check_seconds", 0),
+    ):
+        first = retriever_module.get_vectorstore()
+        old_client = retriever_module._client
+
+        # An in-flight query still holds the old store
+        registry.corpus_version.return_value = (2, os.getpid() + 1)
+        assert retriever_module.get_vectorstore() is first
+        old_client.close.assert_not_called()
+
+        del first
+        retriever_module.get_vectorstore()
+        assert retriever_module._corpus_version == 2
+
+    old_client.close.assert_called_once()
+
+
+@patch("rpg_rules_ai.retriever.get_embeddings")
+@patch("rpg_rules_ai.retriever.BatchedChroma")
+def test_corpus_version_is_checked_at_most_once_per_interval(mock_chroma_cls, mock_embeddings_cls):
+    import os
+
+    registry = MagicMock()
+    registry.corpus_version.return_value = (1, os.getpid())
+
+    with (
+        patch("rpg_rules_ai.retriever.get_registry", return_value=registry),
+        patch.object(retriever_module, "_corpus_version", None),
+        patch.object(retriever_module.settings, "corpus_check_seconds", 60),
+    ):
+        for _ in range(3):
+            retriever_module.get_vectorstore()
+
+    registry.corpus_version.assert_called_once()
@@ -0,0 +1,149 @@
+"""Tests for running blocking document operations off the event loop."""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from rpg_rules_ai import services
+
+
+@pytest.fixture(autouse=True)
+def io_executor():
+    services.stop_io_executor()
+    with patch.object(services.settings, "blocking_io_workers", 2):
+        yield
+    services.stop_io_executor()
+
+
+async def _max_loop_lag(work, interval: float = 0.01) -> float:
+    """Run `work` while a ticker measures the worst delay of the event loop."""
+    lag = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal lag
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(lag, time.perf_counter() - start - interval)
+
+    probe = asyncio.create_task(ticker())
+    await asyncio.sleep(0)  # let the ticker start before the work
+    try:
+        await work
+    finally:
+        done.set()
+        await probe
+    return lag
+
+
+def _slow_books():
+    time.sleep(0.2)
+    return [{"book": "Basic Set.md"}]
+
+
+def test_concurrent_document_calls_do_not_stall_event_loop():
+    async def load():
+        return await asyncio.gather(*(services.alist_books() for _ in range(4)))
+
+    with patch("rpg_rules_ai.services.get_books_metadata", side_effect=_slow_books):
+        lag = asyncio.run(_max_loop_lag(load()))
+
+    assert lag < 0.1
+
+
+def test_blocking_call_on_loop_would_stall():
+    """Sanity check for the probe: the same call made inline does show up as lag."""
+    async def inline():
+        services.list_books()
+
+    with patch("rpg_rules_ai.services.get_books_metadata", side_effect=_slow_books):
+        lag = asyncio.run(_max_loop_lag(inline()))
+
+    assert lag >= 0.15
+
+
+def test_pool_is_bounded():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def tracked(book):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    async def delete_many():
+        await asyncio.gather(*(services.adelete_book(f"B{i}.md") for i in range(6)))
+
+    with patch("rpg_rules_ai.services._delete_book", side_effect=tracked):
+        asyncio.run(delete_many())
+
+    assert peak == 2
+
+
+def test_entity_graph_empty_without_chunks():
+    assert asyncio.run(services.aget_entity_graph([])) == {"nodes": [], "edges": []}
+
+
+def test_entity_graph_reads_index(tmp_path):
+    from rpg_rules_ai.entity_index import EntityIndex
+
+    db = tmp_path / "entities.db"
+    index = EntityIndex(db_path=db)
+    index.add_entities("Basic Set", "p1", [{"name": "Magery", "type": "advantage", "mention_type": "defines"}])
+    index.close()
+
+    with patch("rpg_rules_ai.entity_index.EntityIndex", lambda: EntityIndex(db_path=db)):
+        graph = asyncio.run(services.aget_entity_graph(["p1"]))
+
+    assert "Magery" in {n["label"] for n in graph["nodes"]}
+
+
+def test_conversation_checkpoints_shared_between_workers(tmp_path):
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    config = {"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}
+
+    async def roundtrip():
+        writer = services._conversation_checkpointer()
+        reader = services._conversation_checkpointer()
+        try:
+            checkpoint = empty_checkpoint()
+            await writer.aput(config, checkpoint, {"source": "input", "step": 0}, {})
+            found = await reader.aget_tuple(config)
+        finally:
+            await writer.conn.close()
+            await reader.conn.close()
+        return checkpoint, found
+
+    with patch.object(services.settings, "conversation_db_path", str(tmp_path / "conv.db")):
+        checkpoint, found = asyncio.run(roundtrip())
+        assert services._checkpointer_thread_count() == 1
+
+    assert found.checkpoint["id"] == checkpoint["id"]
+
+
+def test_metrics_snapshots_are_written_to_metrics_dir(tmp_path):
+    import os
+
+    with (
+        patch.object(services.settings, "metrics_dir", str(tmp_path)),
+        patch.object(services.settings, "metrics_snapshot_seconds", 0.01),
+    ):
+        services.start_metrics_snapshots()
+        try:
+            deadline = time.monotonic() + 5
+            while not (tmp_path / f"{os.getpid()}.json").exists() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert (tmp_path / f"{os.getpid()}.json").exists()
+        finally:
+            services.stop_metrics_snapshots()
+        services.stop_metrics_snapshots()  # no-op once stopped
@@ -16,6 +16,13 @@ from rpg_rules_ai.strategies.multi_hop import (
 from rpg_rules_ai.strategies.multi_question import MultiQuestionStrategy
 
 
+@pytest.fixture(autouse=True)
+def isolated_entity_index(tmp_path):
+    """Cross-book lookups and the pre-check open the entity index; keep it in tmp_path."""
+    with patch("rpg_rules_ai.entity_index.settings.entity_index_path", str(tmp_path / "entities.db")):
+        yield
+
+
 # --- Base interface tests ---
 
 
@@ -72,6 +79,13 @@ def _make_doc(content: str, book: str = "Basic Set") -> Document:
     return Document(page_content=content, metadata={"book": book})
 
 
+def _mock_retriever(docs) -> AsyncMock:
+    retriever = AsyncMock()
+    retriever.aembed_queries = AsyncMock(side_effect=lambda queries: [[0.0] for _ in queries])
+    retriever.ainvoke_with_embedding = AsyncMock(return_value=docs)
+    return retriever
+
+
 def test_doc_hash_same_content_same_book():
     d1 = _make_doc("Magery costs 5 points per level", "Basic Set")
     d2 = _make_doc("Magery costs 5 points per level", "Basic Set")
@@ -105,6 +119,16 @@ def test_deduplicate_all_duplicates():
     assert len(result) == 0
 
 
+def test_deduplicate_drops_near_duplicates_from_other_books():
+    existing = [Document(page_content="Rapid Strike", metadata={"book": "Basic Set", "hit_groups": ["g1"]})]
+    new = [
+        Document(page_content="Rapid Strike (reprint)", metadata={"book": "Martial Arts", "hit_groups": ["g1"]}),
+        Document(page_content="Feint", metadata={"book": "Martial Arts", "hit_groups": ["g1", "g2"]}),
+    ]
+    result = _deduplicate(existing, new)
+    assert [d.page_content for d in result] == ["Feint"]
+
+
 # --- MultiHopStrategy loop tests ---
 
 
@@ -127,12 +151,13 @@ async def test_multi_hop_single_hop_sufficient():
     with (
         patch("rpg_rules_ai.strategies.multi_hop.get_multi_question_prompt") as mock_prompt,
         patch("rpg_rules_ai.strategies.multi_hop.get_retriever") as mock_retriever,
-        patch("rpg_rules_ai.strategies.multi_hop.ChatOpenAI") as mock_llm_cls,
+        patch("rpg_rules_ai.strategies.multi_hop.get_chat_model") as mock_llm_cls,
     ):
         # Setup multi-question chain
         mock_chain = AsyncMock()
         mock_chain.ainvoke = AsyncMock(return_value=mock_questions)
         mock_prompt_instance = MagicMock()
+        mock_prompt_instance.format_prompt.return_value.to_string.return_value = "Expand the question"
         mock_prompt.return_value = mock_prompt_instance
         mock_llm = MagicMock()
         mock_llm.with_structured_output = MagicMock()
@@ -157,9 +182,7 @@ async def test_multi_hop_single_hop_sufficient():
         mock_prompt_instance.__or__ = MagicMock(return_value=mock_chain)
 
         # Setup retriever
-        mock_ret = AsyncMock()
-        mock_ret.ainvoke = AsyncMock(return_value=docs)
-        mock_retriever.return_value = mock_ret
+        mock_retriever.return_value = _mock_retriever(docs)
 
         state = _make_state("What is Magery?")
         result = await strategy.execute(state)
@@ -185,11 +208,12 @@ async def test_multi_hop_respects_max_hops():
     with (
         patch("rpg_rules_ai.strategies.multi_hop.get_multi_question_prompt") as mock_prompt,
         patch("rpg_rules_ai.strategies.multi_hop.get_retriever") as mock_retriever,
-        patch("rpg_rules_ai.strategies.multi_hop.ChatOpenAI") as mock_llm_cls,
+        patch("rpg_rules_ai.strategies.multi_hop.get_chat_model") as mock_llm_cls,
     ):
         mock_chain = AsyncMock()
         mock_chain.ainvoke = AsyncMock(return_value=mock_questions)
         mock_prompt_instance = MagicMock()
+        mock_prompt_instance.format_prompt.return_value.to_string.return_value = "Expand the question"
         mock_prompt.return_value = mock_prompt_instance
 
         mock_analyzer = AsyncMock()
@@ -208,12 +232,335 @@ async def test_multi_hop_respects_max_hops():
         mock_llm_cls.return_value = mock_llm
         mock_prompt_instance.__or__ = MagicMock(return_value=mock_chain)
 
-        mock_ret = AsyncMock()
-        mock_ret.ainvoke = AsyncMock(return_value=docs)
-        mock_retriever.return_value = mock_ret
+        mock_retriever.return_value = _mock_retriever(docs)
 
         state = _make_state("Complex cross-book question")
         result = await strategy.execute(state)
 
         # MAX_HOPS is 3, first hop + 2 more iterations = analyzer called 2 times
         assert mock_analyzer.ainvoke.call_count == 2
+
+
+# --- MultiHopStrategy budgets and pre-check ---
+
+
+class _MultiHopHarness:
+    """Patch the LLM, prompt and retriever used by MultiHopStrategy."""
+
+    def __init__(self, analysis, docs):
+        self.analysis = analysis
+        self.docs = docs
+        self.analyzer = AsyncMock()
+        self.analyzer.ainvoke = AsyncMock(return_value=analysis)
+
+    def __enter__(self):
+        self._patches = [
+            patch("rpg_rules_ai.strategies.multi_hop.get_multi_question_prompt"),
+            patch("rpg_rules_ai.strategies.multi_hop.get_retriever"),
+            patch("rpg_rules_ai.strategies.multi_hop.get_chat_model"),
+        ]
+        mock_prompt, mock_retriever, mock_llm_cls = [p.__enter__() for p in self._patches]
+
+        mock_chain = AsyncMock()
+        mock_chain.ainvoke = AsyncMock(
+            return_value=Questions(questions=[Question(question="Sub question")])
+        )
+        mock_prompt_instance = MagicMock()
+        mock_prompt_instance.format_prompt.return_value.to_string.return_value = "Expand the question"
+        mock_prompt_instance.__or__ = MagicMock(return_value=mock_chain)
+        mock_prompt.return_value = mock_prompt_instance
+
+        mock_llm = MagicMock()
+        mock_llm.with_structured_output = MagicMock(
+            side_effect=lambda schema: self.analyzer if schema is SufficiencyAnalysis else MagicMock()
+        )
+        mock_llm_cls.return_value = mock_llm
+
+        mock_retriever.return_value = _mock_retriever(self.docs)
+        return self
+
+    def __exit__(self, *exc):
+        for p in reversed(self._patches):
+            p.__exit__(*exc)
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_records_hop_costs():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["more"], reasoning="Missing")
+    with _MultiHopHarness(analysis, [_make_doc("Partial info", "Basic Set")]) as h:
+        result = await MultiHopStrategy().execute(_make_state("Complex cross-book question"))
+
+    hops = result["retrieval_hops"]
+    assert [r["hop"] for r in hops] == [1, 2, 3]
+    assert hops[0]["llm_calls"] == 1
+    assert hops[1]["analyzer"] == "insufficient"
+    assert hops[1]["tokens"] > 0
+    assert all("seconds" in r for r in hops)
+    assert hops[-1]["stop_reason"] == "max_hops"
+    assert h.analyzer.ainvoke.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_embeds_each_hop_in_one_request():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["Extra Attack", "Feint"], reasoning="Missing")
+    with (
+        _MultiHopHarness(analysis, [_make_doc("Partial info", "Basic Set")]),
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_entity_retrieval", False),
+    ):
+        await MultiHopStrategy().execute(_make_state("Rapid Strike?"))
+
+        from rpg_rules_ai.strategies.multi_hop import get_retriever
+
+        retriever = get_retriever()
+
+    batches = [c.args[0] for c in retriever.aembed_queries.await_args_list]
+    assert batches == [["Sub question", "Rapid Strike?"], ["Extra Attack", "Feint"], ["Extra Attack", "Feint"]]
+    assert retriever.ainvoke_with_embedding.await_count == 6
+    retriever.ainvoke.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_token_budget_skips_analyzer():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["more"], reasoning="Missing")
+    with (
+        _MultiHopHarness(analysis, [_make_doc("Some long context " * 50, "Basic Set")]) as h,
+        patch("rpg_rules_ai.strategies.multi_hop.settings.multi_hop_max_tokens", 20),
+    ):
+        result = await MultiHopStrategy().execute(_make_state("Complex question"))
+
+    h.analyzer.ainvoke.assert_not_called()
+    assert result["retrieval_hops"][-1]["stop_reason"] == "token_budget"
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_latency_budget_stops_after_first_hop():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["more"], reasoning="Missing")
+    with (
+        _MultiHopHarness(analysis, [_make_doc("Partial info", "Basic Set")]) as h,
+        patch("rpg_rules_ai.strategies.multi_hop.settings.multi_hop_max_seconds", 1e-9),
+    ):
+        result = await MultiHopStrategy().execute(_make_state("Complex question"))
+
+    h.analyzer.ainvoke.assert_not_called()
+    assert len(result["retrieval_hops"]) == 1
+    assert result["retrieval_hops"][-1]["stop_reason"] == "latency_budget"
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_latency_budget_bounds_a_slow_analyzer_call():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["more"], reasoning="Missing")
+    with (
+        _MultiHopHarness(analysis, [_make_doc("Partial info", "Basic Set")]) as h,
+        patch("rpg_rules_ai.strategies.multi_hop.settings.multi_hop_max_seconds", 0.2),
+    ):
+        async def slow(value, config=None):
+            await asyncio.sleep(5)
+            return analysis
+
+        h.analyzer.ainvoke.side_effect = slow
+        result = await asyncio.wait_for(MultiHopStrategy().execute(_make_state("Complex question")), 2)
+
+    hops = result["retrieval_hops"]
+    assert hops[-1]["analyzer"] == "timeout"
+    assert hops[-1]["stop_reason"] == "latency_budget"
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_counts_provider_reported_tokens():
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, LLMResult
+
+    analysis = SufficiencyAnalysis(sufficient=True, new_queries=[], reasoning="Ok")
+    with _MultiHopHarness(analysis, [_make_doc("Partial info", "Basic Set")]) as h:
+        async def reported(value, config=None):
+            message = AIMessage(
+                content="", usage_metadata={"input_tokens": 900, "output_tokens": 40, "total_tokens": 940}
+            )
+            for handler in config["callbacks"]:
+                handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+            return analysis
+
+        h.analyzer.ainvoke.side_effect = reported
+        result = await MultiHopStrategy().execute(_make_state("Complex question"))
+
+    assert result["retrieval_hops"][1]["tokens"] == 940
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_estimate_includes_prompt_and_schema():
+    from rpg_rules_ai.schemas import LLMQuestions
+    from rpg_rules_ai.strategies.multi_hop import _schema_tokens
+    from rpg_rules_ai.tokens import count_tokens
+
+    analysis = SufficiencyAnalysis(sufficient=True, new_queries=[], reasoning="Ok")
+    with _MultiHopHarness(analysis, [_make_doc("Partial info", "Basic Set")]):
+        result = await MultiHopStrategy().execute(_make_state("Complex question"))
+
+    assert result["retrieval_hops"][0]["tokens"] > count_tokens("Expand the question") + _schema_tokens(LLMQuestions)
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_precheck_skips_analyzer_when_covered():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["more"], reasoning="Missing")
+    docs = [_make_doc("Magery costs 5 points per level.", "Basic Set")]
+    with (
+        _MultiHopHarness(analysis, docs) as h,
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_multi_hop_precheck", True),
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_entity_retrieval", False),
+    ):
+        result = await MultiHopStrategy().execute(_make_state("What is Magery?"))
+
+    h.analyzer.ainvoke.assert_not_called()
+    assert result["retrieval_hops"][-1]["stop_reason"] == "precheck"
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_precheck_calls_analyzer_when_terms_missing():
+    analysis = SufficiencyAnalysis(sufficient=True, new_queries=[], reasoning="Ok")
+    docs = [_make_doc("Magery costs 5 points per level.", "Basic Set")]
+    with (
+        _MultiHopHarness(analysis, docs) as h,
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_multi_hop_precheck", True),
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_entity_retrieval", False),
+    ):
+        result = await MultiHopStrategy().execute(_make_state("How does Magery interact with Thaumatology?"))
+
+    h.analyzer.ainvoke.assert_called_once()
+    assert result["retrieval_hops"][-1]["stop_reason"] == "sufficient"
+
+
+def test_precheck_requires_defined_entities(tmp_path):
+    from rpg_rules_ai.entity_index import EntityIndex
+
+    db_path = tmp_path / "entities.db"
+    index = EntityIndex(db_path=db_path)
+    index.add_entities("Basic Set", "c1", [
+        {"name": "Rapid Strike", "type": "maneuver", "mention_type": "references"},
+    ])
+    index.close()
+
+    docs = [Document(page_content="Rapid Strike penalties apply.", metadata={"book": "Basic Set", "doc_id": "c1"})]
+    strategy = MultiHopStrategy()
+    with (
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_entity_retrieval", True),
+        patch("rpg_rules_ai.entity_index.settings.entity_index_path", str(db_path)),
+    ):
+        assert strategy._context_covers_question("Rapid Strike penalties?", docs) is False
+
+        index = EntityIndex(db_path=db_path)
+        index.add_entities("Basic Set", "c1", [
+            {"name": "Rapid Strike", "type": "maneuver", "mention_type": "defines"},
+        ])
+        index.close()
+        assert strategy._context_covers_question("Rapid Strike penalties?", docs) is True
+
+
+# --- Incremental analyzer context ---
+
+
+def test_incremental_context_digests_seen_docs():
+    strategy = MultiHopStrategy()
+    seen = [
+        Document(
+            page_content="Magery costs 5 points per level. " * 20,
+            metadata={"book": "Basic Set", "h2": "ADVANTAGES", "h3": "Magery"},
+        )
+    ]
+    new = [_make_doc("Thaumatology expands on Magery.", "Thaumatology")]
+
+    digest, context, included = strategy._format_incremental_context(seen, new, max_tokens=1000)
+
+    assert digest.startswith("- [Basic Set] ADVANTAGES > Magery: Magery costs 5 points")
+    assert len(digest) < len(seen[0].page_content)
+    assert "Thaumatology expands on Magery." in context
+    assert "Magery costs 5 points" not in context
+    assert included == 1
+
+
+def test_incremental_context_respects_token_cap():
+    from rpg_rules_ai.tokens import count_tokens
+
+    strategy = MultiHopStrategy()
+    seen = [_make_doc(f"Seen doc {i} " * 30, "Basic Set") for i in range(40)]
+    new = [_make_doc(f"New doc {i} " * 200, "Martial Arts") for i in range(10)]
+
+    digest, context, included = strategy._format_incremental_context(seen, new, max_tokens=500)
+
+    assert count_tokens(digest) + count_tokens(context) <= 500
+    assert context.startswith("[Martial Arts]\nNew doc 0")
+    assert included < len(new)
+    # The digest keeps the most recently analyzed documents
+    assert "Seen doc 39" in digest
+    assert "Seen doc 0 " not in digest
+
+
+def test_incremental_context_does_not_count_a_truncated_doc():
+    strategy = MultiHopStrategy()
+    new = [
+        _make_doc("Rapid Strike passage.", "Basic Set"),
+        _make_doc("Extra Attack " * 100 + "final words.", "Martial Arts"),
+    ]
+
+    _, context, included = strategy._format_incremental_context([], new, max_tokens=100)
+
+    assert "Rapid Strike passage." in context
+    assert "[Martial Arts]\nExtra Attack" in context
+    assert "final words." not in context
+    assert included == 1
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_incremental_mode_resends_truncated_doc():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["more"], reasoning="Missing")
+    first = [
+        _make_doc("Rapid Strike passage.", "Basic Set"),
+        _make_doc("Extra Attack " * 100, "Martial Arts"),
+    ]
+
+    with (
+        _MultiHopHarness(analysis, first) as h,
+        patch("rpg_rules_ai.strategies.multi_hop.settings.analyzer_context_mode", "incremental"),
+        patch("rpg_rules_ai.strategies.multi_hop.settings.analyzer_context_max_tokens", 100),
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_entity_retrieval", False),
+    ):
+        await MultiHopStrategy().execute(_make_state("Rapid Strike with Extra Attack?"))
+
+    prompts = [c.args[0] for c in h.analyzer.ainvoke.call_args_list]
+    assert len(prompts) == 2
+    digest, new_section = prompts[1].split("## Newly Retrieved Documents")
+    # Only the document sent in full is digested; the truncated one is sent again
+    assert "- [Basic Set] Rapid Strike passage." in digest
+    assert "[Martial Arts]" not in digest
+    assert new_section.strip().startswith("[Martial Arts]\nExtra Attack")
+
+
+@pytest.mark.asyncio
+async def test_multi_hop_incremental_mode_sends_only_new_docs():
+    analysis = SufficiencyAnalysis(sufficient=False, new_queries=["more"], reasoning="Missing")
+    first = [_make_doc("First hop passage about Rapid Strike.", "Basic Set")]
+    second = [_make_doc("Second hop passage about Extra Attack.", "Martial Arts")]
+
+    with (
+        _MultiHopHarness(analysis, first) as h,
+        patch("rpg_rules_ai.strategies.multi_hop.settings.analyzer_context_mode", "incremental"),
+        patch("rpg_rules_ai.strategies.multi_hop.settings.enable_entity_retrieval", False),
+    ):
+        calls = 0
+
+        async def fetch(query, embedding):
+            nonlocal calls
+            calls += 1
+            return first if calls <= 2 else second
+
+        from rpg_rules_ai.strategies.multi_hop import get_retriever
+
+        get_retriever().ainvoke_with_embedding = fetch
+        await MultiHopStrategy().execute(_make_state("Rapid Strike with Extra Attack?"))
+
+    prompts = [c.args[0] for c in h.analyzer.ainvoke.call_args_list]
+    assert len(prompts) == 2
+    assert "First hop passage about Rapid Strike." in prompts[0]
+    new_section = prompts[1].split("## Newly Retrieved Documents")[1]
+    assert "Second hop passage about Extra Attack." in new_section
+    assert "First hop passage" not in new_section
+    assert "- [Basic Set] First hop passage" in prompts[1]
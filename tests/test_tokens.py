@@ -0,0 +1,56 @@
+"""Tests for local token counting."""
+
+from unittest.mock import patch
+
+from rpg_rules_ai import tokens
+from rpg_rules_ai.tokens import count_tokens, token_length, truncate_to_tokens
+
+
+class TestFallbackEstimate:
+    def setup_method(self):
+        self._patch = patch.object(tokens, "_get_encoding", return_value=None)
+        self._patch.start()
+
+    def teardown_method(self):
+        self._patch.stop()
+
+    def test_empty(self):
+        assert count_tokens("") == 0
+
+    def test_counts_grow_with_text(self):
+        short = count_tokens("Rapid Strike")
+        long = count_tokens("Rapid Strike allows two attacks at -6 each.")
+        assert 0 < short < long
+
+    def test_truncate_keeps_prefix(self):
+        text = "one two three four five six seven eight"
+        cut = truncate_to_tokens(text, 3)
+        assert text.startswith(cut)
+        assert count_tokens(cut) <= 3
+
+    def test_truncate_noop_when_within_budget(self):
+        assert truncate_to_tokens("short text", 100) == "short text"
+
+    def test_truncate_zero_budget(self):
+        assert truncate_to_tokens("anything", 0) == ""
+
+    def test_token_length_matches_count_tokens(self):
+        short = "Rapid Strike allows two attacks at -6 each."
+        long = short * 100
+        tokens._cached_count.cache_clear()
+        assert token_length(short) == count_tokens(short)
+        assert token_length(long) == count_tokens(long)
+
+
+class _FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def test_uses_encoding_when_available():
+    with patch.object(tokens, "_get_encoding", return_value=_FakeEncoding()):
+        assert count_tokens("a b c d") == 4
+        assert truncate_to_tokens("a b c d", 2) == "a b"
@@ -0,0 +1,100 @@
+"""Tests for the request tracing span API."""
+
+import asyncio
+
+import pytest
+
+from rpg_rules_ai import tracing
+from rpg_rules_ai.metrics import STAGE_SECONDS, record_cache_hit, record_llm_usage, timed_stage
+
+
+def test_span_is_noop_without_trace():
+    with tracing.span("retrieve") as span:
+        assert span is None
+    assert tracing.current_span() is None
+    # Recording outside a trace must not fail
+    tracing.record_llm("gpt-4o", 1, 1)
+    tracing.record_cache_hit("x")
+
+
+def test_spans_nest_with_timings():
+    with tracing.collect_trace() as trace:
+        with tracing.span("node:retrieve", strategy="multi-hop"):
+            with tracing.span("retrieve") as inner:
+                inner.set(docs=3)
+
+    result = trace.to_dict()
+    outer = result["spans"][0]
+    assert outer["name"] == "node:retrieve"
+    assert outer["attributes"] == {"strategy": "multi-hop"}
+    child = outer["children"][0]
+    assert child["attributes"] == {"docs": 3}
+    assert outer["start_ms"] <= child["start_ms"] <= child["end_ms"] <= outer["end_ms"]
+
+
+def test_trace_does_not_leak_after_block():
+    with tracing.collect_trace():
+        pass
+    with tracing.span("after") as span:
+        assert span is None
+
+
+def test_error_is_recorded_and_reraised():
+    with tracing.collect_trace() as trace:
+        with pytest.raises(RuntimeError):
+            with tracing.span("generation"):
+                raise RuntimeError("boom")
+
+    span = trace.to_dict()["spans"][0]
+    assert span["attributes"]["error"] == "RuntimeError"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_tasks_attach_to_their_parent():
+    async def fetch(question):
+        with tracing.span("retrieve", question=question):
+            await asyncio.sleep(0)
+            with tracing.span("embed"):
+                await asyncio.sleep(0)
+
+    with tracing.collect_trace() as trace:
+        with tracing.span("retrieval"):
+            await asyncio.gather(fetch("a"), fetch("b"))
+
+    retrieval = trace.to_dict()["spans"][0]
+    assert [c["attributes"]["question"] for c in retrieval["children"]] == ["a", "b"]
+    assert all(len(c["children"]) == 1 for c in retrieval["children"])
+
+
+def test_llm_usage_and_cache_hits_land_on_current_span():
+    with tracing.collect_trace() as trace:
+        with tracing.span("analyzer"):
+            record_llm_usage("gpt-4o-mini", 120, 30)
+            record_llm_usage("gpt-4o-mini", 80, 10)
+        with tracing.span("node:rewrite"):
+            record_cache_hit("speculative_retrieval")
+
+    result = trace.to_dict()
+    analyzer, rewrite = result["spans"]
+    assert analyzer["attributes"] == {
+        "model": "gpt-4o-mini",
+        "llm_calls": 2,
+        "prompt_tokens": 200,
+        "completion_tokens": 40,
+    }
+    assert rewrite["attributes"]["cache_hits"] == ["speculative_retrieval"]
+    assert result["llm_calls"] == 2
+    assert result["prompt_tokens"] == 200
+    assert result["cache_hits"] == {"speculative_retrieval": 1}
+
+
+def test_timed_stage_feeds_histogram_and_trace():
+    before = STAGE_SECONDS.count(stage="grounding")
+    with tracing.collect_trace() as trace:
+        with timed_stage("grounding", citation_retry=True):
+            pass
+    with timed_stage("grounding") as span:
+        assert span is None
+
+    assert STAGE_SECONDS.count(stage="grounding") == before + 2
+    assert trace.to_dict()["spans"][0]["attributes"] == {"citation_retry": True}
@@ -1,54 +1,57 @@
 """Tests for POST /documents/upload multipart endpoint."""
 
-from io import BytesIO
-from unittest.mock import MagicMock, patch
+import hashlib
+from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
 
 from rpg_rules_ai.api import MAX_UPLOAD_SIZE, app
+from rpg_rules_ai.generations import GenerationRegistry
 
 client = TestClient(app)
 
 
 @pytest.fixture(autouse=True)
-def mock_deps():
+def mock_deps(tmp_path):
+    sources = tmp_path / "sources"
+    registry = GenerationRegistry(tmp_path / "generations.db")
     with (
         patch("rpg_rules_ai.services.create_ingestion_job") as mock_create_job,
-        patch("rpg_rules_ai.api.settings") as mock_settings,
+        patch("rpg_rules_ai.services.settings") as mock_settings,
+        patch("rpg_rules_ai.services.get_registry", return_value=registry),
     ):
-        mock_settings.sources_dir = "/tmp/test_sources"
+        mock_settings.sources_dir = str(sources)
+        mock_settings.blocking_io_workers = 2
         mock_create_job.return_value = "fake-job-id"
-        yield {"create_job": mock_create_job}
+        yield {"create_job": mock_create_job, "sources": sources, "registry": registry}
+    registry.close()
 
 
-class TestUploadEndpoint:
-    def test_upload_single_file(self, mock_deps, tmp_path):
-        with patch("rpg_rules_ai.api.Path") as mock_path_cls:
-            mock_dest = MagicMock()
-            mock_path_cls.return_value.__truediv__ = MagicMock(return_value=mock_dest)
+def _index(registry, book: str, content: bytes) -> None:
+    registry.activate(book, registry.stage(book, source_hash=hashlib.sha256(content).hexdigest()))
 
-            resp = client.post(
-                "/api/documents/upload",
-                files=[("files", ("test.md", b"# Test content", "text/markdown"))],
-            )
+
+class TestUploadEndpoint:
+    def test_upload_single_file(self, mock_deps):
+        resp = client.post(
+            "/api/documents/upload",
+            files=[("files", ("test.md", b"# Test content", "text/markdown"))],
+        )
 
         assert resp.status_code == 202
-        assert resp.json()["job_id"] == "fake-job-id"
+        assert resp.json() == {"job_id": "fake-job-id", "skipped": []}
+        assert (mock_deps["sources"] / "test.md").read_bytes() == b"# Test content"
 
     def test_upload_multiple_files(self, mock_deps):
-        with patch("rpg_rules_ai.api.Path") as mock_path_cls:
-            mock_dest = MagicMock()
-            mock_path_cls.return_value.__truediv__ = MagicMock(return_value=mock_dest)
-
-            resp = client.post(
-                "/api/documents/upload",
-                files=[
-                    ("files", ("a.md", b"# A", "text/markdown")),
-                    ("files", ("b.md", b"# B", "text/markdown")),
-                    ("files", ("c.md", b"# C", "text/markdown")),
-                ],
-            )
+        resp = client.post(
+            "/api/documents/upload",
+            files=[
+                ("files", ("a.md", b"# A", "text/markdown")),
+                ("files", ("b.md", b"# B", "text/markdown")),
+                ("files", ("c.md", b"# C", "text/markdown")),
+            ],
+        )
 
         assert resp.status_code == 202
         mock_deps["create_job"].assert_called_once()
@@ -63,6 +66,30 @@ class TestUploadEndpoint:
         assert resp.status_code == 400
         assert ".md" in resp.json()["detail"]
 
+    def test_upload_accepts_pdf(self, mock_deps):
+        resp = client.post(
+            "/api/documents/upload",
+            files=[("files", ("Basic Set.pdf", b"%PDF-1.7 fake", "application/pdf"))],
+        )
+
+        assert resp.status_code == 202
+        assert [p.name for p in mock_deps["create_job"].call_args[0][0]] == ["Basic Set.pdf"]
+
+    def test_upload_rejects_extraction_cache_name(self, mock_deps):
+        resp = client.post(
+            "/api/documents/upload",
+            files=[("files", ("Basic Set.pdf.extracted.md", b"# Cached", "text/markdown"))],
+        )
+        assert resp.status_code == 400
+
+    def test_pdf_has_its_own_size_limit(self, mock_deps):
+        content = b"%PDF" + b"x" * MAX_UPLOAD_SIZE
+        resp = client.post(
+            "/api/documents/upload",
+            files=[("files", ("big.pdf", content, "application/pdf"))],
+        )
+        assert resp.status_code == 202
+
     def test_upload_rejects_oversized_file(self, mock_deps):
         big_content = b"x" * (MAX_UPLOAD_SIZE + 1)
         resp = client.post(
@@ -70,17 +97,132 @@ class TestUploadEndpoint:
             files=[("files", ("huge.md", big_content, "text/markdown"))],
         )
         assert resp.status_code == 413
+        assert list(mock_deps["sources"].iterdir()) == []
+        mock_deps["create_job"].assert_not_called()
 
     def test_upload_with_replace_flag(self, mock_deps):
-        with patch("rpg_rules_ai.api.Path") as mock_path_cls:
-            mock_dest = MagicMock()
-            mock_path_cls.return_value.__truediv__ = MagicMock(return_value=mock_dest)
-
-            resp = client.post(
-                "/api/documents/upload?replace=true",
-                files=[("files", ("test.md", b"# Test", "text/markdown"))],
-            )
+        resp = client.post(
+            "/api/documents/upload?replace=true",
+            files=[("files", ("test.md", b"# Test", "text/markdown"))],
+        )
 
         assert resp.status_code == 202
         mock_deps["create_job"].assert_called_once()
         assert mock_deps["create_job"].call_args[1]["replace"] is True
+
+    def test_upload_skips_content_already_indexed(self, mock_deps):
+        _index(mock_deps["registry"], "Basic Set.md", b"# Basic Set")
+
+        resp = client.post(
+            "/api/documents/upload",
+            files=[
+                ("files", ("copy.md", b"# Basic Set", "text/markdown")),
+                ("files", ("new.md", b"# New", "text/markdown")),
+            ],
+        )
+
+        assert resp.json()["skipped"] == [{"filename": "copy.md", "duplicate_of": "Basic Set.md"}]
+        assert [p.name for p in mock_deps["create_job"].call_args[0][0]] == ["new.md"]
+        assert not (mock_deps["sources"] / "copy.md").exists()
+
+    def test_upload_skips_duplicates_within_batch(self, mock_deps):
+        resp = client.post(
+            "/api/documents/upload",
+            files=[
+                ("files", ("a.md", b"# Same", "text/markdown")),
+                ("files", ("b.md", b"# Same", "text/markdown")),
+            ],
+        )
+
+        assert resp.json()["skipped"] == [{"filename": "b.md", "duplicate_of": "a.md"}]
+
+    def test_upload_all_duplicates_starts_no_job(self, mock_deps):
+        _index(mock_deps["registry"], "dup.md", b"# Dup")
+
+        resp = client.post(
+            "/api/documents/upload",
+            files=[("files", ("dup.md", b"# Dup", "text/markdown"))],
+        )
+
+        assert resp.json() == {"job_id": None, "skipped": [{"filename": "dup.md", "duplicate_of": "dup.md"}]}
+        mock_deps["create_job"].assert_not_called()
+
+    def test_replace_reingests_identical_book(self, mock_deps):
+        _index(mock_deps["registry"], "dup.md", b"# Dup")
+
+        resp = client.post(
+            "/api/documents/upload?replace=true",
+            files=[("files", ("dup.md", b"# Dup", "text/markdown"))],
+        )
+
+        assert resp.json() == {"job_id": "fake-job-id", "skipped": []}
+
+
+class TestStreamUpload:
+    async def _save(self, upload, **kwargs):
+        from rpg_rules_ai import services
+        return await services.save_uploads([upload], **kwargs)
+
+    def test_reads_in_chunks_and_hashes(self, mock_deps):
+        import asyncio
+        from io import BytesIO
+
+        from starlette.datastructures import UploadFile
+
+        content = b"x" * (3 * 1024 * 1024 + 10)
+        upload = UploadFile(BytesIO(content), filename="big.md")
+        reads = []
+        original = upload.read
+
+        async def read(size=-1):
+            reads.append(size)
+            return await original(size)
+
+        upload.read = read
+        saved, _ = asyncio.run(self._save(upload, max_size=len(content)))
+
+        assert saved[0].read_bytes() == content
+        assert set(reads) == {1024 * 1024}
+        assert len(reads) == 5  # four data chunks and the final empty read
+
+    def test_stops_reading_past_limit(self, mock_deps):
+        import asyncio
+        from io import BytesIO
+
+        from starlette.datastructures import UploadFile
+
+        from rpg_rules_ai.services import UploadTooLarge
+
+        upload = UploadFile(BytesIO(b"x" * (5 * 1024 * 1024)), filename="big.md")
+        with pytest.raises(UploadTooLarge):
+            asyncio.run(self._save(upload, max_size=2 * 1024 * 1024))
+        assert upload.file.tell() == 3 * 1024 * 1024
+        assert list(mock_deps["sources"].iterdir()) == []
+
+    def test_writes_and_lookup_run_off_the_event_loop(self, mock_deps):
+        import asyncio
+        import threading
+        from io import BytesIO
+
+        from starlette.datastructures import UploadFile
+
+        from rpg_rules_ai import services
+
+        loop_thread = threading.get_ident()
+        calls: dict[str, int] = {}
+        write_chunk, book_with_source = services._write_chunk, mock_deps["registry"].book_with_source
+
+        def recording(name, func):
+            def wrapper(*args, **kwargs):
+                calls[name] = threading.get_ident()
+                return func(*args, **kwargs)
+            return wrapper
+
+        with (
+            patch.object(services, "_write_chunk", recording("write", write_chunk)),
+            patch.object(mock_deps["registry"], "book_with_source", recording("lookup", book_with_source)),
+        ):
+            asyncio.run(self._save(UploadFile(BytesIO(b"# Rules"), filename="rules.md")))
+
+        assert set(calls) == {"write", "lookup"}
+        assert loop_thread not in calls.values()